@@ -1,7 +1,8 @@
 # app/__init__.py
 
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
+from .config import settings
 
 
 def create_app():
@@ -10,30 +11,83 @@ def create_app():
     """
     app = Flask(__name__)
 
+    # 限制请求体大小，超限的上传在读取前就会被拒绝
+    app.config['MAX_CONTENT_LENGTH'] = settings.MAX_CONTENT_LENGTH
+
+    if settings.PROXY_FIX_HOPS > 0:
+        # 部署在反向代理之后，remote_addr 取自 X-Forwarded-For（登录限流按真实客户端IP计数）
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=settings.PROXY_FIX_HOPS, x_proto=settings.PROXY_FIX_HOPS)
+
     # 允许所有来源的跨域请求
     CORS(app)
 
+    # 请求耗时等指标，汇总后由 /metrics 输出
+    from . import http_cache, metrics, profiling
+    metrics.init_app(app)
+    # 较大的 JSON 响应按需压缩
+    http_cache.init_app(app)
+    # 按需性能分析与最慢请求记录（均需在配置中开启）
+    profiling.init_app(app)
+
+    from .views.weather_routes import weather_bp
+    from .views.monitor_routes import metrics_bp
+    if settings.SERVICE_ROLE == 'io':
+        # I/O 密集的独立服务（gevent worker）：只提供天气与地图瓦片接口，不访问数据库、不做热力图计算
+        app.register_blueprint(weather_bp)
+        app.register_blueprint(metrics_bp)
+        _register_common(app)
+        return app
+
     # 初始化数据库
-    from .database import init_db
+    from .database import init_db, init_app
     init_db()
+    init_app(app)
+
+    # 建立城市与图层索引（只列目录；简化图层在预热或首次使用时生成）
+    from .services import geodata_service
+    geodata_service.scan()
+
+    if settings.HEATMAP_PRELOAD:
+        from .services import heatmap_service
+        heatmap_service.warm_up()
+
+    if settings.RETENTION_ENABLED:
+        # 在 worker 处理第一个请求时启动归档线程（preload 模式下主进程不会启动）
+        from .services.retention_service import start_retention_worker
+        app.before_request(start_retention_worker)
 
     # 在函数内部导入并注册蓝图
     from .views.map_routes import map_bp
     from .views.heatmap_routes import heatmap_bp
-    from .views.weather_routes import weather_bp
     from .views.feedback_routes import feedback_bp
     from .views.message_routes import message_bp
     from .views.admin_auth import admin_bp
+    from .views.monitor_routes import monitor_bp
     app.register_blueprint(map_bp)
     app.register_blueprint(heatmap_bp)
     app.register_blueprint(weather_bp)
     app.register_blueprint(feedback_bp)
     app.register_blueprint(message_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(monitor_bp)
+    app.register_blueprint(metrics_bp)
+    _register_common(app)
+    return app
+
+
+def _register_common(app):
+    """各服务角色共用的错误处理与健康检查"""
+
+    @app.errorhandler(413)
+    def request_entity_too_large(e):
+        return jsonify({
+            'success': False,
+            'status': 'error',
+            'message': f'上传内容超过大小限制 ({settings.MAX_CONTENT_LENGTH // (1024 * 1024)}MB)'
+        }), 413
 
     # 提供一个根路由用于健康检查
     @app.route("/")
     def index():
         return "后端服务健康运行中！"
-
-    return app
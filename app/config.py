@@ -9,5 +9,135 @@ load_dotenv(dotenv_path=dotenv_path)
 
 class Settings:
     API_KEY: str = os.getenv("OPENWEATHER_API_KEY")
+    # 调用 OpenWeatherMap 的超时秒数（连接与读取）及连接池大小
+    WEATHER_HTTP_TIMEOUT: float = float(os.getenv("WEATHER_HTTP_TIMEOUT", "10"))
+    WEATHER_HTTP_POOL_SIZE: int = int(os.getenv("WEATHER_HTTP_POOL_SIZE", "100"))
 
-settings = Settings()
\ No newline at end of file
+    # 服务角色: all 注册全部接口；io 只注册天气/地图瓦片等 I/O 密集接口，
+    # 配合 gevent worker 单独部署（见 gunicorn.conf.py 与 README 中的部署说明）
+    SERVICE_ROLE: str = os.getenv("SERVICE_ROLE", "all").lower()
+    # worker 常驻内存上限（MB），超过后处理完当前请求即退出，由 gunicorn 重新拉起（0 表示不限制，见 gunicorn.conf.py）
+    WORKER_MAX_RSS_MB: int = int(os.getenv("WORKER_MAX_RSS_MB", "0"))
+
+    # --- 响应压缩 ---
+    # 大于此字节数的 JSON 响应在客户端支持时压缩（gzip，安装 brotli 后优先 br）
+    HTTP_COMPRESS_MIN_BYTES: int = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+    HTTP_COMPRESS_LEVEL: int = int(os.getenv("HTTP_COMPRESS_LEVEL", "6"))
+
+    # --- 上传限制 ---
+    # 单个上传文件的最大字节数
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+    # 整个请求体的最大字节数（为表单字段和 multipart 边界预留 1MB）
+    MAX_CONTENT_LENGTH: int = MAX_UPLOAD_BYTES + 1024 * 1024
+    # 上传文件超过此大小后从内存转存到临时文件
+    UPLOAD_SPOOL_THRESHOLD: int = int(os.getenv("UPLOAD_SPOOL_THRESHOLD_KB", "512")) * 1024
+    # 表格最多允许的数据行数
+    MAX_UPLOAD_ROWS: int = int(os.getenv("MAX_UPLOAD_ROWS", "100000"))
+    # CSV 分块解析时每批读取的行数
+    CSV_CHUNK_ROWS: int = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+
+    # --- 热力图 ---
+    # 渲染动画帧与批量热力图的进程数（<=1 时在当前进程内串行渲染）
+    HEATMAP_RENDER_WORKERS: int = int(os.getenv("HEATMAP_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # 启动时预先导入热力图依赖并读取边界（配合 gunicorn --preload，worker 通过写时复制共享）
+    HEATMAP_PRELOAD: bool = os.getenv("HEATMAP_PRELOAD", "false").lower() == "true"
+    # 单次动画最多渲染的帧数
+    HEATMAP_MAX_FRAMES: int = int(os.getenv("HEATMAP_MAX_FRAMES", "240"))
+    # 单次批量请求最多生成的热力图数量
+    HEATMAP_BATCH_MAX_SPECS: int = int(os.getenv("HEATMAP_BATCH_MAX_SPECS", "24"))
+    # 每个进程缓存的图形模板数（坐标轴、图层与色标条预先搭好，按城市/分辨率/显示范围/图层区分），0 表示不复用
+    HEATMAP_FIGURE_TEMPLATES: int = int(os.getenv("HEATMAP_FIGURE_TEMPLATES", "4"))
+    # 渲染进程池累计执行多少个任务后整体换新，归还子进程占用的内存（0 表示不换）
+    HEATMAP_RENDER_MAX_TASKS: int = int(os.getenv("HEATMAP_RENDER_MAX_TASKS", "500"))
+    # 渲染子进程每个任务后检查常驻内存（MB），超过后下次提交前整体换新（0 表示不检查）
+    HEATMAP_RENDER_MAX_RSS_MB: int = int(os.getenv("HEATMAP_RENDER_MAX_RSS_MB", "768"))
+    # 渲染子进程中缓存的图形模板数（子进程有多个，默认比 worker 少）
+    HEATMAP_RENDER_FIGURE_TEMPLATES: int = int(os.getenv("HEATMAP_RENDER_FIGURE_TEMPLATES", "1"))
+    # 地图图层的简化级别（Douglas-Peucker 容差，单位：度），渲染时按输出分辨率选择
+    GEODATA_SIMPLIFY_TOLERANCES: tuple = tuple(
+        float(t) for t in os.getenv("GEODATA_SIMPLIFY_TOLERANCES", "0.0001,0.0005,0.002").split(",") if t.strip())
+    # 简化后图层（FlatGeobuf）的缓存目录
+    GEODATA_CACHE_DIR: str = os.getenv(
+        "GEODATA_CACHE_DIR", os.path.join(os.path.dirname(__file__), '..', 'geocache'))
+
+    # --- 反馈统计 ---
+    # 统计接口读取增量维护的评分汇总表（关闭时每次执行一次 GROUP BY 聚合）
+    FEEDBACK_STATS_USE_SUMMARY: bool = os.getenv("FEEDBACK_STATS_USE_SUMMARY", "true").lower() == "true"
+
+    # --- 缓冲写入 ---
+    # 开启后反馈/留言提交先写入本地 spool 文件，由后台线程批量入库
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+    # 最长刷新间隔（秒）
+    WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+    WRITE_BEHIND_SPOOL_DIR: str = os.getenv(
+        "WRITE_BEHIND_SPOOL_DIR", os.path.join(os.path.dirname(__file__), '..', 'spool'))
+    # 每条提交都 fsync（可抵御断电，但每次提交都有一次磁盘同步）
+    WRITE_BEHIND_FSYNC: bool = os.getenv("WRITE_BEHIND_FSYNC", "false").lower() == "true"
+
+    # --- 留言看板计数 ---
+    # 计数缓存有效期（秒），多个 worker 之间的差异最多持续这么久
+    MESSAGE_STATS_TTL: float = float(os.getenv("MESSAGE_STATS_TTL", "10"))
+    # SSE 连接的最长保持时间（秒），到期后浏览器自动重连
+    MESSAGE_STATS_STREAM_SECONDS: int = int(os.getenv("MESSAGE_STATS_STREAM_SECONDS", "60"))
+    # 当前 gunicorn worker 类型（由 gunicorn.conf.py 导出；直接运行 run.py 时为空，开发服务器每个请求一个线程）
+    GUNICORN_WORKER_CLASS: str = os.getenv("GUNICORN_WORKER_CLASS", "")
+    # sync worker 挂起长连接会独占整个 worker，超过 gunicorn timeout 还会被主进程杀掉：
+    # 此时 SSE 推送一次后即断开、由浏览器按 MESSAGE_STATS_TTL 重连，长轮询立即返回
+    MESSAGE_STATS_LONG_POLL: bool = GUNICORN_WORKER_CLASS != "sync"
+
+    # --- 历史数据归档 ---
+    # 开启后每个进程启动一个后台线程，定期把超过保留天数且已处理的记录迁入归档表；
+    # 每轮先抢一把跨进程锁（PostgreSQL 咨询锁，其他数据库用 RETENTION_LOCK_FILE 文件锁），同一时间只有一个进程执行
+    RETENTION_ENABLED: bool = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+    FEEDBACK_RETENTION_DAYS: int = int(os.getenv("FEEDBACK_RETENTION_DAYS", "180"))
+    MESSAGE_RETENTION_DAYS: int = int(os.getenv("MESSAGE_RETENTION_DAYS", "180"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+    # 批次之间的间隔（秒）
+    RETENTION_BATCH_PAUSE: float = float(os.getenv("RETENTION_BATCH_PAUSE", "0.1"))
+    RETENTION_INTERVAL_HOURS: float = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+    # 进程启动后延迟多久执行第一轮（秒）
+    RETENTION_START_DELAY: int = int(os.getenv("RETENTION_START_DELAY", "300"))
+    # 归档后是否对 SQLite 执行 VACUUM（会重写整个数据库文件）
+    RETENTION_VACUUM: bool = os.getenv("RETENTION_VACUUM", "true").lower() == "true"
+    RETENTION_LOCK_FILE: str = os.getenv(
+        "RETENTION_LOCK_FILE", os.path.join(os.path.dirname(__file__), '..', '.retention.lock'))
+
+    # --- 管理员认证 ---
+    # 为 false 时管理接口不校验令牌（仅用于本地调试）
+    ADMIN_AUTH_REQUIRED: bool = os.getenv("ADMIN_AUTH_REQUIRED", "true").lower() == "true"
+    # 令牌签名密钥，多个实例部署时应显式配置；未配置时使用 ADMIN_TOKEN_SECRET_FILE 中随机生成的密钥
+    ADMIN_TOKEN_SECRET: str = os.getenv("ADMIN_TOKEN_SECRET", "")
+    ADMIN_TOKEN_SECRET_FILE: str = os.getenv(
+        "ADMIN_TOKEN_SECRET_FILE", os.path.join(os.path.dirname(__file__), '..', '.admin_token_secret'))
+    ADMIN_TOKEN_TTL: int = int(os.getenv("ADMIN_TOKEN_TTL", str(12 * 3600)))
+    ADMIN_PBKDF2_ITERATIONS: int = int(os.getenv("ADMIN_PBKDF2_ITERATIONS", "260000"))
+    # 账户文件最多每隔多少秒检查一次修改时间
+    ADMIN_ACCOUNT_CHECK_INTERVAL: float = float(os.getenv("ADMIN_ACCOUNT_CHECK_INTERVAL", "5"))
+    # 同一IP在窗口期（秒）内最多允许的登录失败次数
+    ADMIN_LOGIN_MAX_ATTEMPTS: int = int(os.getenv("ADMIN_LOGIN_MAX_ATTEMPTS", "5"))
+    ADMIN_LOGIN_WINDOW: int = int(os.getenv("ADMIN_LOGIN_WINDOW", "300"))
+    # 应用前面的反向代理层数（Render 为 1），据此从 X-Forwarded-For 取真实客户端IP；直接对外暴露时设为 0
+    PROXY_FIX_HOPS: int = int(os.getenv("PROXY_FIX_HOPS", "1"))
+
+    # --- 指标 ---
+    # 各 worker 把指标快照写到此目录，/metrics 汇总其中所有文件（同一台机器上的 worker 须共用）
+    METRICS_DIR: str = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(__file__), '..', 'metrics'))
+    # 快照写入间隔（秒），/metrics 被抓取时当前 worker 会立即写入一次
+    METRICS_WRITE_INTERVAL: float = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+    # /metrics 默认需要 Authorization: Bearer <METRICS_TOKEN>（或管理员令牌）；
+    # 只在内网可达时才把 METRICS_PUBLIC 设为 true 允许匿名抓取
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    METRICS_PUBLIC: bool = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+
+    # --- 性能分析 ---
+    # 开启后，带 X-Profile 头并附管理员令牌的请求会被单独分析（关闭时不注册任何钩子）
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), '..', 'profiles'))
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    # 最多保留多少个分析结果文件
+    PROFILE_KEEP: int = int(os.getenv("PROFILE_KEEP", "50"))
+    # 每个 worker 记录耗时最长的 N 个请求及其阶段耗时，0 表示不记录
+    SLOW_REQUEST_CAPTURE: int = int(os.getenv("SLOW_REQUEST_CAPTURE", "0"))
+
+settings = Settings()
@@ -1,7 +1,12 @@
 import os
+import threading
+import time
+from flask import g
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool, QueuePool
+from . import metrics
 
 # 数据库配置
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///feedback.db')
@@ -10,22 +15,65 @@ DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///feedback.db')
 if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
+class PoolStats:
+    """连接池计数：获取连接的次数、等待时间与超时次数（进程内累计）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        # 同时计入 /metrics 的计数器，worker 退出后累计值并入 _exited.json，不会倒退
+        metrics.inc('db_pool_timeouts_total' if timed_out else 'db_pool_checkouts_total')
+        metrics.inc('db_pool_wait_seconds_total', seconds)
+
+
+pool_stats = PoolStats()
+
+
+def _instrumented(pool_class):
+    """为连接池类加上等待时间统计（从请求连接到拿到连接的耗时）"""
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except PoolTimeoutError:
+                pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            pool_stats.record_wait(time.perf_counter() - start)
+            return conn
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
 # 创建数据库引擎
 if DATABASE_URL.startswith('sqlite'):
     # 本地开发使用SQLite
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool
+        poolclass=_instrumented(StaticPool)
     )
 else:
     # 生产环境使用PostgreSQL，优化连接池配置
     engine = create_engine(
         DATABASE_URL,
-        poolclass=QueuePool,
-        pool_size=10,           # 连接池大小
-        max_overflow=20,        # 最大溢出连接数
-        pool_timeout=30,        # 连接超时时间
+        poolclass=_instrumented(QueuePool),
+        pool_size=int(os.getenv('DB_POOL_SIZE', '10')),         # 连接池大小
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '20')),   # 最大溢出连接数
+        pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),   # 连接超时时间
         pool_recycle=3600,      # 连接回收时间（1小时）
         pool_pre_ping=True      # 连接前ping检查
     )
@@ -41,7 +89,79 @@ def get_db():
     finally:
         db.close()
 
+# 请求级会话：同一请求内复用一个会话，请求结束时统一关闭
+def get_session():
+    if 'db_session' not in g:
+        g.db_session = SessionLocal()
+    return g.db_session
+
+def _teardown_session(exc):
+    db = g.pop('db_session', None)
+    if db is None:
+        return
+    try:
+        # 出错时回滚未提交的修改，连接干净地归还连接池
+        if exc is not None:
+            db.rollback()
+    finally:
+        db.close()
+
+def init_app(app):
+    """在应用上注册请求结束时关闭会话的钩子"""
+    app.teardown_appcontext(_teardown_session)
+
+def get_pool_status():
+    """连接池当前状态与累计等待统计，供监控使用"""
+    pool = engine.pool
+    status = {
+        'pool_class': type(pool).__name__,
+        'checkouts': pool_stats.checkouts,
+        'timeouts': pool_stats.timeouts,
+        'wait_seconds_total': round(pool_stats.wait_seconds_total, 6),
+        'wait_seconds_max': round(pool_stats.wait_seconds_max, 6),
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+        })
+    return status
+
+def make_psycopg2_green():
+    """
+    在 gevent worker 中调用：psycopg2 是阻塞的 C 扩展，设置等待回调后，
+    查询等待 PostgreSQL 响应时让出协程，不会卡住同一 worker 中的其他请求。
+    """
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return
+    from gevent.socket import wait_read, wait_write
+
+    def gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"psycopg2 poll() 返回未知状态: {state!r}")
+
+    extensions.set_wait_callback(gevent_wait_callback)
+
 # 初始化数据库
 def init_db():
-    from .models import Base
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    from .migrations import migration_lock, run_migrations
+    from .services.message_search_service import setup_message_search
+    # 按版本执行尚未执行的迁移（建表、索引、汇总表初始化等）
+    run_migrations(engine)
+
+    # 留言全文索引（SQLite FTS5 / PostgreSQL tsvector）；同样会改表，与迁移共用一把锁
+    with migration_lock(engine):
+        setup_message_search(engine) 
\ No newline at end of file
@@ -0,0 +1,153 @@
+# 文件路径: app/http_cache.py
+
+"""
+只读接口的 HTTP 缓存：ETag / Last-Modified 条件请求、与服务层缓存 TTL 对齐的 Cache-Control，以及响应压缩。
+
+- EncodedResponseCache 按键保存"数据对象 -> 编码好的 JSON、ETag、压缩结果"。服务层缓存命中时返回的是同一个对象，
+  据此判断数据版本未变，直接复用编码结果；数据刷新（对象变化）后才重新编码、生成新的 ETag。
+  Last-Modified 与 max-age 按数据写入服务层缓存的时间计算，而不是首次编码的时间。
+- ETag 为弱校验值：同一数据的原文、gzip、br 三种编码共用一个 ETag，按字节比较时并不相同。
+- cached_json_response 处理 If-None-Match / If-Modified-Since（返回 304），按 Accept-Encoding 选择 br/gzip。
+- init_app 注册的 after_request 对其他较大的 JSON 响应同样按需压缩。
+"""
+
+import gzip
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from cachetools import LRUCache
+from flask import Response, request
+
+from app.config import settings
+from app.serialization import dumps
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，未安装时只使用 gzip
+    brotli = None
+
+
+class _Entry:
+    __slots__ = ('source', 'body', 'tag', 'created_at', 'expires_at', '_encoded')
+
+    def __init__(self, source, body, ttl, stored_at=None):
+        self.source = source
+        self.body = body
+        self.tag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.created_at = stored_at or time.time()
+        self.expires_at = self.created_at + ttl
+        self._encoded = {}
+
+    @property
+    def etag(self):
+        return f'W/"{self.tag}"'
+
+    def max_age(self):
+        return max(0, int(self.expires_at - time.time()))
+
+    def encoded(self, encoding):
+        """压缩结果只计算一次"""
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = _compress(self.body, encoding)
+        return body
+
+
+class EncodedResponseCache:
+    def __init__(self, maxsize=1024):
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key, source, ttl, build=None, stored_at=None):
+        """
+        返回 key 对应的编码结果；source 与上次不是同一个对象时重新编码。
+        build(source) 可把数据对象转换为响应内容，默认直接编码 source。
+        stored_at 为数据写入服务层缓存的时间戳（ttl 从这时算起），未给出时取当前时间。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry.source is source:
+            return entry
+        entry = _Entry(source, dumps(build(source) if build else source), ttl, stored_at)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+
+response_cache = EncodedResponseCache()
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=settings.HTTP_COMPRESS_LEVEL, mtime=0)
+
+
+def _accepted_encoding(size):
+    """按 Accept-Encoding 选择压缩方式；内容较小时不压缩"""
+    if size < settings.HTTP_COMPRESS_MIN_BYTES:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _not_modified(entry):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(entry.tag)
+    since = request.headers.get('If-Modified-Since')
+    if since:
+        try:
+            return int(entry.created_at) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_json_response(entry, public=True, max_age=None):
+    """
+    用 EncodedResponseCache 的结果构造响应。max_age 默认取数据在服务层缓存中的剩余时间；
+    private 数据（如按会话区分的地图点位）传 public=False, max_age=0，浏览器每次用 ETag 重新验证。
+    """
+    max_age = entry.max_age() if max_age is None else max_age
+    headers = {
+        'ETag': entry.etag,
+        'Last-Modified': format_datetime(datetime.fromtimestamp(int(entry.created_at), timezone.utc), usegmt=True),
+        'Cache-Control': f"{'public' if public else 'private'}, max-age={max_age}"
+                         + ('' if max_age else ', no-cache'),
+        'Vary': 'Accept-Encoding',
+    }
+    if _not_modified(entry):
+        return Response(status=304, headers=headers)
+
+    encoding = _accepted_encoding(len(entry.body))
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        return Response(entry.encoded(encoding), mimetype='application/json', headers=headers)
+    return Response(entry.body, mimetype='application/json', headers=headers)
+
+
+def _compress_response(response):
+    """其他较大的 JSON 响应按需压缩（流式响应和已压缩的响应不处理）"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'):
+        return response
+    body = response.get_data()
+    encoding = _accepted_encoding(len(body))
+    if encoding is None:
+        return response
+    response.set_data(_compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    app.after_request(_compress_response)
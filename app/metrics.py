@@ -0,0 +1,388 @@
+# 文件路径: app/metrics.py
+
+"""
+进程内指标（计数器、直方图、采集时计算的仪表值）及 Prometheus 文本格式输出。
+
+多个 gunicorn worker 之间的汇总：每个进程定期把自己的快照写到 METRICS_DIR/<pid>.json，
+/metrics 读取全部快照后相加；已退出进程的计数器与直方图并入 _exited.json（仪表值直接丢弃），
+因此 worker 重启后累计值不会倒退。
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from cachetools import TTLCache
+from flask import g, request
+
+from app.config import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    'http_request_duration_seconds': ('histogram', '按路由统计的请求耗时'),
+    'heatmap_stage_seconds': ('histogram', '热力图各阶段耗时'),
+    'upstream_request_duration_seconds': ('histogram', '调用 OpenWeatherMap 等上游接口的耗时'),
+    'cache_events_total': ('counter', '缓存命中/未命中/淘汰次数'),
+    'db_pool_connections': ('gauge', '数据库连接池当前连接数'),
+    'db_pool_checkouts_total': ('counter', '从连接池获取连接的次数'),
+    'db_pool_timeouts_total': ('counter', '获取连接超时次数'),
+    'db_pool_wait_seconds_total': ('counter', '获取连接的累计等待时间'),
+    'process_resident_memory_bytes': ('gauge', '各 worker 进程的常驻内存'),
+    'worker_recycles_total': ('counter', 'worker 因常驻内存超过 WORKER_MAX_RSS_MB 而重启的次数'),
+    'render_pool_restarts_total': ('counter', '渲染进程池因子进程异常退出（broken）或常驻内存超限（rss）而换新的次数'),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    """进程内指标存储，所有更新都在一把锁内完成（只做几次加法）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [各桶计数..., +Inf 计数, sum]
+        self._gauge_callbacks = []
+        self._extras = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(DEFAULT_BUCKETS)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed, **labels)
+            if stage_observer is not None and 'stage' in labels:
+                stage_observer(labels['stage'], elapsed)
+
+    def register_gauges(self, callback):
+        """callback() 返回 [(name, labels_dict, value)]，在生成快照时调用"""
+        self._gauge_callbacks.append(callback)
+
+    def register_extra(self, name, callback):
+        """随快照一起写出的附加数据（不参与汇总），callback() 返回可 JSON 序列化的列表"""
+        self._extras[name] = callback
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()]
+        gauges = []
+        for callback in self._gauge_callbacks:
+            try:
+                gauges.extend([name, list(_labels_key(labels)), value] for name, labels, value in callback())
+            except Exception as e:
+                print(f"采集指标失败: {e}")
+        extra = {name: callback() for name, callback in self._extras.items()}
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges, 'extra': extra}
+
+
+# 最慢请求记录开启时由 app.profiling 设置为 callable(stage, seconds)，把阶段耗时累加到当前请求
+stage_observer = None
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+
+
+class InstrumentedTTLCache(TTLCache):
+    """记录命中/未命中/淘汰次数的 TTLCache（命中按 `key in cache` 判断，与现有用法一致）"""
+
+    def __init__(self, name, maxsize, ttl):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.metric_name = name
+        # cachetools 内部的 pop/popitem 也会调用 `key in self`，这些调用不计入命中率
+        self._internal = threading.local()
+
+    def __contains__(self, key):
+        found = super().__contains__(key)
+        if not getattr(self._internal, 'active', False):
+            inc('cache_events_total', cache=self.metric_name, event='hit' if found else 'miss')
+        return found
+
+    def popitem(self):
+        # 容量已满时由 cachetools 调用，淘汰最久未使用的条目
+        self._internal.active = True
+        try:
+            item = super().popitem()
+        finally:
+            self._internal.active = False
+        inc('cache_events_total', cache=self.metric_name, event='eviction')
+        return item
+
+
+def upstream_hook(name=None):
+    """
+    requests 的 response 钩子：记录上游接口耗时（到收到响应头为止）。
+    name 为空时用请求路径作标签，路径里带参数的接口（如地图瓦片）应传入固定名称。
+    """
+
+    def hook(response, *args, **kwargs):
+        upstream = name or urlsplit(response.url).path
+        elapsed = response.elapsed.total_seconds()
+        observe('upstream_request_duration_seconds', elapsed, upstream=upstream, status=response.status_code)
+        if stage_observer is not None:
+            stage_observer(f'upstream {upstream}', elapsed)
+
+    return hook
+
+
+# --- 跨进程汇总 ---
+_writer_pid = None
+EXITED_FILE = '_exited.json'
+
+
+def _snapshot_path(pid):
+    return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot():
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write_json(_snapshot_path(os.getpid()), registry.snapshot())
+
+
+def _writer():
+    while True:
+        time.sleep(settings.METRICS_WRITE_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"写入指标快照失败: {e}")
+
+
+def _ensure_writer():
+    global _writer_pid
+    if _writer_pid != os.getpid():
+        _writer_pid = os.getpid()
+        threading.Thread(target=_writer, name='metrics-writer', daemon=True).start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total, snapshot, include_gauges=True):
+    for name, labels, value in snapshot.get('counters', []):
+        total['counters'][(name, tuple(map(tuple, labels)))] += value
+    for name, labels, series in snapshot.get('histograms', []):
+        key = (name, tuple(map(tuple, labels)))
+        current = total['histograms'].get(key)
+        total['histograms'][key] = series if current is None else [a + b for a, b in zip(current, series)]
+    if include_gauges:
+        for name, labels, value in snapshot.get('gauges', []):
+            total['gauges'][(name, tuple(map(tuple, labels)))] += value
+
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def collect():
+    """汇总所有进程的快照，返回 {'counters', 'histograms', 'gauges'}"""
+    write_snapshot()
+    total = {'counters': defaultdict(float), 'histograms': {}, 'gauges': defaultdict(float)}
+    lock_path = os.path.join(settings.METRICS_DIR, '.lock')
+    with open(lock_path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited_path = os.path.join(settings.METRICS_DIR, EXITED_FILE)
+        exited = _load(exited_path)
+        merged_exited = False
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            name = os.path.basename(path)[:-len('.json')]
+            if not name.isdigit():
+                continue
+            snapshot = _load(path)
+            if _pid_alive(int(name)):
+                _merge(total, snapshot)
+                continue
+            # 已退出的 worker：累计值并入 _exited.json
+            exited_total = {'counters': defaultdict(float), 'histograms': {}, 'gauges': defaultdict(float)}
+            _merge(exited_total, exited, include_gauges=False)
+            _merge(exited_total, snapshot, include_gauges=False)
+            exited = _to_snapshot(exited_total)
+            merged_exited = True
+            os.remove(path)
+        if merged_exited:
+            _write_json(exited_path, exited)
+        _merge(total, exited, include_gauges=False)
+    return total
+
+
+def collect_extra(name):
+    """合并所有存活进程快照中的附加数据 name（列表拼接）"""
+    write_snapshot()
+    items = []
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        pid = os.path.basename(path)[:-len('.json')]
+        if pid.isdigit() and _pid_alive(int(pid)):
+            items.extend(_load(path).get('extra', {}).get(name, []))
+    return items
+
+
+def _to_snapshot(total):
+    return {
+        'counters': [[name, [list(l) for l in labels], value] for (name, labels), value in total['counters'].items()],
+        'histograms': [[name, [list(l) for l in labels], series] for (name, labels), series in total['histograms'].items()],
+    }
+
+
+# --- Prometheus 文本格式 ---
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_prometheus(total):
+    by_name = defaultdict(list)
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in total[kind].items():
+            by_name[name].append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- 进程内存 ---
+_process_started_at = time.time()
+
+
+def _after_fork_in_child():
+    """
+    preload 模式下的 worker 与渲染进程池的子进程都由 fork 创建：启动时间从 fork 时算起；
+    子进程中只剩调用 fork 的线程，fork 时写快照线程可能正持有注册表的锁，须换一把新锁，否则第一次记录指标就会死锁
+    """
+    global _process_started_at
+    _process_started_at = time.time()
+    registry._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def process_rss_bytes():
+    """当前进程的常驻内存（Linux 读取 /proc/self/statm；其他系统退回为峰值 ru_maxrss）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以 KB 为单位
+        return usage if os.uname().sysname == 'Darwin' else usage * 1024
+
+
+def _process_gauges():
+    return [('process_resident_memory_bytes', {'pid': os.getpid()}, process_rss_bytes())]
+
+
+def _worker_info():
+    return [{
+        'pid': os.getpid(),
+        'rss_mb': round(process_rss_bytes() / (1024 * 1024), 1),
+        'started_at': _process_started_at,
+        'role': settings.SERVICE_ROLE,
+    }]
+
+
+# --- Flask 接入 ---
+def _pool_gauges():
+    from app.database import get_pool_status
+    status = get_pool_status()
+    # 获取连接次数、超时次数与等待时间是计数器，由 PoolStats.record_wait 直接累加
+    values = []
+    for state in ('checked_out', 'checked_in', 'overflow'):
+        if state in status:
+            values.append(('db_pool_connections', {'state': state}, status[state]))
+    return values
+
+
+def init_app(app):
+    """为每个请求记录耗时（按路由模板分组，避免路径参数造成标签爆炸），并采集连接池状态"""
+    registry.register_gauges(_pool_gauges)
+    registry.register_gauges(_process_gauges)
+    registry.register_extra('workers', _worker_info)
+
+    @app.before_request
+    def _start_timer():
+        _ensure_writer()
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe('http_request_duration_seconds', time.perf_counter() - start,
+                    endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
@@ -0,0 +1,167 @@
+# 文件路径: app/migrations.py
+
+"""
+轻量级数据库迁移。
+每个迁移是一个 (版本号, 说明, 函数) 三元组，按版本号顺序执行，已执行的版本记录在 schema_migrations 表中。
+迁移函数接收一个已开启事务的连接，且应当是幂等的。
+PostgreSQL 上整个迁移过程持有一个咨询锁，多个 worker 同时启动时依次执行，后拿到锁的直接跳过已完成的版本。
+新增表结构变更时，在 MIGRATIONS 末尾追加一项即可。
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+_meta = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _meta,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime),
+)
+
+
+def _create_base_tables(conn):
+    from .models import Base
+    Base.metadata.create_all(bind=conn, checkfirst=True)
+
+
+def _create_hot_path_indexes(conn):
+    """为已存在的旧表补建 models 中声明的索引"""
+    from .models import Base
+    existing = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        names = {ix['name'] for ix in existing.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in names:
+                index.create(bind=conn)
+
+
+def _seed_rating_summary(conn):
+    from .services.feedback_stats_service import ensure_rating_summary
+    with Session(bind=conn) as db:
+        ensure_rating_summary(db)
+
+
+def _add_client_id_columns(conn):
+    """为缓冲写入增加 client_id 列及其唯一索引"""
+    existing = inspect(conn)
+    for table in ('feedback', 'messages'):
+        columns = {c['name'] for c in existing.get_columns(table)}
+        if 'client_id' not in columns:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN client_id VARCHAR(32)'))
+    _create_hot_path_indexes(conn)
+
+
+def _create_archive_tables(conn):
+    """创建归档表（结构与热表相同，另有 archived_at 列）"""
+    from .models import FeedbackArchive, MessageArchive
+    for model in (FeedbackArchive, MessageArchive):
+        model.__table__.create(bind=conn, checkfirst=True)
+
+
+def _use_autoincrement_ids(conn):
+    """
+    SQLite 上把 feedback / messages 重建为 AUTOINCREMENT 主键：普通 INTEGER PRIMARY KEY 按当前最大 id + 1
+    分配，最大 id 的行被归档后新行会复用归档表中已有的 id，下次归档时主键冲突。
+    重建后把自增序列推进到热表与归档表中最大的 id。删表会连带删除索引和全文检索触发器，
+    索引在此重建，触发器由随后的 setup_message_search 补建。其他数据库的序列本来就不会复用 id。
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    from sqlalchemy.schema import CreateTable
+    from .models import Feedback, FeedbackArchive, Message, MessageArchive
+    for model, archive_model in ((Feedback, FeedbackArchive), (Message, MessageArchive)):
+        table = model.__table__
+        name = table.name
+        existing = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                {'name': name}).scalar()
+        if existing is None:
+            continue
+        if 'AUTOINCREMENT' not in existing.upper():
+            create = str(CreateTable(table).compile(dialect=conn.dialect))
+            conn.execute(text(create.replace(f'CREATE TABLE {name} ', f'CREATE TABLE {name}_new ', 1)))
+            old_columns = {c['name'] for c in inspect(conn).get_columns(name)}
+            columns = ', '.join(c.name for c in table.columns if c.name in old_columns)
+            conn.execute(text(f'INSERT INTO {name}_new ({columns}) SELECT {columns} FROM {name}'))
+            conn.execute(text(f'DROP TABLE {name}'))
+            conn.execute(text(f'ALTER TABLE {name}_new RENAME TO {name}'))
+            for index in table.indexes:
+                index.create(bind=conn)
+        archive = archive_model.__table__
+        if inspect(conn).has_table(archive.name):
+            max_id = conn.execute(text(
+                f'SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM {name} UNION ALL SELECT MAX(id) FROM {archive.name})'
+            )).scalar() or 0
+            conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': name})
+            conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                         {'name': name, 'seq': max_id})
+
+
+MIGRATIONS = [
+    (1, '创建基础表', _create_base_tables),
+    (2, '为热点查询建立索引', _create_hot_path_indexes),
+    (3, '初始化评分汇总表', _seed_rating_summary),
+    (4, '增加缓冲写入的 client_id 列', _add_client_id_columns),
+    (5, '创建归档表', _create_archive_tables),
+    (6, 'SQLite 主键改为 AUTOINCREMENT', _use_autoincrement_ids),
+]
+
+
+# pg_advisory_lock 的键（任意固定的 64 位整数，同一数据库中的各进程共用）
+MIGRATION_LOCK_KEY = 0x6D696772617465
+
+
+@contextmanager
+def migration_lock(engine):
+    """
+    在 PostgreSQL 上用会话级咨询锁串行化建表/改表：并发的 CREATE TABLE / ALTER TABLE 会以
+    ProgrammingError（表或列已存在）失败，而不是 IntegrityError。其他数据库不加锁。
+    """
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            conn.commit()
+
+
+def applied_versions(conn):
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def run_migrations(engine):
+    """执行所有尚未执行的迁移，返回本次执行的版本号列表"""
+    with migration_lock(engine):
+        return _run_pending(engine)
+
+
+def _run_pending(engine):
+    _meta.create_all(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+
+    ran = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, description=description, applied_at=datetime.now(timezone.utc)
+                ))
+            ran.append(version)
+            print(f"已执行数据库迁移 {version}: {description}")
+        except IntegrityError:
+            # 不加锁的数据库上，其他 worker 已经完成了同一个迁移
+            pass
+    return ran
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+
+from .serialization import rows_to_dicts
 
 Base = declarative_base()
 
@@ -11,8 +14,24 @@ def china_now():
     """获取中国时区的当前时间"""
     return datetime.now(CHINA_TZ)
 
-class Feedback(Base):
-    __tablename__ = 'feedback'
+_CHINA_OFFSET = timedelta(hours=8)
+
+@lru_cache(maxsize=4096)
+def _format_china_time(value):
+    if value.tzinfo is None:
+        local = value + _CHINA_OFFSET
+    else:
+        local = value.astimezone(CHINA_TZ).replace(tzinfo=None)
+    return local.isoformat(timespec='seconds') + '+08:00'
+
+def format_china_time(value):
+    """把数据库时间格式化为中国时区字符串；没有时区信息的时间按UTC处理（结果带缓存，轮询同一页时不重复计算）"""
+    if not value:
+        return None
+    return _format_china_time(value)
+
+class FeedbackFields:
+    """反馈表与反馈归档表共用的列和序列化方法"""
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     rating = Column(Integer, nullable=False)  # 1-5星评分
@@ -23,35 +42,61 @@ class Feedback(Base):
     user_agent = Column(String(500))  # 用户代理
     created_at = Column(DateTime, default=china_now)
     is_read = Column(Boolean, default=False)
+    client_id = Column(String(32))  # 缓冲写入时由服务端生成的提交ID
     
     def __repr__(self):
-        return f"<Feedback(id={self.id}, rating={self.rating}, timestamp={self.timestamp})>"
+        return f"<{type(self).__name__}(id={self.id}, rating={self.rating}, timestamp={self.timestamp})>"
     
     def to_dict(self):
-        # 确保时间是中国时区
-        if self.timestamp:
-            # 如果时间没有时区信息，假设是UTC时间，转换为中国时区
-            if self.timestamp.tzinfo is None:
-                utc_time = self.timestamp.replace(tzinfo=timezone.utc)
-                china_time = utc_time.astimezone(CHINA_TZ)
-            else:
-                china_time = self.timestamp.astimezone(CHINA_TZ)
-            timestamp_str = china_time.strftime('%Y-%m-%dT%H:%M:%S+08:00')
-        else:
-            timestamp_str = None
-            
+        return self.row_to_dict(self)
+
+    @classmethod
+    def list_columns(cls):
+        """列表接口只查询需要的列，避免构造完整的ORM对象"""
+        return (cls.id, cls.rating, cls.suggestion, cls.timestamp, cls.device_info, cls.ip_address, cls.user_agent)
+
+    @classmethod
+    def rows_to_dicts(cls, rows):
+        """批量序列化 list_columns() 查询得到的元组行"""
+        return rows_to_dicts(rows, [c.key for c in cls.list_columns()], {'timestamp': format_china_time})
+
+    @staticmethod
+    def row_to_dict(row):
+        """序列化 list_columns() 查询得到的行（也接受 Feedback 对象）"""
         return {
-            'id': self.id,
-            'rating': self.rating,
-            'suggestion': self.suggestion,
-            'timestamp': timestamp_str,
-            'device_info': self.device_info,
-            'ip_address': self.ip_address,
-            'user_agent': self.user_agent
+            'id': row.id,
+            'rating': row.rating,
+            'suggestion': row.suggestion,
+            'timestamp': format_china_time(row.timestamp),
+            'device_info': row.device_info,
+            'ip_address': row.ip_address,
+            'user_agent': row.user_agent
         }
 
-class Message(Base):
-    __tablename__ = 'messages'
+class Feedback(FeedbackFields, Base):
+    __tablename__ = 'feedback'
+    __table_args__ = (
+        # 列表/导出按 (timestamp, id) 倒序做游标分页
+        Index('ix_feedback_timestamp_id', 'timestamp', 'id'),
+        Index('ix_feedback_rating', 'rating'),
+        Index('ix_feedback_is_read_timestamp', 'is_read', 'timestamp'),
+        # 缓冲写入时重放去重
+        Index('ux_feedback_client_id', 'client_id', unique=True),
+        # 归档会删掉最大 id 的行，SQLite 须用 AUTOINCREMENT 才不会把已归档的 id 再分配给新行
+        {'sqlite_autoincrement': True},
+    )
+
+class FeedbackArchive(FeedbackFields, Base):
+    """由保留策略从 feedback 表迁出的历史反馈，id 与原表一致"""
+    __tablename__ = 'feedback_archive'
+    __table_args__ = (
+        Index('ix_feedback_archive_timestamp_id', 'timestamp', 'id'),
+    )
+    
+    archived_at = Column(DateTime, default=china_now)
+
+class MessageFields:
+    """留言表与留言归档表共用的列和序列化方法"""
     
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
@@ -62,31 +107,66 @@ class Message(Base):
     created_at = Column(DateTime, default=china_now)
     is_read = Column(Boolean, default=False)
     is_replied = Column(Boolean, default=False)
+    client_id = Column(String(32))  # 缓冲写入时由服务端生成的提交ID
     
     def __repr__(self):
-        return f"<Message(id={self.id}, name={self.name}, subject={self.subject})>"
+        return f"<{type(self).__name__}(id={self.id}, name={self.name}, subject={self.subject})>"
     
     def to_dict(self):
-        # 确保时间是中国时区
-        if self.created_at:
-            # 如果时间没有时区信息，假设是UTC时间，转换为中国时区
-            if self.created_at.tzinfo is None:
-                utc_time = self.created_at.replace(tzinfo=timezone.utc)
-                china_time = utc_time.astimezone(CHINA_TZ)
-            else:
-                china_time = self.created_at.astimezone(CHINA_TZ)
-            created_at_str = china_time.strftime('%Y-%m-%dT%H:%M:%S+08:00')
-        else:
-            created_at_str = None
-            
+        return self.row_to_dict(self)
+
+    @classmethod
+    def list_columns(cls):
+        """列表接口只查询需要的列，避免构造完整的ORM对象"""
+        return (cls.id, cls.name, cls.email, cls.subject, cls.content, cls.device_info,
+                cls.created_at, cls.is_read, cls.is_replied)
+
+    @classmethod
+    def rows_to_dicts(cls, rows):
+        """批量序列化 list_columns() 查询得到的元组行"""
+        return rows_to_dicts(rows, [c.key for c in cls.list_columns()], {'created_at': format_china_time})
+
+    @staticmethod
+    def row_to_dict(row):
+        """序列化 list_columns() 查询得到的行（也接受 Message 对象）"""
         return {
-            'id': self.id,
-            'name': self.name,
-            'email': self.email,
-            'subject': self.subject,
-            'content': self.content,
-            'device_info': self.device_info,
-            'created_at': created_at_str,
-            'is_read': self.is_read,
-            'is_replied': self.is_replied
-        } 
\ No newline at end of file
+            'id': row.id,
+            'name': row.name,
+            'email': row.email,
+            'subject': row.subject,
+            'content': row.content,
+            'device_info': row.device_info,
+            'created_at': format_china_time(row.created_at),
+            'is_read': row.is_read,
+            'is_replied': row.is_replied
+        }
+
+class Message(MessageFields, Base):
+    __tablename__ = 'messages'
+    __table_args__ = (
+        # 列表按 (created_at, id) 倒序做游标分页，状态筛选与统计走组合索引
+        Index('ix_messages_created_at_id', 'created_at', 'id'),
+        Index('ix_messages_is_read_created_at', 'is_read', 'created_at'),
+        Index('ix_messages_is_replied_created_at', 'is_replied', 'created_at'),
+        Index('ux_messages_client_id', 'client_id', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
+class MessageArchive(MessageFields, Base):
+    """由保留策略从 messages 表迁出的历史留言，id 与原表一致"""
+    __tablename__ = 'messages_archive'
+    __table_args__ = (
+        Index('ix_messages_archive_created_at_id', 'created_at', 'id'),
+    )
+    
+    archived_at = Column(DateTime, default=china_now)
+
+class FeedbackRatingSummary(Base):
+    """按评分汇总的反馈数量，随提交/删除增量维护，统计接口无需扫描 feedback 表"""
+    __tablename__ = 'feedback_rating_summary'
+
+    rating = Column(Integer, primary_key=True)  # 1-5星
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FeedbackRatingSummary(rating={self.rating}, count={self.count})>"
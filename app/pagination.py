@@ -0,0 +1,89 @@
+# 文件路径: app/pagination.py
+
+import base64
+import json
+from datetime import datetime
+
+from cachetools import TTLCache
+from sqlalchemy import and_, or_
+
+# 列表总数缓存：深分页时不必每页都执行一次 COUNT(*)
+count_cache = TTLCache(maxsize=256, ttl=30)
+
+MAX_PER_PAGE = 100
+
+
+def clamp_per_page(per_page):
+    return max(1, min(per_page or 20, MAX_PER_PAGE))
+
+
+def encode_cursor(sort_value, row_id):
+    """把最后一行的 (排序值, id) 编码为不透明的游标字符串；排序值为空时编码为 null"""
+    payload = json.dumps([sort_value.isoformat() if sort_value is not None else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.fromisoformat(sort_value) if sort_value is not None else None), int(row_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+
+def keyset_page(query, sort_column, id_column, cursor, limit):
+    """
+    按 (sort_column, id_column) 倒序做游标（keyset）分页。
+    传入上一页返回的 cursor 即可取下一页，数据库直接从索引位置继续扫描，不受页码深度影响。
+    sort_column 可为空时，排序值为 NULL 的行排在最后、按 id 倒序，只在非空部分取完后才多查一次。
+    返回 (rows, next_cursor)，没有更多数据时 next_cursor 为 None。
+    """
+    sort_value = row_id = None
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+
+    rows = []
+    # 游标排序值为空说明已经进入 NULL 部分
+    if not cursor or sort_value is not None:
+        filtered = query
+        if sort_column.nullable:
+            filtered = filtered.filter(sort_column.isnot(None))
+        if cursor:
+            filtered = filtered.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id),
+            ))
+        rows = filtered.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    if len(rows) <= limit and sort_column.nullable:
+        filtered = query.filter(sort_column.is_(None))
+        if cursor and sort_value is None:
+            filtered = filtered.filter(id_column < row_id)
+        rows += filtered.order_by(id_column.desc()).limit(limit + 1 - len(rows)).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+
+def cached_count(key, query):
+    """带短期缓存的 COUNT，用于分页信息中的总数（允许有几十秒的延迟）"""
+    if key in count_cache:
+        return count_cache[key]
+    total = query.order_by(None).count()
+    count_cache[key] = total
+    return total
+
+
+def iter_keyset_batches(query, sort_column, id_column, batch_size=1000):
+    """按游标分批遍历查询结果，用于流式导出；每批都是一次独立的索引范围查询"""
+    cursor = None
+    while True:
+        rows, cursor = keyset_page(query, sort_column, id_column, cursor, batch_size)
+        if rows:
+            yield rows
+        if not cursor:
+            break
@@ -0,0 +1,217 @@
+# 文件路径: app/profiling.py
+
+"""
+按需性能分析与最慢请求记录。两项功能都需在配置中开启，关闭时不注册任何钩子。
+
+- PROFILING_ENABLED: 带 X-Profile 头（或 _profile 查询参数）且附有效管理员令牌的请求会被单独分析，
+  结果保存在 PROFILE_DIR，响应头 X-Profile-Id 给出文件名，可通过 /api/monitor/profiles/<文件名> 下载。
+  - X-Profile: 1 / sample —— 采样分析（每 PROFILE_SAMPLE_INTERVAL_MS 毫秒记录一次调用栈），
+    输出折叠栈格式（.folded），可直接交给 flamegraph.pl、speedscope 生成火焰图；
+  - X-Profile: cprofile —— cProfile 确定性分析，输出 .prof，可用 snakeviz / pstats 查看。
+  流式响应（如渐进式热力图）只覆盖视图函数返回之前的部分。
+- SLOW_REQUEST_CAPTURE > 0: 每个 worker 保留耗时最长的 N 个请求及其阶段耗时（热力图各阶段、上游调用），
+  随指标快照写入 METRICS_DIR，/api/monitor/slow-requests 汇总全部 worker。
+"""
+
+import cProfile
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+
+from app import metrics
+from app.config import settings
+
+PROFILE_EXTENSIONS = ('.folded', '.prof')
+
+_seq = itertools.count()
+_slow_lock = threading.Lock()
+_slow_requests = []  # 小顶堆 [(耗时, 序号, 记录)]
+
+
+class StackSampler:
+    """在后台线程中定期读取目标线程的调用栈，按折叠栈计数"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _profile_path(mode):
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_seq)}"
+    extension = '.prof' if mode == 'cprofile' else '.folded'
+    return os.path.join(settings.PROFILE_DIR, name + extension)
+
+
+def _prune_profiles():
+    """只保留最新的 PROFILE_KEEP 个结果文件"""
+    files = list_profiles()
+    for entry in files[settings.PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(settings.PROFILE_DIR, entry['id']))
+        except OSError:
+            pass
+
+
+def list_profiles():
+    """按时间倒序列出已保存的分析结果"""
+    try:
+        names = [n for n in os.listdir(settings.PROFILE_DIR) if n.endswith(PROFILE_EXTENSIONS)]
+    except FileNotFoundError:
+        return []
+    entries = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(settings.PROFILE_DIR, name))
+        except OSError:
+            continue
+        entries.append({'id': name, 'size': stat.st_size, 'modified_at': stat.st_mtime})
+    return sorted(entries, key=lambda e: e['modified_at'], reverse=True)
+
+
+def _requested_mode():
+    value = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not value or value == '0':
+        return None
+    return 'cprofile' if value == 'cprofile' else 'sample'
+
+
+def _start_profile():
+    mode = _requested_mode()
+    if mode is None:
+        return
+    # 延迟导入，避免 app.views 与本模块循环引用
+    from app.services import admin_auth_service
+    from app.views.admin_auth import _request_token
+    if settings.ADMIN_AUTH_REQUIRED and not admin_auth_service.verify_token(_request_token()):
+        return
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 另一个请求正在用 cProfile（Python 3.12 起同一进程只能有一个），改用采样
+            mode = 'sample'
+        else:
+            g.profiler = ('cprofile', profiler)
+            return
+    sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    sampler.start()
+    g.profiler = ('sample', sampler)
+
+
+def _finish_profile(response=None):
+    active = g.pop('profiler', None)
+    if active is None:
+        return response
+    mode, profiler = active
+    if mode == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+    try:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        path = _profile_path(mode)
+        if mode == 'cprofile':
+            profiler.dump_stats(path)
+        else:
+            profiler.dump(path)
+        _prune_profiles()
+    except OSError as e:
+        print(f"保存性能分析结果失败: {e}")
+        return response
+    if response is not None:
+        response.headers['X-Profile-Id'] = os.path.basename(path)
+    return response
+
+
+# --- 最慢请求记录 ---
+def _record_stage(stage, seconds):
+    if has_request_context():
+        stages = g.setdefault('profile_stages', {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def _start_timer():
+    g.profile_start = time.perf_counter()
+
+
+def _capture_slow(response):
+    start = g.pop('profile_start', None)
+    if start is None:
+        return response
+    duration = time.perf_counter() - start
+    with _slow_lock:
+        if len(_slow_requests) >= settings.SLOW_REQUEST_CAPTURE and duration <= _slow_requests[0][0]:
+            return response
+        entry = {
+            'endpoint': request.url_rule.rule if request.url_rule else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'stages_ms': {stage: round(seconds * 1000, 1)
+                          for stage, seconds in g.get('profile_stages', {}).items()},
+            'profile_id': response.headers.get('X-Profile-Id'),
+            'at': time.time(),
+            'pid': os.getpid(),
+        }
+        item = (duration, next(_seq), entry)
+        if len(_slow_requests) < settings.SLOW_REQUEST_CAPTURE:
+            heapq.heappush(_slow_requests, item)
+        else:
+            heapq.heapreplace(_slow_requests, item)
+    return response
+
+
+def slow_requests():
+    """当前进程记录的最慢请求，按耗时倒序"""
+    with _slow_lock:
+        return [entry for _, _, entry in sorted(_slow_requests, reverse=True)]
+
+
+def init_app(app):
+    """按配置注册钩子；应在 metrics.init_app 之后调用"""
+    if settings.SLOW_REQUEST_CAPTURE > 0:
+        metrics.stage_observer = _record_stage
+        metrics.registry.register_extra('slow_requests', slow_requests)
+        app.before_request(_start_timer)
+        # after_request 按注册的逆序执行：先注册的记录函数在 _finish_profile 之后运行，能取到 X-Profile-Id
+        app.after_request(_capture_slow)
+
+    if settings.PROFILING_ENABLED:
+        app.before_request(_start_profile)
+        app.after_request(_finish_profile)
+        # 视图抛出未处理的异常时，在 teardown 中确保停止分析
+        app.teardown_request(lambda exc: _finish_profile())
@@ -0,0 +1,43 @@
+# 文件路径: app/serialization.py
+
+"""
+列表/导出接口的序列化工具。
+行以元组形式读取，按列名一次性 zip 成字典；JSON 编码优先使用 orjson（未安装时退回标准库）。
+models 也会导入本模块，因此这里不在模块级导入 Flask，只有 json_response 用到时才导入。
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+
+def dumps(obj):
+    """编码为 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """jsonify 的快速替代，直接返回编码好的响应"""
+    from flask import Response
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def rows_to_dicts(rows, keys, converters=None):
+    """
+    把按 keys 顺序查询得到的元组行转换为字典列表。
+    converters 形如 {列名: 函数}，只对这些列逐个转换，其余列原样放入。
+    """
+    converters = [(keys.index(key), func) for key, func in (converters or {}).items()]
+    result = []
+    for row in rows:
+        if converters:
+            row = list(row)
+            for index, func in converters:
+                row[index] = func(row[index])
+        result.append(dict(zip(keys, row)))
+    return result
@@ -0,0 +1,252 @@
+# 文件路径: app/services/admin_auth_service.py
+
+"""
+管理员认证。
+
+- 账户文件 admin_account.txt 每两行一组：用户名 + 密码哈希。哈希支持
+  pbkdf2_sha256$迭代次数$盐(hex)$哈希(hex)（推荐，用 python -m app.services.admin_auth_service 用户名 生成），
+  以及旧的无盐 SHA-256 十六进制串（登录成功后自动改写为 pbkdf2）。账户在内存中建索引，文件修改时间变化时才重新读取，
+  且最多每 ADMIN_ACCOUNT_CHECK_INTERVAL 秒检查一次。
+- 登录成功后签发 HMAC 签名的令牌，管理接口只校验令牌（不读文件、不跑慢哈希），
+  校验结果再缓存一小段时间。签名密钥取自 ADMIN_TOKEN_SECRET，未配置时在本机生成一个随机密钥文件，
+  同一台机器上的 worker 共用；多实例部署须配置 ADMIN_TOKEN_SECRET。
+- 按IP限制登录失败次数。计数在进程内，多个 worker 时每个 worker 分别计数。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from cachetools import TTLCache
+
+from app.config import settings
+
+ACCOUNT_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'admin_account.txt')
+PBKDF2_PREFIX = 'pbkdf2_sha256'
+
+_lock = threading.Lock()
+_accounts = {}  # 用户名 -> 哈希串
+_file_state = None  # (mtime_ns, size)
+_checked_at = 0.0
+_version = 0  # 账户每次重新加载后递增，使令牌校验缓存失效
+_secret = None
+
+# 令牌 -> (用户名, 过期时间, 账户版本)
+_token_cache = TTLCache(maxsize=1024, ttl=60)
+# IP -> 窗口内的失败时间列表
+_failures = TTLCache(maxsize=10000, ttl=3600)
+# TTLCache 读取时也会清理过期项，多线程 worker 下须加锁
+_cache_lock = threading.Lock()
+
+
+# --- 密码哈希 ---
+def hash_password(password, iterations=None, salt=None):
+    """生成 pbkdf2_sha256 格式的密码哈希"""
+    iterations = iterations or settings.ADMIN_PBKDF2_ITERATIONS
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f'{PBKDF2_PREFIX}${iterations}${salt.hex()}${digest.hex()}'
+
+
+def verify_password(password, stored):
+    """常数时间比较；同时兼容旧的无盐 SHA-256 哈希"""
+    if stored.startswith(PBKDF2_PREFIX + '$'):
+        try:
+            _, iterations, salt, expected = stored.split('$')
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), bytes.fromhex(salt), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(digest.hex(), expected)
+    return hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).hexdigest(), stored)
+
+
+_dummy_hash = None
+
+
+def _dummy():
+    """用户不存在时也跑一次同样代价的哈希，避免通过响应时间判断用户名是否存在"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    return _dummy_hash
+
+
+# --- 账户索引 ---
+def _read_accounts():
+    with open(ACCOUNT_FILE, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    return {lines[i]: lines[i + 1].strip() for i in range(0, len(lines) - 1, 2)}
+
+
+def _refresh_accounts(force=False):
+    """按修改时间增量重新加载账户文件；两次检查之间至少间隔 ADMIN_ACCOUNT_CHECK_INTERVAL 秒"""
+    global _accounts, _file_state, _checked_at, _version
+    now = time.monotonic()
+    if not force and now - _checked_at < settings.ADMIN_ACCOUNT_CHECK_INTERVAL:
+        return
+    with _lock:
+        _checked_at = now
+        try:
+            stat = os.stat(ACCOUNT_FILE)
+            state = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            state = None
+        if state == _file_state and not force:
+            return
+        _accounts = _read_accounts() if state else {}
+        _file_state = state
+        _version += 1
+        with _cache_lock:
+            _token_cache.clear()
+        legacy = [user for user, stored in _accounts.items() if not stored.startswith(PBKDF2_PREFIX)]
+        if legacy:
+            print(f"管理员账户仍使用无盐SHA-256哈希，建议重新生成: {', '.join(legacy)}")
+
+
+def _upgrade_legacy_hash(username, stored, password):
+    """旧的无盐 SHA-256 账户登录成功后，把账户文件中的哈希改写为 pbkdf2；返回新哈希，失败时返回原哈希"""
+    new_hash = hash_password(password)
+    with _lock:
+        try:
+            # newline='' 保留文件原有的换行符
+            with open(ACCOUNT_FILE, 'r', encoding='utf-8', newline='') as f:
+                lines = f.read().splitlines(keepends=True)
+            for i in range(0, len(lines) - 1, 2):
+                if lines[i].rstrip('\r\n') == username and lines[i + 1].strip() == stored:
+                    ending = lines[i + 1][len(lines[i + 1].rstrip('\r\n')):]
+                    lines[i + 1] = new_hash + ending
+                    break
+            else:
+                return stored
+            tmp_path = f'{ACCOUNT_FILE}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(''.join(lines))
+            os.replace(tmp_path, ACCOUNT_FILE)
+        except OSError as e:
+            print(f"改写管理员 {username} 的密码哈希失败: {e}")
+            return stored
+    _refresh_accounts(force=True)
+    print(f"管理员 {username} 的密码哈希已改写为 pbkdf2")
+    return new_hash
+
+
+def _load_or_create_secret_file(path):
+    """读取本机的随机密钥文件，不存在时原子地创建（同一台机器上的 worker 读到同一个密钥）"""
+    try:
+        with open(path, 'rb') as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(secrets.token_hex(32).encode('ascii'))
+    os.chmod(tmp_path, 0o600)
+    try:
+        os.link(tmp_path, path)  # 已存在时失败，保留先创建的那个
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read().strip()
+
+
+def _signing_key():
+    """令牌签名密钥：优先使用 ADMIN_TOKEN_SECRET；未配置时使用本机随机生成的密钥文件"""
+    global _secret
+    if _secret is None:
+        if settings.ADMIN_TOKEN_SECRET:
+            _secret = settings.ADMIN_TOKEN_SECRET.encode('utf-8')
+        else:
+            _secret = _load_or_create_secret_file(settings.ADMIN_TOKEN_SECRET_FILE)
+    return _secret
+
+
+# --- 登录限流 ---
+def retry_after(ip):
+    """该IP仍被限制登录时返回需要等待的秒数，否则返回 0"""
+    now = time.time()
+    window = settings.ADMIN_LOGIN_WINDOW
+    with _cache_lock:
+        recent = [t for t in _failures.get(ip, ()) if now - t < window]
+    if len(recent) < settings.ADMIN_LOGIN_MAX_ATTEMPTS:
+        return 0
+    return max(1, int(recent[0] + window - now))
+
+
+def _record_failure(ip):
+    now = time.time()
+    with _cache_lock:
+        recent = [t for t in _failures.get(ip, ()) if now - t < settings.ADMIN_LOGIN_WINDOW]
+        _failures[ip] = recent + [now]
+
+
+# --- 登录与令牌 ---
+def _sign(payload, stored_hash):
+    # 签名绑定用户当前的密码哈希，修改密码后旧令牌自动失效
+    return hmac.new(_signing_key(), (payload + '|' + stored_hash).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def authenticate(username, password, ip):
+    """校验账号密码，成功返回 (令牌, 有效秒数)，失败返回 None"""
+    _refresh_accounts()
+    stored = _accounts.get(username or '')
+    ok = verify_password(password or '', stored or _dummy()) and stored is not None
+    if not ok:
+        _record_failure(ip)
+        return None
+    with _cache_lock:
+        _failures.pop(ip, None)
+    if not stored.startswith(PBKDF2_PREFIX + '$'):
+        stored = _upgrade_legacy_hash(username, stored, password)
+    expires_in = settings.ADMIN_TOKEN_TTL
+    payload = base64.urlsafe_b64encode(
+        json.dumps({'u': username, 'exp': int(time.time()) + expires_in}).encode('utf-8')
+    ).decode('ascii')
+    return f'{payload}.{_sign(payload, stored)}', expires_in
+
+
+def verify_token(token):
+    """校验令牌，返回用户名；无效或过期返回 None"""
+    if not token:
+        return None
+    _refresh_accounts()
+    with _cache_lock:
+        cached = _token_cache.get(token)
+    if cached and cached[2] == _version:
+        username, expires_at, _ = cached
+        return username if expires_at > time.time() else None
+
+    try:
+        payload, signature = token.rsplit('.', 1)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')))
+        username, expires_at = claims['u'], int(claims['exp'])
+        stored = _accounts.get(username)
+        if stored is None or expires_at <= time.time():
+            return None
+        if not hmac.compare_digest(signature.encode('ascii'), _sign(payload, stored).encode('ascii')):
+            return None
+    except (ValueError, KeyError, TypeError):
+        return None
+    with _cache_lock:
+        _token_cache[token] = (username, expires_at, _version)
+    return username
+
+
+if __name__ == '__main__':
+    # 生成账户文件中的一组记录: python -m app.services.admin_auth_service 用户名
+    import getpass
+    import sys
+
+    if len(sys.argv) != 2:
+        print('用法: python -m app.services.admin_auth_service 用户名')
+        sys.exit(1)
+    print(sys.argv[1])
+    print(hash_password(getpass.getpass('密码: ')))
@@ -0,0 +1,65 @@
+# 文件路径: app/services/bulk_service.py
+
+"""
+管理后台批量操作。
+所有操作都是基于集合的 UPDATE/DELETE ... WHERE id IN (...)，id 列表按块拆分，
+每块单独提交，超大列表也不会超出数据库的参数个数限制，也不会长时间持有写锁。
+"""
+
+from sqlalchemy import delete, or_, update
+
+# 每条语句最多携带的 id 数（SQLite 旧版本的参数上限为 999）
+CHUNK_SIZE = 500
+# 单次请求最多处理的 id 数
+MAX_IDS = 100000
+
+
+def parse_ids(values):
+    """校验并去重 id 列表，保持原顺序；格式错误时抛出 ValueError"""
+    if not isinstance(values, list):
+        raise ValueError('id 列表格式错误')
+    if len(values) > MAX_IDS:
+        raise ValueError(f'单次最多处理 {MAX_IDS} 条')
+    try:
+        return list(dict.fromkeys(int(v) for v in values))
+    except (TypeError, ValueError):
+        raise ValueError('id 必须为整数')
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def bulk_update(db, model, ids, values):
+    """把 ids 对应行的字段批量设为 values，只更新确实发生变化的行，返回受影响行数"""
+    changed = or_(*[or_(getattr(model, field) != value, getattr(model, field).is_(None))
+                    for field, value in values.items()])
+    total = 0
+    for chunk in _chunks(ids):
+        result = db.execute(
+            update(model).where(model.id.in_(chunk), changed).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        total += result.rowcount
+    return total
+
+
+def bulk_delete(db, model, ids, delete_rows=None):
+    """
+    批量删除 ids 对应的行，返回删除行数。
+    delete_rows(db, condition) 可替代默认的 DELETE 语句（须返回删除行数），用于在同一事务中按实际删除的行维护汇总数据。
+    """
+    total = 0
+    for chunk in _chunks(ids):
+        condition = model.id.in_(chunk)
+        if delete_rows:
+            deleted = delete_rows(db, condition)
+        else:
+            deleted = db.execute(
+                delete(model).where(condition).execution_options(synchronize_session=False)
+            ).rowcount
+        db.commit()
+        total += deleted
+    return total
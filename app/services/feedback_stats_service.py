@@ -0,0 +1,77 @@
+# 文件路径: app/services/feedback_stats_service.py
+
+from collections import Counter
+
+from sqlalchemy import delete, func, update
+
+from app.config import settings
+from app.models import Feedback, FeedbackRatingSummary
+
+RATINGS = range(1, 6)
+
+
+def _aggregate_distribution(db):
+    """一次 GROUP BY 查询得到各评分的数量"""
+    rows = db.query(Feedback.rating, func.count(Feedback.id)).group_by(Feedback.rating).all()
+    return {rating: count for rating, count in rows}
+
+
+def rebuild_rating_summary(db):
+    """用聚合查询重建汇总表（首次启用或数据被绕过接口修改后使用），需由调用方提交"""
+    counts = _aggregate_distribution(db)
+    db.query(FeedbackRatingSummary).delete(synchronize_session=False)
+    db.add_all([FeedbackRatingSummary(rating=r, count=counts.get(r, 0)) for r in RATINGS])
+
+
+def ensure_rating_summary(db):
+    """汇总表为空时从 feedback 表初始化"""
+    if db.query(FeedbackRatingSummary).count() == 0:
+        rebuild_rating_summary(db)
+        db.commit()
+
+
+def record_rating_changes(db, deltas):
+    """
+    在当前事务中增量更新汇总表，deltas 形如 {rating: +1/-n}。
+    使用 count = count + delta 的原子更新，并发提交不会互相覆盖。
+    """
+    for rating, delta in deltas.items():
+        if delta:
+            db.execute(
+                update(FeedbackRatingSummary)
+                .where(FeedbackRatingSummary.rating == rating)
+                .values(count=FeedbackRatingSummary.count + delta)
+            )
+
+
+def delete_feedback(db, condition):
+    """
+    删除满足 condition 的反馈，并在当前事务中按实际删除的行扣减汇总表，返回删除行数（由调用方提交）。
+    评分取自 DELETE ... RETURNING（数据库不支持时按评分分别删除，用 rowcount 计数），
+    而不是删除前的 SELECT：两个并发的删除命中同一行时，只有真正删掉它的一方会扣减。
+    """
+    statement = delete(Feedback).where(condition).execution_options(synchronize_session=False)
+    if db.get_bind().dialect.delete_returning:
+        counts = Counter(db.execute(statement.returning(Feedback.rating)).scalars())
+    else:
+        counts = {rating: db.execute(statement.where(Feedback.rating == rating)).rowcount for rating in RATINGS}
+    record_rating_changes(db, {rating: -count for rating, count in counts.items()})
+    return sum(counts.values())
+
+
+def get_rating_distribution(db):
+    """返回 {rating: count}；启用汇总表时直接读取 5 行汇总数据"""
+    if settings.FEEDBACK_STATS_USE_SUMMARY:
+        rows = db.query(FeedbackRatingSummary.rating, FeedbackRatingSummary.count).all()
+        if rows:
+            return {rating: count for rating, count in rows}
+    return _aggregate_distribution(db)
+
+
+def get_rating_stats(db):
+    """返回 (总数, 平均评分, 评分分布)，总数与平均分由分布直接算出，不再额外查询"""
+    counts = get_rating_distribution(db)
+    distribution = {f"{r}星": counts.get(r, 0) for r in RATINGS}
+    total = sum(counts.values())
+    average = sum(r * c for r, c in counts.items()) / total if total else 0
+    return total, average, distribution
@@ -0,0 +1,200 @@
+# 文件路径: app/services/geodata_service.py
+
+"""
+城市地理数据索引与多级简化图层。
+
+- 启动时扫描 shanxigeo/ 下的城市目录（含 boundary.geojson 的目录视为一个城市）及其中的 *.geojson 图层，
+  请求中的 city / map_layers 只能取索引中的名称，不再直接拼接成文件路径。
+- 每个图层按 GEODATA_SIMPLIFY_TOLERANCES（单位：度）用 Douglas-Peucker 算法预先简化成若干级，
+  只保留几何列，以 FlatGeobuf 格式保存在 GEODATA_CACHE_DIR；源文件更新后自动重建。
+  可用 `python -m app.services.geodata_service` 提前生成全部城市的缓存。
+- 渲染时按输出图每个像素对应的经纬度跨度选择级别：简化误差不超过半个像素，画面上看不出差别。
+"""
+
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from app import metrics
+from app.config import settings
+
+PROVINCE_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shanxigeo')
+BOUNDARY_LAYER = 'boundary'
+CACHE_EXTENSION = '.fgb'
+
+# {城市: {图层名: 源文件路径}}；建好后不再修改，重新扫描时整体替换，读取方无需加锁
+_index = {}
+_build_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    """渲染子进程由 fork 创建，fork 时其他线程可能正持有锁，子进程中换新"""
+    global _build_lock
+    _build_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def scan():
+    """重新扫描城市与图层目录（只列目录，不读取文件），返回城市列表"""
+    index = {}
+    try:
+        names = sorted(os.listdir(PROVINCE_DATA_PATH))
+    except FileNotFoundError:
+        names = []
+    for city in names:
+        city_path = os.path.join(PROVINCE_DATA_PATH, city)
+        if not os.path.isfile(os.path.join(city_path, f'{BOUNDARY_LAYER}.geojson')):
+            continue
+        index[city] = {
+            name[:-len('.geojson')]: os.path.join(city_path, name)
+            for name in sorted(os.listdir(city_path)) if name.endswith('.geojson')
+        }
+    global _index
+    # 替换引用而不是原地修改，正在遍历旧索引的线程不受影响
+    _index = index
+    return list(index)
+
+
+def _city_layers(city):
+    # 城市名来自请求参数，非字符串（如列表）不能作为字典键
+    if not isinstance(city, str):
+        return None
+    if not _index:
+        scan()
+    return _index.get(city)
+
+
+def has_city(city):
+    return _city_layers(city) is not None
+
+
+def cities():
+    """全部城市及其可叠加的图层（不含边界）"""
+    if not _index:
+        scan()
+    return [{'city': city, 'layers': [name for name in layers if name != BOUNDARY_LAYER]}
+            for city, layers in _index.items()]
+
+
+def layer_names(city, names):
+    """过滤出该城市存在的图层，未知名称直接忽略"""
+    layers = _city_layers(city) or {}
+    if not isinstance(names, (list, tuple)):
+        return []
+    return [name for name in names if isinstance(name, str) and name in layers and name != BOUNDARY_LAYER]
+
+
+def tolerances():
+    """各简化级别的容差（度），第 0 级为原始几何"""
+    return (0.0,) + tuple(sorted(settings.GEODATA_SIMPLIFY_TOLERANCES))
+
+
+def level_for(degrees_per_pixel):
+    """选择简化误差不超过半个像素的最粗级别；未给出像素尺寸时使用原始几何"""
+    if not degrees_per_pixel:
+        return 0
+    level = 0
+    for i, tolerance in enumerate(tolerances()):
+        if tolerance <= degrees_per_pixel / 2:
+            level = i
+    return level
+
+
+def _cache_path(city, layer, level):
+    return os.path.join(settings.GEODATA_CACHE_DIR, city, f'{layer}@{tolerances()[level]:g}{CACHE_EXTENSION}')
+
+
+def _simplify(gdf, tolerance):
+    """Douglas-Peucker 简化，并丢弃小于容差、在输出图上不足一个像素的要素"""
+    import shapely
+    gdf = gdf[['geometry']]
+    if tolerance:
+        polygonal = gdf.geom_type.isin(['Polygon', 'MultiPolygon']).to_numpy()
+        # 面要素保持拓扑，避免简化后自相交；线要素直接使用 Douglas-Peucker
+        geoms = gdf.geometry.values
+        simplified = np.where(polygonal, shapely.simplify(geoms, tolerance, preserve_topology=True),
+                              shapely.simplify(geoms, tolerance, preserve_topology=False))
+        # 经纬度坐标下直接以度为单位比较，只用于判断要素是否小于一个像素
+        size = np.where(polygonal, np.sqrt(shapely.area(simplified)), shapely.length(simplified))
+        gdf = gdf.assign(geometry=simplified)[size >= tolerance]
+    return gdf[~(gdf.geometry.is_empty | gdf.geometry.isna())].reset_index(drop=True)
+
+
+def _is_fresh(path, source):
+    try:
+        return os.path.getmtime(path) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+def _build_layer(city, layer, gpd):
+    """把一个图层的全部级别写入缓存目录（写临时文件后替换，多个进程同时构建也不会读到半个文件）"""
+    source = _index[city][layer]
+    stale = [level for level in range(len(tolerances())) if not _is_fresh(_cache_path(city, layer, level), source)]
+    if not stale:
+        return False
+    with metrics.timer('heatmap_stage_seconds', stage='read_file'):
+        gdf = gpd.read_file(source)
+    os.makedirs(os.path.join(settings.GEODATA_CACHE_DIR, city), exist_ok=True)
+    for level in stale:
+        path = _cache_path(city, layer, level)
+        tolerance = tolerances()[level]
+        # 临时文件也要以 .fgb 结尾，否则 GDAL 会把它当作目录创建
+        tmp_path = os.path.join(os.path.dirname(path), f'.{os.getpid()}-{os.path.basename(path)}')
+        _simplify(gdf, tolerance).to_file(tmp_path, driver='FlatGeobuf', SPATIAL_INDEX='NO')
+        os.replace(tmp_path, path)
+    return True
+
+
+@lru_cache(maxsize=128)
+def _read_level(city, layer, level, source_mtime):
+    """source_mtime 只作为缓存键的一部分：源文件更新后重新构建并读取"""
+    # 延迟导入：geopandas 由 heatmap_service 在首次生成热力图时加载
+    from app.services import heatmap_service
+    heatmap_service.load_dependencies()
+    gpd = heatmap_service.gpd
+    source = _index[city][layer]
+    path = _cache_path(city, layer, level)
+    if not _is_fresh(path, source):
+        try:
+            with _build_lock:
+                if not _is_fresh(path, source):
+                    _build_layer(city, layer, gpd)
+        except Exception as e:
+            # 缓存目录不可写等情况下退回读取源文件
+            print(f"生成简化图层失败 {city}/{layer}: {e}")
+            with metrics.timer('heatmap_stage_seconds', stage='read_file'):
+                return gpd.read_file(source)
+    with metrics.timer('heatmap_stage_seconds', stage='read_file'):
+        return gpd.read_file(path)
+
+
+def load_layer(city, layer, degrees_per_pixel=None):
+    """
+    读取图层的 GeoDataFrame（只有几何列），按像素尺寸选择简化级别；每个进程按 (城市, 图层, 级别) 缓存。
+    城市或图层不在索引中时返回 None。
+    """
+    layers = _city_layers(city)
+    if not layers or layer not in layers:
+        return None
+    return _read_level(city, layer, level_for(degrees_per_pixel), os.path.getmtime(layers[layer]))
+
+
+def build_all():
+    """为全部城市的全部图层生成各级简化缓存（已是最新的跳过），返回重新生成的图层数"""
+    from app.services import heatmap_service
+    heatmap_service.load_dependencies()
+    scan()
+    count = 0
+    for city, layers in _index.items():
+        for layer in layers:
+            count += _build_layer(city, layer, heatmap_service.gpd)
+    return count
+
+
+if __name__ == '__main__':
+    print(f"已重新生成 {build_all()} 个图层的简化缓存: {settings.GEODATA_CACHE_DIR}")
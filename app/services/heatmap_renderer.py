@@ -0,0 +1,136 @@
+# 文件路径: app/services/heatmap_renderer.py
+
+"""
+热力图绘制用的图形模板。
+
+使用面向对象的 Figure / FigureCanvasAgg 接口，不经过 pyplot 的全局图形列表，
+图形只被模板引用，丢弃模板即可释放，不会因为漏掉 plt.close 而在 worker 中越积越多。
+
+同一城市、分辨率、显示范围与叠加图层的热力图共用一个模板：坐标轴、边界与图层、裁剪路径、
+热力图层和色标条只创建一次，之后每次渲染只替换网格数据、色标，并临时添加站点与时刻标注。
+模板按键缓存在 FigureTemplatePool 中；渲染出错的模板直接关闭丢弃，不会带着半成品状态被复用。
+"""
+
+import io
+import threading
+from contextlib import contextmanager
+
+from cachetools import LRUCache
+
+from app import metrics
+
+
+class FigureTemplate:
+    """
+    预先搭好的一张图。构建方在 ax 上绘制静态内容后调用 attach() 登记热力图层与色标条，
+    render() 每次只更新数据相关的部分，结束时移除临时添加的标注。
+    """
+
+    def __init__(self, figsize, dpi):
+        # matplotlib 随热力图依赖一起在首次使用时导入
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.image = None
+        self.colorbar = None
+
+    def attach(self, image, colorbar):
+        self.image = image
+        self.colorbar = colorbar
+
+    def render(self, data, extent, cmap, vmin=None, vmax=None, points=None, point_size=20, label=None):
+        """
+        绘制一张PNG：data 为按行排列的二维网格（第一行在最南侧），extent 为 (xmin, xmax, ymin, ymax)。
+        vmin/vmax 为空时按数据自动确定色标范围。
+        """
+        from matplotlib.colors import Normalize
+
+        dynamic = []
+        try:
+            self.image.set_data(data)
+            self.image.set_extent(extent)
+            self.image.set_cmap(cmap)
+            self.image.set_norm(Normalize(vmin, vmax))
+            self.image.autoscale_None()
+            self.colorbar.update_normal(self.image)
+
+            if points is not None:
+                dynamic.append(self.ax.scatter(points[:, 0], points[:, 1], s=point_size, c='black',
+                                               edgecolors='white', linewidths=0.5, zorder=10))
+            if label:
+                dynamic.append(self.ax.text(0.02, 0.98, label, transform=self.ax.transAxes, fontsize=16, va='top',
+                                            ha='left', bbox=dict(facecolor='white', alpha=0.8, edgecolor='none'),
+                                            zorder=20))
+
+            buf = io.BytesIO()
+            self.fig.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.05)
+            return buf.getvalue()
+        finally:
+            for artist in dynamic:
+                artist.remove()
+
+    def close(self):
+        """释放图形占用的内存（含 Agg 渲染缓冲区）"""
+        self.fig.clear()
+        self.canvas = self.fig = self.ax = self.image = self.colorbar = None
+
+
+class _TemplateCache(LRUCache):
+    def popitem(self):
+        key, template = super().popitem()
+        template.close()
+        return key, template
+
+
+class FigureTemplatePool:
+    """
+    按键缓存空闲的模板，每个进程最多 maxsize 个（0 表示不复用，每次渲染后立即关闭）。
+    使用中的模板从缓存中取出，并发请求同一个键时各自新建，用完后放回（已有空闲模板时关闭多余的一个）。
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._idle = _TemplateCache(maxsize=max(1, maxsize))
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, key, build):
+        """取出 key 对应的模板，没有时用 build() 构建；with 块内出错时关闭模板而不放回"""
+        with self._lock:
+            template = self._idle.pop(key, None)
+        metrics.inc('cache_events_total', cache='figure_templates', event='hit' if template else 'miss')
+        if template is None:
+            template = build()
+        try:
+            yield template
+        except BaseException:
+            template.close()
+            raise
+        if not self.maxsize:
+            template.close()
+            return
+        with self._lock:
+            previous = self._idle.pop(key, None)
+            self._idle[key] = template
+        if previous is not None:
+            previous.close()
+
+    def resize(self, maxsize):
+        """调整缓存上限并关闭现有的空闲模板（渲染子进程启动时使用）"""
+        with self._lock:
+            while self._idle:
+                self._idle.popitem()
+            self.maxsize = maxsize
+            self._idle = _TemplateCache(maxsize=max(1, maxsize))
+
+    def reset_after_fork(self):
+        """fork 出的子进程中换一把新锁（fork 时其他线程可能正持有旧锁）"""
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            while self._idle:
+                self._idle.popitem()
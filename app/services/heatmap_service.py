@@ -1,149 +1,684 @@
 # 文件路径: app/services/heatmap_service.py
 
-import pandas as pd
-import geopandas as gpd
 import numpy as np
-import matplotlib
-
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib as mpl  # 新增导入mpl
-from scipy.interpolate import Rbf
-from pykrige.ok import OrdinaryKriging
-from shapely.geometry import Polygon, MultiPolygon
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 import io
 import base64
+import json
 import os
+import threading
 
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
-# --- 全局路径设置 ---
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PROVINCE_DATA_PATH = os.path.join(os.path.dirname(BASE_DIR), 'shanxigeo')
+from app import metrics
+from app.config import settings
+from app.services import geodata_service
+from app.services.heatmap_renderer import FigureTemplate, FigureTemplatePool
 
+# pandas/geopandas/matplotlib/scipy/PyKrige 等依赖导入耗时约 1-2 秒、占用上百MB内存，
+# 在首次生成热力图时才由 load_dependencies() 导入，只处理天气/反馈等请求的 worker 不必加载
+pd = gpd = mpl = PolygonPatch = Rbf = Polygon = MultiPolygon = contains_xy = Image = OrdinaryKrigingSystem = None
+_dependencies_loaded = False
+_dependencies_lock = threading.Lock()
+DEFAULT_CITY = 'taiyuangeo'
+# 未指定 value_column 时插值的数值列
+VALUE_COLUMN = '污染物浓度'
+# 默认显示范围（除非用户在 options['extent'] 中自定义）；未列出的城市使用边界范围外扩 EXTENT_MARGIN
+DEFAULT_EXTENT = {'xmin': 111.4, 'xmax': 113.3, 'ymin': 37.2, 'ymax': 38.5}
+CITY_EXTENTS = {DEFAULT_CITY: DEFAULT_EXTENT}
+EXTENT_MARGIN = 0.05
+# 图幅尺寸（英寸）与坐标轴在图幅中大约所占的宽度比例（其余留给色标条）
+FIGURE_SIZE = 12
+AXES_FRACTION = 0.75
+# 自动分辨率下每个网格单元对应的输出像素数（imshow 双线性插值会平滑单元之间的过渡）
+PIXELS_PER_CELL = 4
+# 自动分辨率的格点总数上限（与原先固定的 200x200 相当），超出时按比例缩小两个方向
+MAX_AUTO_GRID_CELLS = 200 * 200
+# 每个方向的格点数范围；显式指定的 grid_resolution 超出此范围时接口返回 400
+MIN_GRID_RESOLUTION = 30
+MAX_GRID_RESOLUTION = 400
+# 渐进式渲染中预览图的DPI与网格缩放比例
+PREVIEW_DPI = 50
+PREVIEW_GRID_SCALE = 0.5
 
-def create_heatmap_image(excel_file, options):
+# 批量生成时决定插值网格的选项：这些选项与数值列都相同的图共用一次插值，只是渲染样式不同
+BATCH_GRID_KEYS = ('city', 'extent', 'dpi', 'grid_resolution', 'interpolation_method', 'variogram_model')
+
+# 渲染动画帧与批量热力图用的进程池，首次使用时创建
+_render_pool = None
+_render_pool_tasks = 0
+# 某个子进程执行完任务后常驻内存超过 HEATMAP_RENDER_MAX_RSS_MB，下次提交前换新池
+_render_pool_over_rss = False
+_render_pool_lock = threading.Lock()
+# 每个进程缓存的图形模板（见 heatmap_renderer）
+_templates = FigureTemplatePool(settings.HEATMAP_FIGURE_TEMPLATES)
+
+
+def _after_fork_in_child():
     """
-    【最终样式优化版】
-    - 移除所有标题和标签文字。
-    - 新增并支持一个名为'classic_custom'的自定义色标。
+    渲染子进程与 preload 模式下的 worker 由 fork 创建，只继承调用 fork 的线程：
+    其他线程持有的锁不会再被释放，全部换新；父进程的渲染进程池在子进程中也不可用，首次使用时重新创建
     """
-    try:
-        # --- 1. 数据读取与准备 (不变) ---
-        df = pd.read_excel(excel_file)
-        points = df[['经度', '纬度']].values
-        values = df['污染物浓度'].values
-
-        # --- 2. 路径与底图加载 (不变) ---
-        city_folder = options.get('city', 'taiyuangeo')
-        CITY_DATA_PATH = os.path.join(PROVINCE_DATA_PATH, city_folder)
-        boundary_gdf = gpd.read_file(os.path.join(CITY_DATA_PATH, 'boundary.geojson'))
-
-        # --- 3. 空间插值计算 (不变) ---
-        xmin, ymin, xmax, ymax = boundary_gdf.total_bounds
-        resolution = options.get('grid_resolution', 200)
-        grid_x, grid_y = np.mgrid[xmin:xmax:complex(0, resolution), ymin:ymax:complex(0, resolution)]
-        interp_method = options.get('interpolation_method', 'kriging')
-        # (插值逻辑不变)
-        if interp_method == 'kriging':
-            OK = OrdinaryKriging(points[:, 0], points[:, 1], values, variogram_model='linear', verbose=False,
-                                 enable_plotting=False)
-            gridx_1d = np.linspace(xmin, xmax, resolution)
-            gridy_1d = np.linspace(ymin, ymax, resolution)
-            grid_z, ss = OK.execute('grid', gridx_1d, gridy_1d)
-            grid_z = grid_z.T
-        elif interp_method == 'rbf':
+    global _dependencies_lock, _render_pool, _render_pool_tasks, _render_pool_over_rss, _render_pool_lock
+    _dependencies_lock = threading.Lock()
+    _render_pool_lock = threading.Lock()
+    _render_pool = None
+    _render_pool_tasks = 0
+    _render_pool_over_rss = False
+    _templates.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def load_dependencies():
+    """导入热力图所需的科学计算依赖并设置 matplotlib（幂等，可在启动时预先调用）"""
+    global pd, gpd, mpl, PolygonPatch, Rbf, Polygon, MultiPolygon, contains_xy, Image, OrdinaryKrigingSystem
+    global _dependencies_loaded
+    if _dependencies_loaded:
+        return
+    with _dependencies_lock:
+        if _dependencies_loaded:
+            return
+        import pandas as pd
+        import geopandas as gpd
+        import matplotlib as mpl
+
+        # 绘图只用 Figure/FigureCanvasAgg；geopandas 内部会导入 pyplot，仍固定为非交互后端
+        mpl.use('Agg')
+        from matplotlib.patches import Polygon as PolygonPatch
+        from scipy.interpolate import Rbf
+        from shapely.geometry import Polygon, MultiPolygon
+        from shapely import contains_xy
+        from PIL import Image
+        from app.services.kriging import OrdinaryKrigingSystem
+
+        mpl.rcParams['font.sans-serif'] = ['SimHei']
+        mpl.rcParams['axes.unicode_minus'] = False
+        _dependencies_loaded = True
+
+
+def warm_up(render=True):
+    """
+    预热：导入依赖、生成各城市图层的简化缓存并读取边界，并可渲染一张小图以初始化字体缓存。
+    配合 gunicorn --preload 在主进程中调用，fork 出的 worker 通过写时复制共享这些内存。
+    """
+    load_dependencies()
+    geodata_service.build_all()
+    cities = [entry['city'] for entry in geodata_service.cities()]
+    for city in cities:
+        _load_boundary(city)
+    if render and cities:
+        template = FigureTemplate((1, 1), 20)
+        try:
+            template.ax.set_title('预热')
+            template.fig.savefig(io.BytesIO(), format='png')
+        finally:
+            template.close()
+    return cities
+
+
+def _load_boundary(city_folder, degrees_per_pixel=None):
+    """
+    读取城市边界（每个进程按城市缓存）。插值网格与裁剪用原始几何；
+    只用于绘制时传入 degrees_per_pixel，取与输出分辨率相当的简化版本。
+    """
+    boundary_gdf = geodata_service.load_layer(city_folder, geodata_service.BOUNDARY_LAYER, degrees_per_pixel)
+    if boundary_gdf is None:
+        raise ValueError(f"未知的城市: {city_folder}")
+    return boundary_gdf
+
+
+def _as_dataframe(data):
+    """接受已解析的 DataFrame 或 Excel 文件对象"""
+    if isinstance(data, pd.DataFrame):
+        return data
+    with metrics.timer('heatmap_stage_seconds', stage='read_excel'):
+        return pd.read_excel(data)
+
+
+def _station_values(df, column):
+    """取站点坐标与数值列，剔除该列缺测的站点，返回 (points, values)"""
+    df = df[['经度', '纬度', column]].dropna()
+    return df[['经度', '纬度']].to_numpy(dtype=float), df[column].to_numpy(dtype=float)
+
+
+def _encode(data):
+    with metrics.timer('heatmap_stage_seconds', stage='encode'):
+        return base64.b64encode(data).decode('utf-8')
+
+
+def _build_colormap(colormap_name):
+    if colormap_name == 'classic_custom':
+        # 定义并使用您的自定义色标
+        custom_colors = [(0, '#00FFFF'), (0.2, '#9FFF56'), (0.35, '#FFDD00'), (0.7, "#FE2801"), (1, '#8B0000')]
+        return mpl.colors.LinearSegmentedColormap.from_list('classic_custom', custom_colors, N=256)
+    # 使用Matplotlib的内置色标
+    return mpl.colormaps[colormap_name]
+
+
+def _view_extent(options):
+    extent = options.get('extent')
+    if extent and all(k in extent for k in ['xmin', 'xmax', 'ymin', 'ymax']):
+        return extent
+    return _city_extent(options.get('city', DEFAULT_CITY))
+
+
+@lru_cache(maxsize=64)
+def _city_extent(city):
+    if city in CITY_EXTENTS:
+        return CITY_EXTENTS[city]
+    # 与裁剪一致取第一个要素（边界文件中可能混有同名的其他行政区）
+    xmin, ymin, xmax, ymax = _load_boundary(city).geometry.iloc[0].bounds
+    margin = EXTENT_MARGIN * max(xmax - xmin, ymax - ymin)
+    return {'xmin': xmin - margin, 'xmax': xmax + margin, 'ymin': ymin - margin, 'ymax': ymax + margin}
+
+
+def _degrees_per_pixel(options):
+    """输出图中每个像素对应的经纬度跨度（坐标轴为等比例，横纵方向相同）"""
+    view = _view_extent(options)
+    axes_pixels = FIGURE_SIZE * options.get('dpi', 150) * AXES_FRACTION
+    return max(view['xmax'] - view['xmin'], view['ymax'] - view['ymin']) / axes_pixels
+
+
+def grid_resolution_error(options):
+    """校验显式指定的 grid_resolution，返回错误信息；未指定或合法时返回 None"""
+    value = options.get('grid_resolution')
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) \
+            or not MIN_GRID_RESOLUTION <= value <= MAX_GRID_RESOLUTION:
+        return f"grid_resolution 必须是 {MIN_GRID_RESOLUTION}~{MAX_GRID_RESOLUTION} 之间的整数"
+    return None
+
+
+def _grid_axes(boundary_gdf, options, scale=1.0):
+    """
+    计算插值网格，返回 (bounds, gridx_1d, gridy_1d)。
+    - 网格只覆盖边界与显示范围的交集，画面外的区域不做插值。
+    - 未指定 grid_resolution 时按输出像素尺寸自动确定格点数，总数不超过 MAX_AUTO_GRID_CELLS；
+      scale<1 用于低分辨率预览。
+    """
+    view = _view_extent(options)
+    bxmin, bymin, bxmax, bymax = boundary_gdf.total_bounds
+    xmin, xmax = max(bxmin, view['xmin']), min(bxmax, view['xmax'])
+    ymin, ymax = max(bymin, view['ymin']), min(bymax, view['ymax'])
+    if xmin >= xmax or ymin >= ymax:
+        # 显示范围与边界不相交时，直接在显示范围上插值
+        xmin, xmax, ymin, ymax = view['xmin'], view['xmax'], view['ymin'], view['ymax']
+
+    if options.get('grid_resolution'):
+        nx = ny = int(options['grid_resolution'])
+    else:
+        # 显示范围映射到坐标轴像素宽度，网格按其在画面中所占比例分配格点
+        pixels_per_degree = 1 / _degrees_per_pixel(options)
+        nx = int(np.ceil((xmax - xmin) * pixels_per_degree / PIXELS_PER_CELL))
+        ny = int(np.ceil((ymax - ymin) * pixels_per_degree / PIXELS_PER_CELL))
+        if nx * ny > MAX_AUTO_GRID_CELLS:
+            shrink = np.sqrt(MAX_AUTO_GRID_CELLS / (nx * ny))
+            nx, ny = int(nx * shrink), int(ny * shrink)
+    nx = int(np.clip(nx * scale, MIN_GRID_RESOLUTION, MAX_GRID_RESOLUTION))
+    ny = int(np.clip(ny * scale, MIN_GRID_RESOLUTION, MAX_GRID_RESOLUTION))
+
+    return (xmin, ymin, xmax, ymax), np.linspace(xmin, xmax, nx), np.linspace(ymin, ymax, ny)
+
+
+def _interpolate(points, values, gridx_1d, gridy_1d, interp_method, variogram_model='auto'):
+    """
+    在网格上插值，返回 (grid_z, ss)：grid_z 形状为 (nx, ny)，ss 为同形状的克里金方差。
+    values 为二维 (n, T) 时 grid_z 为 (T, nx, ny)，克里金只分解一次方程组。
+    RBF 插值没有方差，ss 为 None。
+    variogram_model 为 'auto' 时在 linear/spherical/exponential/gaussian 中自动选择（结果按数据缓存）。
+    """
+    with metrics.timer('heatmap_stage_seconds', stage='rbf' if interp_method == 'rbf' else 'kriging'):
+        return _interpolate_grid(points, np.asarray(values, dtype=float), gridx_1d, gridy_1d, interp_method,
+                                 variogram_model)
+
+
+def _interpolate_grid(points, values, gridx_1d, gridy_1d, interp_method, variogram_model):
+    if interp_method == 'rbf':
+        grid_x, grid_y = np.meshgrid(gridx_1d, gridy_1d, indexing='ij')
+        if values.ndim == 1:
             rbfi = Rbf(points[:, 0], points[:, 1], values, function='multiquadric', smooth=0)
-            grid_z = rbfi(grid_x, grid_y)
-        else:
-            OK = OrdinaryKriging(points[:, 0], points[:, 1], values, variogram_model='linear', verbose=False,
-                                 enable_plotting=False)
-            gridx_1d = np.linspace(xmin, xmax, resolution)
-            gridy_1d = np.linspace(ymin, ymax, resolution)
-            grid_z, ss = OK.execute('grid', gridx_1d, gridy_1d)
-            grid_z = grid_z.T
-
-        # --- 4. 开始绘图 ---
-        fig, ax = plt.subplots(figsize=(12, 12), dpi=150)
-        ax.set_aspect('equal')
-
-        # --- 【修改点1】色标处理逻辑 ---
-        colormap_name = options.get('colormap', 'classic_custom')  # 将'经典色标'设为默认
-
-        if colormap_name == 'classic_custom':
-            # 定义并使用您的自定义色标
-            custom_colors = [(0, '#00FFFF'), (0.2, '#9FFF56'), (0.35, '#FFDD00'), (0.7, "#FE2801"), (1, '#8B0000')]
-            colormap = mpl.colors.LinearSegmentedColormap.from_list('classic_custom', custom_colors, N=256)
-        else:
-            # 使用Matplotlib的内置色标
-            colormap = plt.get_cmap(colormap_name)
+            return rbfi(grid_x, grid_y), None
+        return np.stack([
+            Rbf(points[:, 0], points[:, 1], column, function='multiquadric', smooth=0)(grid_x, grid_y)
+            for column in values.T
+        ]), None
+
+    # 默认使用克里金插值；多组观测值共用按均值拟合的变差函数
+    fit_values = values if values.ndim == 1 else values.mean(axis=1)
+    system = OrdinaryKrigingSystem.from_data(points[:, 0], points[:, 1], fit_values, variogram_model)
+    grid_z, ss = system.solve_grid(gridx_1d, gridy_1d, values)
+    # 数值误差可能让方差出现极小的负数
+    return np.swapaxes(grid_z, -1, -2), np.clip(ss.T, 0, None)
+
 
-        heatmap = ax.imshow(
-            grid_z.T, extent=(xmin, xmax, ymin, ymax), origin='lower',
-            cmap=colormap, interpolation='bilinear'
+def render_heatmap_png(grid_z, bounds, points, options, vmin=None, vmax=None, label=None):
+    """将插值结果绘制为PNG字节串（可在子进程中调用，参数均可序列化）"""
+    load_dependencies()
+    # 在渲染子进程中执行时计时留在子进程，不计入 /metrics
+    with metrics.timer('heatmap_stage_seconds', stage='render'):
+        return _render_png(grid_z, bounds, points, options, vmin, vmax, label)
+
+
+def _render_png(grid_z, bounds, points, options, vmin, vmax, label):
+    xmin, ymin, xmax, ymax = bounds
+    city_folder = options.get('city', DEFAULT_CITY)
+    dpi = options.get('dpi', 150)
+    extent = _view_extent(options)
+    layer_names = tuple(geodata_service.layer_names(city_folder, options.get('map_layers', [])))
+    key = (city_folder, dpi, tuple(sorted(extent.items())), layer_names)
+    # 在取出模板之前解析色标：色标名无效时直接报错，不必丢弃完好的模板
+    colormap = _build_colormap(options.get('colormap', 'classic_custom'))  # 将'经典色标'设为默认
+
+    with _templates.checkout(key, lambda: _build_template(city_folder, dpi, extent, layer_names, options)) as template:
+        return template.render(
+            grid_z.T, (xmin, xmax, ymin, ymax), colormap, vmin, vmax,
+            points=points if options.get('show_points', False) else None,
+            point_size=options.get('point_size', 20),
+            label=label,
         )
 
-        # --- 5. 裁剪与图层绘制 (不变) ---
-        # (此部分裁剪和绘制逻辑与上一版完全相同，无需修改)
-        clip_geom = boundary_gdf.geometry.iloc[0]
-        clipping_path_polygon = None
-        if isinstance(clip_geom, Polygon):
-            clipping_path_polygon = plt.Polygon(clip_geom.exterior.coords, transform=ax.transData)
-        elif isinstance(clip_geom, MultiPolygon):
-            largest_polygon = max(clip_geom.geoms, key=lambda p: p.area)
-            clipping_path_polygon = plt.Polygon(largest_polygon.exterior.coords, transform=ax.transData)
-        if clipping_path_polygon:
-            heatmap.set_clip_path(clipping_path_polygon)
-        for layer_name in options.get('map_layers', []):
-            layer_path = os.path.join(CITY_DATA_PATH, f"{layer_name}.geojson")
-            if os.path.exists(layer_path):
-                layer_gdf = gpd.read_file(layer_path)
-                if 'road' in layer_name or 'highway' in layer_name:
-                    layer_gdf.plot(ax=ax, edgecolor='#4a4a4a', linewidth=0.4, alpha=0.7, zorder=3)
-                elif 'water' in layer_name or 'river' in layer_name:
-                    layer_gdf.plot(ax=ax, edgecolor='#3498db', facecolor='#3498db', linewidth=0.8, alpha=0.6, zorder=2)
-                elif 'rail' in layer_name:
-                    layer_gdf.plot(ax=ax, edgecolor='#5e5e5e', linewidth=0.4, linestyle='--', zorder=3)
-                else:
-                    layer_gdf.plot(ax=ax, edgecolor='white', facecolor='none', linewidth=0.6, linestyle=':', zorder=2)
-        boundary_gdf.plot(ax=ax, edgecolor='black', facecolor='none', linewidth=1.5, zorder=5)
-        if options.get('show_points', False):
-            point_size = options.get('point_size', 20)
-            ax.scatter(points[:, 0], points[:, 1], s=point_size, c='black', edgecolors='white', linewidths=0.5,
-                       zorder=10)
-
-        # --- 6. 设置图表样式 (【修改点2】移除所有文本) ---
-        # ax.set_title("污染物浓度空间插值热力图", fontsize=18) # 移除标题
-        fig.colorbar(heatmap, ax=ax, shrink=0.75)  # 保留色标条，但移除标签文字
-
-        # 使用固定的默认显示范围 (除非用户自定义)
-        if 'extent' in options and options.get('extent'):
-            extent = options['extent']
-            if all(k in extent for k in ['xmin', 'xmax', 'ymin', 'ymax']):
-                ax.set_xlim(extent['xmin'], extent['xmax'])
-                ax.set_ylim(extent['ymin'], extent['ymax'])
-        else:
-            ax.set_xlim(111.4, 113.3)
-            ax.set_ylim(37.2, 38.5)
 
-        # 移除坐标轴的刻度和标签
-        ax.set_xticks([])
-        ax.set_yticks([])
-        ax.set_xlabel("")
-        ax.set_ylabel("")
+def _build_template(city_folder, dpi, extent, layer_names, options):
+    """
+    构建某城市、分辨率、显示范围与图层组合的图形模板（绘制顺序与样式即热力图的最终样式）：
+    - 移除所有标题和标签文字；
+    - 热力图层按城市边界裁剪，叠加道路、水系、铁路等图层与边界线，右侧保留色标条。
+    """
+    template = FigureTemplate((FIGURE_SIZE, FIGURE_SIZE), dpi)
+    try:
+        _draw_template(template, city_folder, extent, layer_names, options)
+    except BaseException:
+        template.close()
+        raise
+    return template
+
+
+def _draw_template(template, city_folder, extent, layer_names, options):
+    fig, ax = template.fig, template.ax
+    # 边界与叠加图层按输出分辨率选择简化级别，原始精度的几何在画面上只会多出看不见的顶点
+    degrees_per_pixel = _degrees_per_pixel(options)
+    boundary_gdf = _load_boundary(city_folder, degrees_per_pixel)
+
+    ax.set_aspect('equal')
+    # 热力图层先用占位数据创建，每次渲染时替换数据、色标与范围
+    heatmap = ax.imshow(np.zeros((2, 2)), origin='lower', interpolation='bilinear')
+
+    # --- 裁剪与图层绘制 ---
+    clip_geom = boundary_gdf.geometry.iloc[0]
+    clipping_path_polygon = None
+    if isinstance(clip_geom, Polygon):
+        clipping_path_polygon = PolygonPatch(clip_geom.exterior.coords, transform=ax.transData)
+    elif isinstance(clip_geom, MultiPolygon):
+        largest_polygon = max(clip_geom.geoms, key=lambda p: p.area)
+        clipping_path_polygon = PolygonPatch(largest_polygon.exterior.coords, transform=ax.transData)
+    if clipping_path_polygon:
+        heatmap.set_clip_path(clipping_path_polygon)
+    for layer_name in layer_names:
+        layer_gdf = geodata_service.load_layer(city_folder, layer_name, degrees_per_pixel)
+        if len(layer_gdf):
+            if 'road' in layer_name or 'highway' in layer_name:
+                layer_gdf.plot(ax=ax, edgecolor='#4a4a4a', linewidth=0.4, alpha=0.7, zorder=3)
+            elif 'water' in layer_name or 'river' in layer_name:
+                layer_gdf.plot(ax=ax, edgecolor='#3498db', facecolor='#3498db', linewidth=0.8, alpha=0.6, zorder=2)
+            elif 'rail' in layer_name:
+                layer_gdf.plot(ax=ax, edgecolor='#5e5e5e', linewidth=0.4, linestyle='--', zorder=3)
+            else:
+                layer_gdf.plot(ax=ax, edgecolor='white', facecolor='none', linewidth=0.6, linestyle=':', zorder=2)
+    boundary_gdf.plot(ax=ax, edgecolor='black', facecolor='none', linewidth=1.5, zorder=5)
+
+    # 保留色标条，但不加标签文字
+    colorbar = fig.colorbar(heatmap, ax=ax, shrink=0.75)
+
+    # 使用固定的默认显示范围 (除非用户自定义)，移除坐标轴的刻度和标签
+    ax.set_xlim(extent['xmin'], extent['xmax'])
+    ax.set_ylim(extent['ymin'], extent['ymax'])
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_xlabel("")
+    ax.set_ylabel("")
+
+    ax.set_facecolor('white')
+    fig.set_facecolor('white')
+    template.attach(heatmap, colorbar)
+
+
+def _export_grid(grid_z, ss, gridx_1d, gridy_1d, clip_geom, spec):
+    """
+    导出降采样后的数值网格，供客户端自行统计。
+    spec: {'format': 'json'|'npy', 'max_size': 每个方向最多的格点数(默认100)}
+    边界外的格点为空值(NaN/null)。
+    """
+    max_size = max(1, int(spec.get('max_size', 100)))
+    step = max(1, int(np.ceil(max(len(gridx_1d), len(gridy_1d)) / max_size)))
+    xs, ys = gridx_1d[::step], gridy_1d[::step]
+    gx, gy = np.meshgrid(xs, ys)
+    inside = contains_xy(clip_geom, gx, gy)
 
-        ax.set_facecolor('white')
-        fig.set_facecolor('white')
+    layers = {'value': grid_z}
+    if ss is not None:
+        layers['variance'] = ss
+    # 网格统一转为 (ny, nx)，第一行为最南侧
+    arrays = {name: np.where(inside, layer[::step, ::step].T, np.nan).astype(np.float32)
+              for name, layer in layers.items()}
 
-        # --- 7. 输出图片 (不变) ---
+    meta = {
+        'xmin': float(xs[0]), 'xmax': float(xs[-1]),
+        'ymin': float(ys[0]), 'ymax': float(ys[-1]),
+        'nx': len(xs), 'ny': len(ys),
+        'layers': list(arrays),
+    }
+    if spec.get('format', 'json') == 'npy':
         buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.05)  # pad_inches=0.0 尽可能减少白边
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        plt.close(fig)
+        np.save(buf, np.stack(list(arrays.values())))
+        return {**meta, 'format': 'npy', 'data_base64': base64.b64encode(buf.getvalue()).decode('utf-8')}
 
-        return image_base64
+    precision = int(spec.get('precision', 3))
+    for name, arr in arrays.items():
+        rounded = np.round(arr.astype(float), precision)
+        meta[name] = [[None if np.isnan(v) else v for v in row] for row in rounded.tolist()]
+    return {**meta, 'format': 'json'}
+
+
+def generate_heatmap(data, options):
+    """
+    生成热力图及可选的附加输出，返回 dict，失败时返回 None。
+    - image_base64: 热力图PNG
+    - variance_image_base64: options['return_variance'] 为真时，克里金方差图层（同一次求解得到，无额外开销）
+    - grid: options['export_grid'] 为真时，降采样的数值网格（见 _export_grid）
+    data 可以是已解析的 DataFrame（推荐，见 upload_service.read_table），也可以是Excel文件对象。
+    options['value_column'] 指定插值的数值列（默认'污染物浓度'）。
+    """
+    load_dependencies()
+    try:
+        # --- 1. 数据读取与准备 ---
+        df = _as_dataframe(data)
+        points, values = _station_values(df, options.get('value_column', VALUE_COLUMN))
+
+        # --- 2. 路径与底图加载 ---
+        boundary_gdf = _load_boundary(options.get('city', DEFAULT_CITY))
+
+        # --- 3. 空间插值计算 ---
+        bounds, gridx_1d, gridy_1d = _grid_axes(boundary_gdf, options)
+        grid_z, ss = _interpolate(points, values, gridx_1d, gridy_1d, options.get('interpolation_method', 'kriging'),
+                                  options.get('variogram_model', 'auto'))
+
+        result = {'image_base64': _encode(render_heatmap_png(grid_z, bounds, points, options))}
+
+        if options.get('return_variance') and ss is not None:
+            variance_options = {**options, 'colormap': options.get('variance_colormap', 'viridis')}
+            variance_png = render_heatmap_png(ss, bounds, points, variance_options)
+            result['variance_image_base64'] = _encode(variance_png)
+
+        if options.get('export_grid'):
+            spec = options['export_grid'] if isinstance(options['export_grid'], dict) else {}
+            result['grid'] = _export_grid(grid_z, ss, gridx_1d, gridy_1d, boundary_gdf.geometry.iloc[0], spec)
+
+        return result
 
     except Exception as e:
         print(f"ERROR in heatmap_service: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def generate_heatmap_progressive(data, options):
+    """
+    渐进式生成热力图：先产出低分辨率预览 {'stage': 'preview', ...}，
+    再产出完整结果 {'stage': 'final', ...}（内容同 generate_heatmap），失败时产出 {'stage': 'error'}。
+    数据只解析一次，变差函数拟合结果在两次插值之间通过缓存复用。
+    """
+    load_dependencies()
+    df = _as_dataframe(data)
+    try:
+        points, values = _station_values(df, options.get('value_column', VALUE_COLUMN))
+        boundary_gdf = _load_boundary(options.get('city', DEFAULT_CITY))
+
+        preview_options = {**options, 'dpi': PREVIEW_DPI}
+        bounds, gridx_1d, gridy_1d = _grid_axes(boundary_gdf, preview_options, scale=PREVIEW_GRID_SCALE)
+        grid_z, _ = _interpolate(points, values, gridx_1d, gridy_1d, options.get('interpolation_method', 'kriging'),
+                                 options.get('variogram_model', 'auto'))
+        preview_png = render_heatmap_png(grid_z, bounds, points, preview_options)
+        yield {'stage': 'preview', 'image_base64': _encode(preview_png)}
+    except Exception as e:
+        print(f"ERROR in heatmap_service (preview): {e}")
+
+    result = generate_heatmap(df, options)
+    yield {'stage': 'final', **result} if result else {'stage': 'error'}
+
+
+def create_heatmap_image(data, options):
+    """
+    【最终样式优化版】
+    - 移除所有标题和标签文字。
+    - 新增并支持一个名为'classic_custom'的自定义色标。
+    返回热力图PNG的base64字符串，失败时返回 None。
+    """
+    result = generate_heatmap(data, options)
+    return result['image_base64'] if result else None
+
+
+def _init_render_child():
+    """渲染子进程的初始化：模板缓存按 HEATMAP_RENDER_FIGURE_TEMPLATES 缩小，丢弃从父进程继承来的模板"""
+    _templates.resize(settings.HEATMAP_RENDER_FIGURE_TEMPLATES)
+
+
+def _run_render_task(fn, *args):
+    """在渲染子进程中执行任务，返回 (结果, 执行后常驻内存是否超过 HEATMAP_RENDER_MAX_RSS_MB)"""
+    result = fn(*args)
+    limit = settings.HEATMAP_RENDER_MAX_RSS_MB
+    return result, limit > 0 and metrics.process_rss_bytes() > limit * 1024 * 1024
+
+
+def _unwrap_render_result(inner, pool):
+    """把 _run_render_task 的 future 转换为只含结果的 future，并记录 pool 的子进程是否超出内存上限"""
+    outer = Future()
+
+    def done(future):
+        global _render_pool_over_rss
+        try:
+            result, over_rss = future.result()
+        except BaseException as e:
+            outer.set_exception(e)
+            return
+        if over_rss and pool is _render_pool:
+            _render_pool_over_rss = True
+        outer.set_result(result)
+
+    inner.add_done_callback(done)
+    return outer
+
+
+def _submit_render_tasks(fn, calls):
+    """
+    把一批任务提交到渲染进程池，返回 futures。
+    以下情况换一个新池，旧池执行完已提交的任务后退出，子进程中缓存的模板、图层与 matplotlib 占用的内存随之归还：
+    - 进程池累计执行的任务数达到 HEATMAP_RENDER_MAX_TASKS；
+    - 某个子进程执行完任务后常驻内存超过 HEATMAP_RENDER_MAX_RSS_MB（子进程在每个任务后自查）。
+    子进程异常退出（如被 OOM killer 杀掉）后整个进程池不再可用，此时丢弃旧池，在新池中重新提交这一批任务。
+    """
+    global _render_pool, _render_pool_tasks, _render_pool_over_rss
+    with _render_pool_lock:
+        limit = settings.HEATMAP_RENDER_MAX_TASKS
+        if _render_pool is not None and (_render_pool_over_rss or (limit > 0 and _render_pool_tasks >= limit)):
+            if _render_pool_over_rss:
+                print("渲染子进程的常驻内存超过上限，换用新的进程池")
+                metrics.inc('render_pool_restarts_total', reason='rss')
+            _render_pool.shutdown(wait=False)
+            _render_pool = None
+        for attempt in range(2):
+            if _render_pool is None:
+                _render_pool = ProcessPoolExecutor(max_workers=settings.HEATMAP_RENDER_WORKERS,
+                                                   initializer=_init_render_child)
+                _render_pool_tasks = 0
+                _render_pool_over_rss = False
+            try:
+                futures = [_unwrap_render_result(_render_pool.submit(_run_render_task, fn, *args), _render_pool)
+                           for args in calls]
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                print("渲染进程池的子进程异常退出，换用新的进程池")
+                metrics.inc('render_pool_restarts_total', reason='broken')
+                _render_pool.shutdown(wait=False)
+                _render_pool = None
+                continue
+            _render_pool_tasks += len(calls)
+            return futures
+
+
+def _render_frames(grids, bounds, points, options, vmin, vmax, labels):
+    """渲染全部帧；配置了多个渲染进程时并行执行"""
+    if settings.HEATMAP_RENDER_WORKERS <= 1 or len(grids) <= 1:
+        return [render_heatmap_png(g, bounds, points, options, vmin, vmax, l) for g, l in zip(grids, labels)]
+    futures = _submit_render_tasks(render_heatmap_png, [(g, bounds, points, options, vmin, vmax, l)
+                                                        for g, l in zip(grids, labels)])
+    return [f.result() for f in futures]
+
+
+def _batch_job(points, values, grid_options, render_options):
+    """
+    批量生成中的一组：插值一次，按每种样式各渲染一张PNG，某种样式渲染失败时对应项为 None，不影响同组其他样式。
+    在渲染进程池中执行时，边界与图层由子进程按城市缓存，同一批次的后续任务直接复用。
+    """
+    load_dependencies()
+    boundary_gdf = _load_boundary(grid_options.get('city', DEFAULT_CITY))
+    bounds, gridx_1d, gridy_1d = _grid_axes(boundary_gdf, grid_options)
+    grid_z, _ = _interpolate(points, values, gridx_1d, gridy_1d, grid_options.get('interpolation_method', 'kriging'),
+                             grid_options.get('variogram_model', 'auto'))
+    images = []
+    for options in render_options:
+        try:
+            images.append(render_heatmap_png(grid_z, bounds, points, options))
+        except Exception as e:
+            print(f"ERROR in heatmap_service (batch render): {e}")
+            images.append(None)
+    return images
+
+
+def generate_heatmap_batch(data, specs):
+    """
+    同一份站点数据按多组选项生成热力图，返回与 specs 一一对应的PNG字节串列表，生成失败的项为 None。
+    - specs 中每项是完整的 options（通常为公共选项与单张图选项合并后的结果），可用 value_column 指定数值列。
+    - 数据只解析一次；数值列与 BATCH_GRID_KEYS 相同的选项只插值一次。
+    - 各组在渲染进程池中并行执行（HEATMAP_RENDER_WORKERS <= 1 时在当前进程内依次执行）。
+    """
+    load_dependencies()
+    df = _as_dataframe(data)
+
+    # (数值列, 网格选项) -> [首个选项, [下标...]]
+    groups = {}
+    for i, options in enumerate(specs):
+        column = options.get('value_column', VALUE_COLUMN)
+        grid_key = json.dumps({k: options.get(k) for k in BATCH_GRID_KEYS}, sort_keys=True, default=str)
+        groups.setdefault((column, grid_key), [options, []])[1].append(i)
+
+    jobs = []
+    for (column, _), (grid_options, indices) in groups.items():
+        points, values = _station_values(df, column)
+        jobs.append((indices, (points, values, grid_options, [specs[i] for i in indices])))
+
+    parallel = settings.HEATMAP_RENDER_WORKERS > 1 and len(jobs) > 1
+    if parallel:
+        futures = _submit_render_tasks(_batch_job, [args for _, args in jobs])
+
+    results = [None] * len(specs)
+    for n, (indices, args) in enumerate(jobs):
+        try:
+            images = futures[n].result() if parallel else _batch_job(*args)
+        except Exception as e:
+            print(f"ERROR in heatmap_service (batch): {e}")
+            continue
+        for i, image in zip(indices, images):
+            results[i] = image
+    return results
+
+
+def _encode_animation(frames, fmt, duration):
+    """把PNG帧合成为 GIF/WebP 动图"""
+    with metrics.timer('heatmap_stage_seconds', stage='encode'):
+        return _encode_frames(frames, fmt, duration)
+
+
+def _encode_frames(frames, fmt, duration):
+    images = [Image.open(io.BytesIO(frame)).convert('RGB') for frame in frames]
+    size = images[0].size
+    images = [img if img.size == size else img.resize(size) for img in images]
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        images[0].save(buf, format='WEBP', save_all=True, append_images=images[1:],
+                       duration=duration, loop=0, quality=80)
+    else:
+        images = [img.convert('P', palette=Image.ADAPTIVE) for img in images]
+        images[0].save(buf, format='GIF', save_all=True, append_images=images[1:],
+                       duration=duration, loop=0, optimize=False)
+    return buf.getvalue()
+
+
+def create_heatmap_animation(data, options):
+    """
+    按时间列生成逐时刻热力图动画。
+    - 所有时刻共用同一网格、边界和克里金方程组（站点相同时），N帧只求解一次权重。
+    - 各帧使用统一的色标范围，便于对比；帧在进程池中并行渲染。
+    - options['output'] 为 'gif'（默认）、'webp' 或 'frames'（返回每帧的PNG）。
+    返回 dict，失败时返回 None。
+    """
+    load_dependencies()
+    try:
+        df = _as_dataframe(data)
+        time_column = options.get('time_column', '时间')
+
+        df = df.dropna(subset=['经度', '纬度', '污染物浓度', time_column])
+        times = pd.to_datetime(df[time_column], errors='coerce')
+        if times.notna().all():
+            df = df.assign(**{time_column: times})
+        table = df.pivot_table(index=['经度', '纬度'], columns=time_column, values='污染物浓度', aggfunc='mean')
+        table = table.sort_index(axis=1).iloc[:, :settings.HEATMAP_MAX_FRAMES]
+        if table.shape[1] == 0:
+            return None
+
+        boundary_gdf = _load_boundary(options.get('city', DEFAULT_CITY))
+        render_options = {**options, 'dpi': options.get('dpi', 100)}
+        bounds, gridx_1d, gridy_1d = _grid_axes(boundary_gdf, render_options)
+        interp_method = options.get('interpolation_method', 'kriging')
+
+        station_points = np.array(table.index.tolist(), dtype=float)
+        grids = [None] * table.shape[1]
+        # 按"该时刻有读数的站点集合"分组，同组时刻共用一个方程组
+        observed = table.notna().to_numpy()
+        for mask in np.unique(observed.T, axis=0):
+            columns = np.flatnonzero((observed.T == mask).all(axis=1))
+            if mask.sum() < 3:
+                continue
+            grid_stack, _ = _interpolate(station_points[mask], table.to_numpy()[mask][:, columns],
+                                      gridx_1d, gridy_1d, interp_method,
+                                      options.get('variogram_model', 'auto'))
+            for i, grid_z in zip(columns, grid_stack):
+                grids[i] = grid_z
+
+        keep = [i for i, g in enumerate(grids) if g is not None]
+        if not keep:
+            return None
+        grids = [grids[i] for i in keep]
+        labels = []
+        for i in keep:
+            t = table.columns[i]
+            labels.append(t.strftime('%Y-%m-%d %H:%M') if isinstance(t, pd.Timestamp) else str(t))
+
+        vmin = float(min(np.nanmin(g) for g in grids))
+        vmax = float(max(np.nanmax(g) for g in grids))
+        frames = _render_frames(grids, bounds, station_points, render_options, vmin, vmax, labels)
+
+        output = options.get('output', 'gif')
+        result = {'format': output, 'timestamps': labels}
+        if output == 'frames':
+            result['frames_base64'] = [_encode(f) for f in frames]
+        else:
+            animation = _encode_animation(frames, output, options.get('frame_duration', 500))
+            result['image_base64'] = _encode(animation)
+        return result
+
+    except Exception as e:
+        print(f"ERROR in heatmap_service (animation): {e}")
+        return None
@@ -0,0 +1,192 @@
+# 文件路径: app/services/kriging.py
+
+import hashlib
+
+import numpy as np
+from cachetools import LRUCache
+from scipy.linalg import lu_factor, lu_solve
+from scipy.optimize import least_squares
+from scipy.spatial.distance import cdist, pdist
+from pykrige.ok import OrdinaryKriging
+from pykrige import variogram_models
+
+# 分块求解时单块右端项的最大元素数（约 64MB 的 float64）
+MAX_BLOCK_ELEMENTS = 8_000_000
+
+# 自动拟合时参与比较的变差函数模型
+VARIOGRAM_MODELS = {
+    'linear': variogram_models.linear_variogram_model,
+    'spherical': variogram_models.spherical_variogram_model,
+    'exponential': variogram_models.exponential_variogram_model,
+    'gaussian': variogram_models.gaussian_variogram_model,
+}
+
+# 计算经验变差函数时最多使用的站点数，超过则固定种子随机抽样
+MAX_VARIOGRAM_POINTS = 1500
+
+# 按数据指纹缓存拟合结果: fingerprint -> (model_name, parameters)
+_variogram_cache = LRUCache(maxsize=256)
+
+
+def dataset_fingerprint(x, y, values):
+    """站点坐标与观测值的摘要，用作变差函数缓存的键"""
+    h = hashlib.sha1()
+    for arr in (x, y, values):
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def empirical_semivariogram(x, y, values, nlags=12):
+    """
+    计算经验半变异函数，返回 (lags, gamma, counts)。
+    站点对的距离与半方差均用 pdist 一次性向量化计算；站点过多时先抽样。
+    """
+    xy = np.column_stack((x, y)).astype(float)
+    values = np.asarray(values, dtype=float)
+    if len(xy) > MAX_VARIOGRAM_POINTS:
+        idx = np.random.default_rng(0).choice(len(xy), MAX_VARIOGRAM_POINTS, replace=False)
+        xy, values = xy[idx], values[idx]
+
+    d = pdist(xy)
+    g = 0.5 * pdist(values[:, np.newaxis], 'sqeuclidean')
+    # 与 PyKrige 一致，只使用一半最大距离以内的站点对
+    edges = np.linspace(0, d.max() / 2.0, nlags + 1)
+    which = np.digitize(d, edges) - 1
+    valid = (which >= 0) & (which < nlags)
+    counts = np.bincount(which[valid], minlength=nlags)
+    lag_sum = np.bincount(which[valid], weights=d[valid], minlength=nlags)
+    gamma_sum = np.bincount(which[valid], weights=g[valid], minlength=nlags)
+
+    keep = counts > 0
+    return lag_sum[keep] / counts[keep], gamma_sum[keep] / counts[keep], counts[keep]
+
+
+def _initial_parameters(model, lags, gamma):
+    """返回 (初值, 下界, 上界)；linear 为 [slope, nugget]，其余为 [psill, range, nugget]"""
+    if model == 'linear':
+        slope = (gamma[-1] - gamma[0]) / max(lags[-1] - lags[0], 1e-12)
+        return [max(slope, 1e-12), 0.0], [0.0, 0.0], [np.inf, np.inf]
+    psill = max(gamma.max() - gamma.min(), 1e-12)
+    # 无块金的高斯模型会让克里金矩阵严重病态，保留一个极小的块金下限
+    min_nugget = 1e-4 * gamma.max() if model == 'gaussian' else 0.0
+    return ([psill, 0.25 * lags[-1], min_nugget], [0.0, 1e-3 * lags[-1], min_nugget],
+            [np.inf, 10.0 * lags[-1], np.inf])
+
+
+def fit_variogram(x, y, values, models=None):
+    """
+    在经验半变异函数上拟合候选模型（按站点对数量加权最小二乘），返回误差最小的 (model_name, parameters)。
+    结果按数据指纹缓存，同一数据集再次渲染时直接复用。
+    """
+    models = tuple(models or VARIOGRAM_MODELS)
+    key = (dataset_fingerprint(x, y, values), models)
+    if key in _variogram_cache:
+        return _variogram_cache[key]
+
+    lags, gamma, counts = empirical_semivariogram(x, y, values)
+    if len(lags) < 2:
+        # 站点太少（2~3 个）时经验半变异函数不足两个滞后区间，无法拟合，退回 PyKrige 的 linear 模型
+        result = ('linear', None)
+        _variogram_cache[key] = result
+        return result
+
+    weights = np.sqrt(counts / counts.sum())
+    best = None
+    for model in models:
+        function = VARIOGRAM_MODELS[model]
+        x0, lower, upper = _initial_parameters(model, lags, gamma)
+        try:
+            fit = least_squares(lambda m: (function(m, lags) - gamma) * weights, x0,
+                                bounds=(lower, upper), loss='soft_l1')
+        except ValueError:
+            continue
+        cost = float(np.sum(fit.fun ** 2))
+        if best is None or cost < best[0]:
+            best = (cost, model, [float(p) for p in fit.x])
+
+    if best is None:
+        result = ('linear', None)
+    else:
+        result = (best[1], best[2])
+    _variogram_cache[key] = result
+    return result
+
+
+class OrdinaryKrigingSystem:
+    """
+    普通克里金方程组的预分解版本。
+    克里金权重只取决于站点位置和变差函数，与观测值无关，
+    因此同一组站点的多组观测值（如多个时刻）只需分解一次矩阵、求解一次权重。
+    """
+
+    def __init__(self, x, y, variogram_function, variogram_parameters, eps=1e-10):
+        self.xy = np.column_stack((x, y)).astype(float)
+        self.variogram_function = variogram_function
+        self.variogram_parameters = variogram_parameters
+        self.eps = eps
+        self.variogram_model = None
+
+        n = len(self.xy)
+        a = np.zeros((n + 1, n + 1))
+        a[:n, :n] = -variogram_function(variogram_parameters, cdist(self.xy, self.xy))
+        np.fill_diagonal(a, 0.0)
+        a[n, :] = 1.0
+        a[:, n] = 1.0
+        a[n, n] = 0.0
+        self._lu = lu_factor(a)
+
+    @classmethod
+    def from_data(cls, x, y, values, variogram_model='auto'):
+        """
+        根据观测值确定变差函数后构建方程组。
+        variogram_model='auto' 时自动选择并缓存最优模型，否则沿用 PyKrige 对指定模型的拟合。
+        """
+        if variogram_model == 'auto':
+            model, parameters = fit_variogram(x, y, values)
+            if parameters is not None:
+                system = cls(x, y, VARIOGRAM_MODELS[model], parameters)
+                system.variogram_model = model
+                return system
+            variogram_model = model
+        ok = OrdinaryKriging(x, y, values, variogram_model=variogram_model, verbose=False,
+                             enable_plotting=False)
+        system = cls(x, y, ok.variogram_function, ok.variogram_model_parameters)
+        system.variogram_model = variogram_model
+        return system
+
+    def solve_grid(self, gridx_1d, gridy_1d, values):
+        """
+        在规则网格上求解。
+        values 形状为 (n,) 或 (n, T)，每一列是一组观测值。
+        返回 (z, ss)：z 形状为 (T, ny, nx)（一维输入时为 (ny, nx)），ss 为克里金方差 (ny, nx)。
+        """
+        values = np.asarray(values, dtype=float)
+        single = values.ndim == 1
+        if single:
+            values = values[:, np.newaxis]
+
+        n = len(self.xy)
+        ny, nx = len(gridy_1d), len(gridx_1d)
+        gx, gy = np.meshgrid(gridx_1d, gridy_1d)
+        targets = np.column_stack((gx.ravel(), gy.ravel()))
+        npt = len(targets)
+
+        z = np.empty((values.shape[1], npt))
+        ss = np.empty(npt)
+        block = max(1, MAX_BLOCK_ELEMENTS // (n + 1))
+        for start in range(0, npt, block):
+            stop = min(start + block, npt)
+            bd = cdist(targets[start:stop], self.xy)
+            b = np.empty((stop - start, n + 1))
+            b[:, :n] = -self.variogram_function(self.variogram_parameters, bd)
+            # 网格点与站点重合时取站点原值
+            b[:, :n][np.abs(bd) <= self.eps] = 0.0
+            b[:, n] = 1.0
+
+            weights = lu_solve(self._lu, b.T)
+            z[:, start:stop] = values.T @ weights[:n]
+            ss[start:stop] = np.sum(weights * -b.T, axis=0)
+
+        z = z.reshape((-1, ny, nx))
+        ss = ss.reshape((ny, nx))
+        return (z[0] if single else z), ss
@@ -0,0 +1,117 @@
+# 文件路径: app/services/message_counter_service.py
+
+"""
+留言看板计数器（总数 / 未读 / 已回复）。
+
+- 一次条件聚合查询同时得到三个数；
+- 结果在进程内缓存 MESSAGE_STATS_TTL 秒，提交、阅读、回复、删除时在缓存上增量修改，
+  多个 worker 之间的差异最多持续一个 TTL；
+- 每次变化都会唤醒等待者，供 SSE / 长轮询接口推送。客户端用计数本身组成的标签（total-unread-replied）
+  表示已知状态，与具体由哪个 worker 处理请求无关。
+"""
+
+import threading
+import time
+
+from sqlalchemy import case, func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Message
+
+_condition = threading.Condition()
+_counters = None  # {'total', 'unread', 'replied'}
+_loaded_at = 0.0
+
+
+def _compute(db):
+    total, unread, replied = db.query(
+        func.count(Message.id),
+        func.coalesce(func.sum(case((Message.is_read == False, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Message.is_replied == True, 1), else_=0)), 0),
+    ).one()
+    return {'total': int(total), 'unread': int(unread), 'replied': int(replied)}
+
+
+def _publish(counters):
+    """替换缓存；数值有变化时唤醒等待者（调用方持有 _condition）"""
+    global _counters, _loaded_at
+    if counters != _counters:
+        _condition.notify_all()
+    _counters = counters
+    _loaded_at = time.monotonic()
+
+
+def _expired():
+    return _counters is None or time.monotonic() - _loaded_at > settings.MESSAGE_STATS_TTL
+
+
+def counters_tag(counters):
+    return f"{counters['total']}-{counters['unread']}-{counters['replied']}"
+
+
+def get_counters(db=None):
+    """返回计数字典；缓存过期时重新聚合"""
+    with _condition:
+        if not _expired():
+            return dict(_counters)
+    if db is None:
+        db = SessionLocal()
+        try:
+            counters = _compute(db)
+        finally:
+            db.close()
+    else:
+        counters = _compute(db)
+    with _condition:
+        _publish(counters)
+        return dict(_counters)
+
+
+def apply_delta(total=0, unread=0, replied=0):
+    """在缓存上增量修改计数（须在对应事务提交后调用）；缓存为空时等下次读取再聚合"""
+    if not (total or unread or replied):
+        return
+    with _condition:
+        if _counters is None:
+            return
+        counters = dict(_counters)
+        counters['total'] += total
+        counters['unread'] += unread
+        counters['replied'] += replied
+        _publish(counters)
+
+
+def invalidate():
+    """无法得知增量（如批量删除）时丢弃缓存，下次读取重新聚合并通知等待者"""
+    global _loaded_at
+    with _condition:
+        _loaded_at = 0.0
+        _condition.notify_all()
+
+
+def wait_for_change(since_tag, timeout):
+    """
+    阻塞直到计数标签不同于 since_tag 或超时，返回计数字典。
+    等待期间缓存过期时会重新聚合，因此其他 worker 的改动最多延迟一个 TTL 也能被发现。
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        counters = get_counters()
+        remaining = deadline - time.monotonic()
+        if counters_tag(counters) != since_tag or remaining <= 0:
+            return counters
+        with _condition:
+            if _counters == counters and not _expired():
+                _condition.wait(min(remaining, settings.MESSAGE_STATS_TTL))
+
+
+def to_payload(counters):
+    """接口返回的统计结构"""
+    return {
+        'total': counters['total'],
+        'unread': counters['unread'],
+        'replied': counters['replied'],
+        'unreplied': counters['total'] - counters['replied'],
+        'tag': counters_tag(counters),
+    }
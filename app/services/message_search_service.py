@@ -0,0 +1,187 @@
+# 文件路径: app/services/message_search_service.py
+
+import html
+import json
+import re
+
+from sqlalchemy import text, func, literal_column, or_, table, column
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.models import Message
+
+# 当前可用的全文检索后端：'sqlite'（FTS5）、'postgresql'（tsvector + GIN）或 None（退回 LIKE）
+_backend = None
+# SQLite 使用 trigram 分词时，检索词至少需要 3 个字符
+_min_term_length = 1
+
+# FTS5 虚拟表（rowid 即 messages.id）
+messages_fts = table('messages_fts', column('rowid'))
+# 'simple' 分词不切分中文，含中文的检索词在 PostgreSQL 上退回子串匹配
+_CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+# 数据库生成片段时先用私有区字符标出关键字，转义留言内容后再替换成 <mark>，
+# 避免片段中夹带未转义的用户 HTML
+_SENTINEL_START = '\ue000'
+_SENTINEL_END = '\ue001'
+
+_SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, name, email, subject, content)
+        VALUES (new.id, new.name, new.email, new.subject, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, name, email, subject, content)
+        VALUES ('delete', old.id, old.name, old.email, old.subject, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF name, email, subject, content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, name, email, subject, content)
+        VALUES ('delete', old.id, old.name, old.email, old.subject, old.content);
+        INSERT INTO messages_fts(rowid, name, email, subject, content)
+        VALUES (new.id, new.name, new.email, new.subject, new.content);
+    END
+    """,
+]
+
+_POSTGRES_STATEMENTS = [
+    # 生成列由数据库在插入/更新时自动维护
+    """
+    ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(email, '') || ' ' ||
+                              coalesce(subject, '') || ' ' || coalesce(content, ''))
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+
+
+def _setup_sqlite(conn):
+    global _min_term_length
+    existing = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'")).scalar()
+    if existing is None:
+        # 外部内容表：索引数据来自 messages，由触发器同步；trigram 分词支持中文子串检索
+        try:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5("
+                "name, email, subject, content, content='messages', content_rowid='id', tokenize='trigram')"
+            ))
+        except SQLAlchemyError:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5("
+                "name, email, subject, content, content='messages', content_rowid='id')"
+            ))
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+        existing = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'")).scalar()
+    for trigger in _SQLITE_TRIGGERS:
+        conn.execute(text(trigger))
+    _min_term_length = 3 if 'trigram' in existing else 1
+
+
+def setup_message_search(engine):
+    """创建全文索引及其同步机制（幂等）；数据库不支持时退回 LIKE 检索"""
+    global _backend
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == 'sqlite':
+                _setup_sqlite(conn)
+            elif dialect == 'postgresql':
+                for statement in _POSTGRES_STATEMENTS:
+                    conn.execute(text(statement))
+            else:
+                return
+        _backend = dialect
+    except SQLAlchemyError as e:
+        print(f"全文检索初始化失败，留言搜索将使用LIKE: {e}")
+        _backend = None
+
+
+def _fts5_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _uses_sqlite_fts(term):
+    return _backend == 'sqlite' and len(term) >= _min_term_length
+
+
+def _uses_postgres_fts(term):
+    return _backend == 'postgresql' and not _CJK_PATTERN.search(term)
+
+
+def _like_condition(model, term):
+    return or_(
+        model.name.contains(term),
+        model.email.contains(term),
+        model.subject.contains(term),
+        model.content.contains(term),
+    )
+
+
+def apply_message_search(query, term, model=Message):
+    """
+    给留言查询加上检索条件，返回 (query, rank)：
+    rank 为可用于排序的相关度表达式（越相关越靠前，按升序排列），LIKE 模式下为 None。
+    model 为归档表时没有全文索引，直接使用子串匹配。
+    """
+    term = term.strip()
+    if model is not Message:
+        return query.filter(_like_condition(model, term)), None
+
+    if _uses_sqlite_fts(term):
+        query = (query.join(messages_fts, messages_fts.c.rowid == Message.id)
+                 .filter(text('messages_fts MATCH :fts_query'))
+                 .params(fts_query=_fts5_phrase(term)))
+        # FTS5 的 rank 即 bm25 分数，越小越相关
+        return query, literal_column('messages_fts.rank')
+
+    if _uses_postgres_fts(term):
+        tsquery = func.websearch_to_tsquery('simple', term)
+        vector = literal_column('messages.search_vector')
+        return query.filter(vector.op('@@')(tsquery)), -func.ts_rank(vector, tsquery)
+
+    # 检索词过短或没有全文索引时退回子串匹配
+    return query.filter(_like_condition(Message, term)), None
+
+
+def _mark_snippet(raw):
+    """HTML 转义片段（截断处残留的半个标签也只是文本），再把标记字符换成 <mark>"""
+    if raw is None:
+        return None
+    escaped = html.escape(raw)
+    return escaped.replace(_SENTINEL_START, SNIPPET_START).replace(_SENTINEL_END, SNIPPET_END)
+
+
+def fetch_snippets(db, term, ids):
+    """
+    只为当前页的留言生成命中片段，返回 {id: snippet}：片段已做 HTML 转义，只有关键字外的 <mark> 是标签。
+    片段生成开销较大，放在分页之后单独查询，避免对所有命中行计算。
+    """
+    term = term.strip()
+    if not ids:
+        return {}
+    if _uses_sqlite_fts(term):
+        rows = db.execute(
+            text(
+                "SELECT rowid, snippet(messages_fts, -1, :start, :end, '…', 16) FROM messages_fts "
+                "WHERE messages_fts MATCH :fts_query AND rowid IN (SELECT value FROM json_each(:ids))"
+            ),
+            {'start': _SENTINEL_START, 'end': _SENTINEL_END, 'fts_query': _fts5_phrase(term),
+             'ids': json.dumps(ids)},
+        )
+        return {row_id: _mark_snippet(raw) for row_id, raw in rows.all()}
+    if _uses_postgres_fts(term):
+        tsquery = func.websearch_to_tsquery('simple', term)
+        snippet = func.ts_headline(
+            'simple', Message.content, tsquery,
+            f'StartSel={_SENTINEL_START}, StopSel={_SENTINEL_END}, MaxWords=24, MinWords=8'
+        )
+        rows = db.query(Message.id, snippet).filter(Message.id.in_(ids)).all()
+        return {row_id: _mark_snippet(raw) for row_id, raw in rows}
+    return {}
@@ -0,0 +1,194 @@
+# 文件路径: app/services/retention_service.py
+
+"""
+反馈/留言的保留策略（冷热分层）。
+
+超过保留天数且已处理（反馈已读；留言已读且已回复）的记录按批从 feedback / messages
+迁入 feedback_archive / messages_archive：每批在一个事务中 INSERT ... SELECT 后删除原行，
+热表只保留近期数据，列表、统计默认只查热表，需要时通过 archive 参数检索归档表。
+全部批次完成后执行一次整理（SQLite: FTS optimize + VACUUM；PostgreSQL: VACUUM ANALYZE）。
+每个 worker 都有归档线程，但每轮先抢一把跨进程锁，抢不到的进程跳过本轮。
+
+手动执行: python -m app.services.retention_service
+"""
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from sqlalchemy import and_, delete, insert, literal, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models import Feedback, FeedbackArchive, Message, MessageArchive, china_now
+from app.services import feedback_stats_service, message_counter_service
+
+_run_lock = threading.Lock()
+_worker_pid = None
+
+# pg_try_advisory_lock 的键，与迁移锁不同
+RETENTION_LOCK_KEY = 0x726574656E74
+
+# 最近一次执行的结果，供监控接口查看
+status = {'running': False, 'last_started_at': None, 'last_finished_at': None, 'last_result': None, 'last_error': None}
+
+
+def _feedback_condition(cutoff):
+    return and_(Feedback.is_read == True, Feedback.timestamp < cutoff)
+
+
+def _message_condition(cutoff):
+    return and_(Message.is_read == True, Message.is_replied == True, Message.created_at < cutoff)
+
+
+def _archive_batch(db, model, archive_model, condition, delete_rows=None):
+    """迁移一批记录，返回迁移行数；同一事务内完成复制与删除"""
+    ids = [row_id for (row_id,) in db.query(model.id).filter(condition)
+           .order_by(model.id).limit(settings.RETENTION_BATCH_SIZE)]
+    if not ids:
+        return 0
+    names = [c.name for c in model.__table__.columns]
+    source = select(*[model.__table__.c[name] for name in names], literal(china_now()))
+    db.execute(insert(archive_model.__table__).from_select(
+        names + ['archived_at'], source.where(model.id.in_(ids))
+    ))
+    if delete_rows:
+        delete_rows(db, model.id.in_(ids))
+    else:
+        db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+    db.commit()
+    return len(ids)
+
+
+def _archive(model, archive_model, condition, delete_rows=None):
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            moved = _archive_batch(db, model, archive_model, condition, delete_rows)
+            total += moved
+            if moved < settings.RETENTION_BATCH_SIZE:
+                return total
+            # 批次之间让出数据库，避免长时间占用写锁
+            time.sleep(settings.RETENTION_BATCH_PAUSE)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def compact():
+    """归档后整理存储空间并更新统计信息"""
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        with engine.begin() as conn:
+            has_fts = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'")).scalar()
+            if has_fts:
+                conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')"))
+        if settings.RETENTION_VACUUM:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text('VACUUM'))
+    elif dialect == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for table in ('feedback', 'messages', 'feedback_archive', 'messages_archive'):
+                conn.execute(text(f'VACUUM (ANALYZE) {table}'))
+
+
+@contextmanager
+def _cross_process_lock():
+    """
+    非阻塞地获取跨进程锁，产出是否拿到。PostgreSQL 用会话级咨询锁（多台机器共用一个库时也有效），
+    其他数据库用本机文件锁（SQLite 的 worker 本来就在同一台机器上）。
+    """
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            acquired = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': RETENTION_LOCK_KEY}).scalar()
+            conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': RETENTION_LOCK_KEY})
+                    conn.commit()
+        return
+    with open(settings.RETENTION_LOCK_FILE, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def run_retention():
+    """执行一轮归档，返回 {'feedback': 行数, 'messages': 行数}；本进程或其他进程已有一轮在执行时返回 None"""
+    if not _run_lock.acquire(blocking=False):
+        return None
+    try:
+        with _cross_process_lock() as acquired:
+            if not acquired:
+                return None
+            return _run_retention()
+    finally:
+        _run_lock.release()
+
+
+def _run_retention():
+    status.update(running=True, last_started_at=china_now().isoformat(), last_error=None)
+    try:
+        now = china_now()
+        result = {
+            'feedback': _archive(Feedback, FeedbackArchive,
+                                 _feedback_condition(now - timedelta(days=settings.FEEDBACK_RETENTION_DAYS)),
+                                 feedback_stats_service.delete_feedback),
+            'messages': _archive(Message, MessageArchive,
+                                 _message_condition(now - timedelta(days=settings.MESSAGE_RETENTION_DAYS))),
+        }
+        if result['messages']:
+            message_counter_service.invalidate()
+        if result['feedback'] or result['messages']:
+            compact()
+        status['last_result'] = result
+        return result
+    except SQLAlchemyError as e:
+        status['last_error'] = str(e)
+        print(f"归档历史数据失败: {e}")
+        return None
+    finally:
+        status.update(running=False, last_finished_at=china_now().isoformat())
+
+
+def _worker():
+    time.sleep(settings.RETENTION_START_DELAY)
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            print(f"归档任务出错: {e}")
+        time.sleep(settings.RETENTION_INTERVAL_HOURS * 3600)
+
+
+def start_retention_worker():
+    """
+    启动后台归档线程（每个进程一个）。RETENTION_ENABLED 为 true 时应用工厂把它注册为 before_request，
+    每个 worker 在处理第一个请求时启动，之后的调用直接返回。各线程每轮抢同一把跨进程锁，只有一个真正执行。
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    threading.Thread(target=_worker, name='retention', daemon=True).start()
+
+
+if __name__ == '__main__':
+    from app.database import init_db
+    init_db()
+    print(run_retention())
@@ -0,0 +1,146 @@
+# 文件路径: app/services/upload_service.py
+
+import os
+import tempfile
+
+from app.config import settings
+
+# pandas 与 openpyxl 在首次解析上传文件时才导入，加快应用启动
+
+# 每次从上传流中复制的块大小
+COPY_CHUNK_SIZE = 64 * 1024
+
+CSV_EXTENSIONS = ('.csv', '.txt')
+# 旧版 Excel 格式，openpyxl 不支持，需要安装可选依赖 xlrd
+LEGACY_EXCEL_EXTENSIONS = ('.xls',)
+
+
+class UploadError(ValueError):
+    """上传文件不符合限制（大小、行数、格式）时抛出，status_code 供路由直接返回"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def spool_upload(file_storage, max_bytes=None, threshold=None):
+    """
+    将上传文件按块复制到 SpooledTemporaryFile 中：
+    小文件留在内存，超过 threshold 后自动落盘；超过 max_bytes 立即中止。
+    """
+    max_bytes = max_bytes or settings.MAX_UPLOAD_BYTES
+    threshold = threshold or settings.UPLOAD_SPOOL_THRESHOLD
+
+    spool = tempfile.SpooledTemporaryFile(max_size=threshold)
+    written = 0
+    try:
+        while True:
+            chunk = file_storage.stream.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadError(f'上传文件超过大小限制 ({max_bytes // (1024 * 1024)}MB)', 413)
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        # 原始上传流不再需要，尽早释放
+        file_storage.close()
+
+    spool.seek(0)
+    return spool
+
+
+def _check_rows(count, max_rows):
+    if count > max_rows:
+        raise UploadError(f'数据行数超过限制 ({max_rows} 行)', 413)
+
+
+def _read_csv(spool, usecols, max_rows):
+    """按批读取CSV，每读完一批就检查行数限制"""
+    import pandas as pd
+
+    chunks = []
+    total = 0
+    reader = pd.read_csv(
+        spool,
+        chunksize=settings.CSV_CHUNK_ROWS,
+        usecols=(lambda c: c in usecols) if usecols else None,
+    )
+    with reader:
+        for chunk in reader:
+            total += len(chunk)
+            _check_rows(total, max_rows)
+            chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame(columns=list(usecols or []))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _read_excel(spool, usecols, max_rows):
+    """以只读模式逐行读取第一个工作表，只保留需要的列"""
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    wb = load_workbook(spool, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame(columns=list(usecols or []))
+
+        keep = [i for i, name in enumerate(header)
+                if name is not None and (not usecols or name in usecols)]
+        columns = [header[i] for i in keep]
+
+        data = []
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            data.append([row[i] if i < len(row) else None for i in keep])
+            _check_rows(len(data), max_rows)
+    finally:
+        wb.close()
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def _read_legacy_excel(spool, usecols, max_rows):
+    """读取 .xls 文件（xlrd 不支持逐行读取，整表读入后再检查行数）"""
+    import pandas as pd
+    try:
+        import xlrd  # noqa: F401  xlrd 是可选依赖
+    except ImportError:
+        raise UploadError('不支持 .xls 格式，请另存为 .xlsx 或 .csv 后上传')
+
+    df = pd.read_excel(spool, engine='xlrd', usecols=(lambda c: c in usecols) if usecols else None)
+    _check_rows(len(df), max_rows)
+    return df
+
+
+def read_table(file_storage, usecols=None, max_rows=None):
+    """
+    读取上传的 Excel/CSV 文件为 DataFrame（.xls 需要安装 xlrd，未安装时返回 400）。
+    - 文件先被转存（超过阈值落盘），并在读取过程中检查大小与行数限制。
+    - usecols 指定需要的列名，文件中不存在的列会被忽略，由调用方自行校验。
+    """
+    max_rows = max_rows or settings.MAX_UPLOAD_ROWS
+    usecols = set(usecols) if usecols else None
+    ext = os.path.splitext(file_storage.filename or '')[1].lower()
+
+    spool = spool_upload(file_storage)
+    try:
+        if ext in CSV_EXTENSIONS:
+            return _read_csv(spool, usecols, max_rows)
+        if ext in LEGACY_EXCEL_EXTENSIONS:
+            return _read_legacy_excel(spool, usecols, max_rows)
+        return _read_excel(spool, usecols, max_rows)
+    except UploadError:
+        raise
+    except Exception as e:
+        raise UploadError(f'无法解析上传的表格文件: {e}')
+    finally:
+        spool.close()
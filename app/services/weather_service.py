@@ -1,17 +1,107 @@
 import requests
 import datetime
+import threading
 import time
-from cachetools import TTLCache
+import functools
+from cachetools import LRUCache
+from requests.adapters import HTTPAdapter
+from app import metrics
 from app.config import settings
 
-# --- 缓存设置 ---
-weather_cache = TTLCache(maxsize=128, ttl=900)
-history_cache = TTLCache(maxsize=256, ttl=21600)
+# --- 缓存设置（命中/未命中/淘汰次数见 /metrics） ---
+weather_cache = metrics.InstrumentedTTLCache('weather_cache', maxsize=128, ttl=900)
+history_cache = metrics.InstrumentedTTLCache('history_cache', maxsize=256, ttl=21600)
+# 缓存数据的写入时间：id(数据) -> (数据, 时间戳)，HTTP 层据此计算 Last-Modified 与剩余的 max-age。
+# 同时持有数据本身，保证 id 在条目存在期间不会被新对象复用
+_stored_at = LRUCache(maxsize=weather_cache.maxsize + history_cache.maxsize)
+_stored_at_lock = threading.Lock()
 
 # 使用 requests.Session() 可以复用TCP连接，提升性能
 session = requests.Session()
+# 连接池按并发量放大（默认每个主机只保留10个连接，gevent 下并发请求多时会频繁新建连接）
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=settings.WEATHER_HTTP_POOL_SIZE)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+# 每次上游调用按接口路径记录耗时
+session.hooks['response'].append(metrics.upstream_hook())
 
 
+class _Call:
+    """一次进行中的上游调用，等待者共享它的结果或异常"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flights:
+    """按缓存键合并并发调用：同一个键同时只有一个请求（领头者）访问上游，其余请求等它结束后直接拿它的结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # 键 -> 进行中的 _Call
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            # 上游失败时领头者返回 None（或抛出异常），等待者拿到同样的结果，不再逐个重试
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_flights = _Flights()
+
+
+def _single_flight(key_func):
+    """
+    同一缓存键的并发请求合并为一次上游调用：后到的请求等待进行中的调用结束，
+    共享它的返回值（包括失败时的 None 或异常），而不是各自再请求一次上游。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            return _flights.do(key_func(*args), func, *args)
+        return wrapper
+    return decorator
+
+
+def _store(cache, key, value):
+    """写入缓存并记录写入时间"""
+    cache[key] = value
+    with _stored_at_lock:
+        _stored_at[id(value)] = (value, time.time())
+
+
+def stored_at(value):
+    """返回缓存数据写入缓存的时间戳，未记录时返回 None"""
+    with _stored_at_lock:
+        item = _stored_at.get(id(value))
+    return item[1] if item is not None and item[0] is value else None
+
+
+def _get(url, params):
+    return session.get(url, params=params, timeout=settings.WEATHER_HTTP_TIMEOUT)
+
+
+@_single_flight(lambda city: f"coords_{city}")
 def _get_coords_for_city(city: str) -> dict | None:
     """内部使用的函数，将城市名转换为经纬度，并带缓存"""
     cache_key = f"coords_{city}"
@@ -21,7 +111,7 @@ def _get_coords_for_city(city: str) -> dict | None:
     GEO_URL = "http://api.openweathermap.org/geo/1.0/direct"
     geo_params = {'q': city, 'limit': 1, 'appid': settings.API_KEY}
     try:
-        res = session.get(GEO_URL, params=geo_params)
+        res = _get(GEO_URL, geo_params)
         res.raise_for_status()
         geo_data = res.json()
         if not geo_data:
@@ -35,6 +125,7 @@ def _get_coords_for_city(city: str) -> dict | None:
         return None
 
 
+@_single_flight(lambda city: f"bundle_{city}")
 def get_realtime_weather_bundle(city: str) -> dict | None:
     """获取“实时天气”页面所需的数据包"""
     bundle_cache_key = f"bundle_{city}"
@@ -51,13 +142,13 @@ def get_realtime_weather_bundle(city: str) -> dict | None:
 
     try:
         print(f"从API获取 {city} 的新实时天气数据包...")
-        current_res = session.get(f"{BASE_URL}/weather", params=params)
+        current_res = _get(f"{BASE_URL}/weather", params)
         current_res.raise_for_status()
 
-        forecast_res = session.get(f"{BASE_URL}/forecast", params=params)
+        forecast_res = _get(f"{BASE_URL}/forecast", params)
         forecast_res.raise_for_status()
 
-        air_res = session.get(f"{BASE_URL}/air_pollution", params=params)
+        air_res = _get(f"{BASE_URL}/air_pollution", params)
         air_res.raise_for_status()
 
         result = {
@@ -65,13 +156,14 @@ def get_realtime_weather_bundle(city: str) -> dict | None:
             "forecast": forecast_res.json(),
             "air_quality": air_res.json()
         }
-        weather_cache[bundle_cache_key] = result
+        _store(weather_cache, bundle_cache_key, result)
         return result
     except requests.exceptions.RequestException as e:
         print(f"请求实时天气数据包失败: {e}")
         return None
 
 
+@_single_flight(lambda city, date_str: f"history_{city}_{date_str}")
 def get_historical_weather(city: str, date_str: str) -> dict | None:
     """获取指定城市在过去某一日期的24小时历史天气数据。"""
     cache_key = f"history_{city}_{date_str}"
@@ -105,16 +197,17 @@ def get_historical_weather(city: str, date_str: str) -> dict | None:
 
     try:
         print(f"从正确的API({HISTORY_URL})获取 {city} 在 {date_str} 的历史天气...")
-        res = session.get(HISTORY_URL, params=params)
+        res = _get(HISTORY_URL, params)
         res.raise_for_status()
         data = res.json()
-        history_cache[cache_key] = data
+        _store(history_cache, cache_key, data)
         return data
     except requests.exceptions.RequestException as e:
         print(f"请求历史天气失败: {e}")
         return None
 
 
+@_single_flight(lambda city: f"forecast30_{city}")
 def get_30_day_forecast(city: str) -> dict | None:
     """获取指定城市的30天预报数据"""
     cache_key = f"forecast30_{city}"
@@ -136,20 +229,21 @@ def get_30_day_forecast(city: str) -> dict | None:
 
     try:
         print(f"从API获取 {city} 的30天预报...")
-        res = session.get(FORECAST_URL, params=params)
+        res = _get(FORECAST_URL, params)
         res.raise_for_status()
         data = res.json()
-        weather_cache[cache_key] = data
+        _store(weather_cache, cache_key, data)
         return data
     except requests.exceptions.RequestException as e:
         print(f"请求30天预报失败: {e}")
         return None
 
 
+@functools.lru_cache(maxsize=1)
 def get_map_layer_urls() -> dict:
     """
     构建并返回各种天气图层的URL模板。
-    这些URL将由前端的地图库使用。
+    这些URL将由前端的地图库使用。结果只与API密钥有关，构建一次后复用。
     """
     BASE_MAP_URL_TEMPLATE = "https://maps.openweathermap.org/maps/2.0/weather/{op}/{z}/{x}/{y}?appid={api_key}"
 
@@ -0,0 +1,290 @@
+# 文件路径: app/services/write_behind_service.py
+
+"""
+反馈/留言的缓冲写入（write-behind）。
+
+提交的记录先追加到本地 spool 文件（每个进程一个），再由后台线程按数量或时间批量写入数据库：
+- 每次刷新时把当前 spool 文件轮转为 segment 文件，逐个 segment 批量插入，提交成功后才删除该文件；
+  数据库不可用（连接失败、锁超时等）时 segment 保留在磁盘上，下次刷新重试。
+- 提交时先按表结构校验字段类型与长度；仍被数据库拒绝的 segment 改为逐行插入，
+  写不进去的行连同错误信息移到 spool 目录下的 dead-letter/，不会堵住后面的 segment。
+- 每条记录带有 client_id（表上有唯一索引），插入前过滤掉已入库的 client_id，
+  因此"已提交但未删除 segment"时崩溃，重放也不会产生重复数据。
+- 进程启动时会接管已退出进程遗留的 spool/segment 文件。
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Feedback, Message, china_now
+from app.services import feedback_stats_service, message_counter_service
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    """单个表的缓冲写入队列"""
+
+    def __init__(self, name, model, datetime_fields=(), after_insert=None, after_commit=None):
+        self.name = name
+        self.model = model
+        self.datetime_fields = datetime_fields
+        # after_insert(db, rows) 在插入的同一事务中调用；after_commit(rows) 在提交成功后调用
+        self.after_insert = after_insert
+        self.after_commit = after_commit
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._spool = None
+        self._pending = 0
+        self._seq = 0
+
+    # --- 文件路径 ---
+    def _spool_path(self, pid=None):
+        return os.path.join(settings.WRITE_BEHIND_SPOOL_DIR, f'{self.name}-{pid or os.getpid()}.spool')
+
+    def _segment_path(self):
+        while True:
+            self._seq += 1
+            path = os.path.join(settings.WRITE_BEHIND_SPOOL_DIR,
+                                f'{self.name}-{os.getpid()}-{self._seq:08d}.segment')
+            if not os.path.exists(path):
+                return path
+
+    def _own_segments(self):
+        return sorted(glob.glob(os.path.join(settings.WRITE_BEHIND_SPOOL_DIR, f'{self.name}-{os.getpid()}-*.segment')))
+
+    # --- 启动与接管 ---
+    def _ensure_started(self):
+        """首次提交时（或 fork 出新的 worker 后）启动后台刷新线程"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(settings.WRITE_BEHIND_SPOOL_DIR, exist_ok=True)
+            self._pid = os.getpid()
+            self._seq = 0
+            self._pending = 0
+            # 同一 PID 的旧进程（如容器重启后）留下的 spool 先转为 segment
+            if os.path.exists(self._spool_path()):
+                os.rename(self._spool_path(), self._segment_path())
+            self._spool = open(self._spool_path(), 'a', encoding='utf-8')
+            self._adopt_orphans()
+            threading.Thread(target=self._run, name=f'write-behind-{self.name}', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _adopt_orphans(self):
+        """把已退出进程遗留的文件改名为本进程的 segment（rename 是原子的，只会被一个进程接管）"""
+        pattern = os.path.join(settings.WRITE_BEHIND_SPOOL_DIR, f'{self.name}-*')
+        for path in sorted(glob.glob(pattern)):
+            try:
+                pid = int(os.path.basename(path)[len(self.name) + 1:].split('-')[0].split('.')[0])
+            except ValueError:
+                continue
+            if pid == os.getpid() or _pid_alive(pid):
+                continue
+            try:
+                os.rename(path, self._segment_path())
+            except OSError:
+                pass
+
+    # --- 提交 ---
+    def _validate(self, row):
+        """按表结构校验字段类型、长度与必填项，写不进数据库的记录不进入 spool；不合法时抛出 ValueError"""
+        for column in self.model.__table__.columns:
+            value = row.get(column.name)
+            if value is None:
+                if not column.nullable and column.default is None and not column.primary_key:
+                    raise ValueError(f'缺少字段: {column.name}')
+                continue
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                continue
+            # JSON 列只要求能序列化，由 submit 中的 json.dumps 检查
+            if python_type in (dict, list):
+                continue
+            if not isinstance(value, python_type) or (python_type is int and isinstance(value, bool)):
+                raise ValueError(f'字段类型错误: {column.name}')
+            length = getattr(column.type, 'length', None)
+            if length and len(value) > length:
+                raise ValueError(f'字段过长: {column.name}（最多 {length} 个字符）')
+
+    def submit(self, row):
+        """
+        追加一条记录到 spool 文件，返回 client_id；达到批量大小时唤醒刷新线程。
+        字段不符合表结构时抛出 ValueError。
+        """
+        self._validate(row)
+        self._ensure_started()
+        row = {**row, 'client_id': uuid.uuid4().hex}
+        line = json.dumps(row, ensure_ascii=False, default=lambda v: v.isoformat()) + '\n'
+        with self._lock:
+            self._spool.write(line)
+            self._spool.flush()
+            if settings.WRITE_BEHIND_FSYNC:
+                os.fsync(self._spool.fileno())
+            self._pending += 1
+            pending = self._pending
+        if pending >= settings.WRITE_BEHIND_BATCH_SIZE:
+            self._wakeup.set()
+        return row['client_id']
+
+    # --- 刷新 ---
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.WRITE_BEHIND_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"缓冲写入 {self.name} 刷新失败: {e}")
+
+    def _rotate(self):
+        """把当前 spool 文件轮转为 segment，之后的提交写入新的 spool 文件"""
+        with self._lock:
+            if self._pid != os.getpid() or self._pending == 0:
+                return
+            self._spool.close()
+            os.rename(self._spool_path(), self._segment_path())
+            self._spool = open(self._spool_path(), 'a', encoding='utf-8')
+            self._pending = 0
+
+    def _load(self, path):
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时可能留下写了一半的最后一行
+                    continue
+                for field in self.datetime_fields:
+                    if row.get(field):
+                        row[field] = datetime.fromisoformat(row[field])
+                rows.append(row)
+        return rows
+
+    def _dead_letter_path(self, path):
+        directory = os.path.join(settings.WRITE_BEHIND_SPOOL_DIR, 'dead-letter')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, os.path.basename(path) + '.jsonl')
+
+    def _insert(self, rows):
+        """在一个事务中插入 rows（跳过已入库的 client_id），返回实际插入的行"""
+        db = SessionLocal()
+        try:
+            if rows:
+                client_ids = [row['client_id'] for row in rows]
+                existing = {cid for (cid,) in db.query(self.model.client_id)
+                            .filter(self.model.client_id.in_(client_ids)).all()}
+                rows = [row for row in rows if row['client_id'] not in existing]
+            if rows:
+                db.execute(self.model.__table__.insert(), rows)
+                if self.after_insert:
+                    self.after_insert(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if rows and self.after_commit:
+            self.after_commit(rows)
+        return rows
+
+    def _insert_segment(self, path):
+        """
+        插入一个 segment 并删除该文件，返回插入行数。
+        数据库不可用时抛出 OperationalError、文件保留；其他数据库错误（超长、违反约束等）时改为逐行插入，
+        失败的行写入 dead-letter 文件。逐行插入中途断开也没关系，重放时已入库的 client_id 会被跳过。
+        """
+        rows = self._load(path)
+        try:
+            inserted = len(self._insert(rows))
+        except OperationalError:
+            raise
+        except SQLAlchemyError as e:
+            print(f"缓冲写入 {self.name} 批量插入 {os.path.basename(path)} 失败，改为逐行插入: {e}")
+            inserted = 0
+            rejected = []
+            for row in rows:
+                try:
+                    inserted += len(self._insert([row]))
+                except OperationalError:
+                    raise
+                except SQLAlchemyError as row_error:
+                    rejected.append({'row': row, 'error': str(row_error)})
+            if rejected:
+                dead_path = self._dead_letter_path(path)
+                with open(dead_path, 'a', encoding='utf-8') as f:
+                    for item in rejected:
+                        f.write(json.dumps(item, ensure_ascii=False, default=lambda v: v.isoformat()) + '\n')
+                print(f"缓冲写入 {self.name} 有 {len(rejected)} 条记录无法入库，已移至 {dead_path}")
+        os.remove(path)
+        return inserted
+
+    def flush(self):
+        """把所有已提交的记录写入数据库，返回本次插入的行数；某个 segment 出错时跳过它，继续处理后面的"""
+        if self._pid != os.getpid():
+            return 0
+        with self._flush_lock:
+            self._rotate()
+            inserted = 0
+            for path in self._own_segments():
+                try:
+                    inserted += self._insert_segment(path)
+                except OperationalError as e:
+                    # 数据库不可用，后面的 segment 也写不进去，等下次刷新
+                    print(f"缓冲写入 {self.name} 刷新失败，稍后重试: {e}")
+                    break
+                except Exception as e:
+                    print(f"缓冲写入 {self.name} 处理 {os.path.basename(path)} 失败，稍后重试: {e}")
+            return inserted
+
+
+def _after_feedback_insert(db, rows):
+    feedback_stats_service.record_rating_changes(db, Counter(row['rating'] for row in rows))
+
+
+feedback_queue = WriteBehindQueue('feedback', Feedback, ('timestamp', 'created_at'), _after_feedback_insert)
+def _after_message_commit(rows):
+    message_counter_service.apply_delta(total=len(rows), unread=len(rows))
+
+
+message_queue = WriteBehindQueue('messages', Message, ('created_at',), after_commit=_after_message_commit)
+
+
+def enqueue_feedback(row):
+    """缓冲提交一条反馈，返回 (client_id, 提交时间)"""
+    now = china_now()
+    return feedback_queue.submit({**row, 'timestamp': now, 'created_at': now, 'is_read': False}), now
+
+
+def enqueue_message(row):
+    """缓冲提交一条留言，返回 (client_id, 提交时间)"""
+    now = china_now()
+    return message_queue.submit({**row, 'created_at': now, 'is_read': False, 'is_replied': False}), now
@@ -1,29 +1,40 @@
-import os
-import hashlib
+import functools
 from flask import Blueprint, request, jsonify
+from ..config import settings
+from ..services import admin_auth_service
 
 admin_bp = Blueprint('admin_auth', __name__)
 
-ADMIN_FILE = os.path.join(os.path.dirname(__file__), '../../admin_account.txt')
 
-# 读取所有管理员账户（每两行为一组：用户名+哈希密码）
-def get_all_admin_accounts():
-    if not os.path.exists(ADMIN_FILE):
-        return []
-    with open(ADMIN_FILE, 'r', encoding='utf-8') as f:
-        lines = f.read().splitlines()
-        accounts = []
-        for i in range(0, len(lines)-1, 2):
-            accounts.append((lines[i], lines[i+1]))
-        return accounts
+def _request_token():
+    """只从 Authorization: Bearer 头读取令牌（查询参数会出现在访问日志和浏览器历史中）"""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[7:].strip()
+    return None
+
+
+def admin_required(view):
+    """管理接口装饰器：只做令牌签名校验（带缓存），不读账户文件、不计算密码哈希"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if settings.ADMIN_AUTH_REQUIRED and not admin_auth_service.verify_token(_request_token()):
+            return jsonify({'success': False, 'msg': '未登录或登录已过期'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
 
 @admin_bp.route('/api/admin-login', methods=['POST'])
 def admin_login():
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
-    accounts = get_all_admin_accounts()
-    for user, pwd_hash in accounts:
-        if username == user and hashlib.sha256(password.encode()).hexdigest() == pwd_hash:
-            return jsonify({'success': True})
-    return jsonify({'success': False, 'msg': '账号或密码错误'}), 401 
\ No newline at end of file
+    ip = request.remote_addr or ''
+    wait = admin_auth_service.retry_after(ip)
+    if wait:
+        response = jsonify({'success': False, 'msg': f'登录失败次数过多，请 {wait} 秒后再试'})
+        response.headers['Retry-After'] = str(wait)
+        return response, 429
+    data = request.get_json(silent=True) or {}
+    result = admin_auth_service.authenticate(data.get('username'), data.get('password'), ip)
+    if result:
+        token, expires_in = result
+        return jsonify({'success': True, 'token': token, 'expires_in': expires_in})
+    return jsonify({'success': False, 'msg': '账号或密码错误'}), 401
\ No newline at end of file
@@ -1,31 +1,61 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import Feedback
+from ..database import get_session, SessionLocal
+from ..models import Feedback, FeedbackArchive, format_china_time
+from ..pagination import keyset_page, iter_keyset_batches, clamp_per_page, cached_count
+from ..services import bulk_service, feedback_stats_service, write_behind_service
+from ..config import settings
+from ..serialization import dumps, json_response
+from .admin_auth import admin_required
 
 feedback_bp = Blueprint('feedback', __name__, url_prefix='/api/feedback')
 
+def _export_feedback(fmt):
+    """
+    分批读取全部反馈并逐块输出，内存占用与反馈总数无关。
+    响应头已经发出后无法再改状态码，中途出错时在流末尾写入错误标记：
+    JSON 格式关闭数组后加 "error" 字段，NDJSON 格式最后一行为 {"error": ...}
+    """
+    db = SessionLocal()
+    total = 0
+    try:
+        query = db.query(*Feedback.list_columns())
+        batches = iter_keyset_batches(query, Feedback.timestamp, Feedback.id)
+        if fmt == 'ndjson':
+            try:
+                for rows in batches:
+                    yield b''.join(dumps(item) + b'\n' for item in Feedback.rows_to_dicts(rows))
+            except Exception as e:
+                print(f"导出反馈列表时出错: {str(e)}")
+                yield dumps({'error': f'导出中断: {e}'}) + b'\n'
+            return
+
+        # 与原接口相同的JSON结构，只是分块发送
+        yield b'{"success": true, "data": {"feedback_list": ['
+        try:
+            for rows in batches:
+                chunk = b', '.join(dumps(item) for item in Feedback.rows_to_dicts(rows))
+                yield (b', ' if total else b'') + chunk
+                total += len(rows)
+        except Exception as e:
+            print(f"导出反馈列表时出错: {str(e)}")
+            yield f'], "total": {total}}}, "error": '.encode('ascii') + dumps(f'导出中断: {e}') + b'}'
+            return
+        yield f'], "total": {total}}}}}'.encode('ascii')
+    finally:
+        db.close()
+
 @feedback_bp.route('/', methods=['GET'])
+@admin_required
 def get_all_feedback():
-    """获取所有反馈（简单版本）"""
-    try:
-        db = next(get_db())
-        feedback_list = db.query(Feedback).order_by(Feedback.timestamp.desc()).all()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'feedback_list': [f.to_dict() for f in feedback_list],
-                'total': len(feedback_list)
-            }
-        })
-        
-    except Exception as e:
-        print(f"获取反馈列表时出错: {str(e)}")
-        return jsonify({
-            'success': False,
-            'message': '服务器内部错误'
-        }), 500
+    """
+    导出所有反馈（流式输出）
+    默认返回与原接口相同结构的JSON；?format=ndjson 时每行一条反馈
+    """
+    fmt = request.args.get('format', 'json')
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(_export_feedback(fmt), mimetype=mimetype)
 
 @feedback_bp.route('/submit', methods=['POST'])
 def submit_feedback():
@@ -59,9 +89,33 @@ def submit_feedback():
         
         # 获取请求信息
         ip_address = request.remote_addr
-        user_agent = request.headers.get('User-Agent', '')
+        # user_agent 列最长 500 个字符
+        user_agent = request.headers.get('User-Agent', '')[:500]
         device_info = data.get('deviceInfo', {})
         
+        if settings.WRITE_BEHIND_ENABLED:
+            # 缓冲写入：先落本地 spool，由后台线程批量入库，id 在入库后才会生成
+            try:
+                client_id, timestamp = write_behind_service.enqueue_feedback({
+                    'rating': rating,
+                    'suggestion': suggestion.strip(),
+                    'device_info': device_info,
+                    'ip_address': ip_address,
+                    'user_agent': user_agent,
+                })
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify({
+                'success': True,
+                'message': '反馈已受理',
+                'data': {
+                    'id': None,
+                    'client_id': client_id,
+                    'rating': rating,
+                    'timestamp': format_china_time(timestamp)
+                }
+            }), 202
+        
         # 创建反馈记录
         feedback = Feedback(
             rating=rating,
@@ -72,8 +126,9 @@ def submit_feedback():
         )
         
         # 保存到数据库
-        db = next(get_db())
+        db = get_session()
         db.add(feedback)
+        feedback_stats_service.record_rating_changes(db, {rating: 1})
         db.commit()
         db.refresh(feedback)
         
@@ -95,37 +150,31 @@ def submit_feedback():
         }), 500
 
 @feedback_bp.route('/stats', methods=['GET'])
+@admin_required
 def get_feedback_stats():
-    """获取反馈统计信息（管理员用）"""
+    """
+    获取反馈统计信息（管理员用）
+    总数、平均评分与评分分布只统计热表（feedback），已归档的反馈不计入，数量另见 archived_feedback
+    """
     try:
-        db = next(get_db())
-        
-        # 获取总反馈数
-        total_feedback = db.query(Feedback).count()
+        db = get_session()
         
-        # 获取平均评分
-        avg_rating = db.query(Feedback.rating).all()
-        if avg_rating:
-            avg_rating = sum([r[0] for r in avg_rating]) / len(avg_rating)
-        else:
-            avg_rating = 0
-        
-        # 获取评分分布
-        rating_distribution = {}
-        for i in range(1, 6):
-            count = db.query(Feedback).filter(Feedback.rating == i).count()
-            rating_distribution[f"{i}星"] = count
+        # 总数、平均评分与评分分布由一次聚合（或汇总表）得到
+        total_feedback, avg_rating, rating_distribution = feedback_stats_service.get_rating_stats(db)
+        archived_feedback = db.query(func.count(FeedbackArchive.id)).scalar()
         
         # 获取最近的反馈
-        recent_feedback = db.query(Feedback).order_by(Feedback.timestamp.desc()).limit(10).all()
+        recent_feedback = (db.query(*Feedback.list_columns())
+                           .order_by(Feedback.timestamp.desc(), Feedback.id.desc()).limit(10).all())
         
-        return jsonify({
+        return json_response({
             'success': True,
             'data': {
                 'total_feedback': total_feedback,
                 'average_rating': round(avg_rating, 2),
                 'rating_distribution': rating_distribution,
-                'recent_feedback': [f.to_dict() for f in recent_feedback]
+                'archived_feedback': archived_feedback,
+                'recent_feedback': Feedback.rows_to_dicts(recent_feedback)
             }
         })
         
@@ -137,31 +186,51 @@ def get_feedback_stats():
         }), 500
 
 @feedback_bp.route('/list', methods=['GET'])
+@admin_required
 def get_feedback_list():
-    """获取反馈列表（管理员用）"""
+    """
+    获取反馈列表（管理员用）
+    传入 cursor 参数（首页传空字符串）时使用游标分页，返回 next_cursor；否则沿用 page 页码分页
+    默认只查询热表，archive=1 时查询已归档的历史反馈
+    """
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        db = next(get_db())
+        per_page = clamp_per_page(request.args.get('per_page', 20, type=int))
+        cursor = request.args.get('cursor')
+        archive = request.args.get('archive') == '1'
+        model = FeedbackArchive if archive else Feedback
         
-        # 分页查询
-        offset = (page - 1) * per_page
-        feedback_list = db.query(Feedback).order_by(Feedback.timestamp.desc()).offset(offset).limit(per_page).all()
+        db = get_session()
+        query = db.query(*model.list_columns())
         
-        # 获取总数
-        total = db.query(Feedback).count()
+        if archive:
+            total = cached_count(('feedback_archive',), query)
+        else:
+            # 总数直接取自评分汇总，不再每页 COUNT(*)
+            total, _, _ = feedback_stats_service.get_rating_stats(db)
+        
+        if cursor is not None:
+            try:
+                rows, next_cursor = keyset_page(query, model.timestamp, model.id, cursor, per_page)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            pagination = {'per_page': per_page, 'total': total, 'next_cursor': next_cursor}
+        else:
+            # 分页查询
+            offset = (max(page, 1) - 1) * per_page
+            rows = query.order_by(model.timestamp.desc(), model.id.desc()).offset(offset).limit(per_page).all()
+            pagination = {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
         
-        return jsonify({
+        return json_response({
             'success': True,
             'data': {
-                'feedback_list': [f.to_dict() for f in feedback_list],
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': total,
-                    'pages': (total + per_page - 1) // per_page
-                }
+                'feedback_list': model.rows_to_dicts(rows),
+                'pagination': pagination
             }
         })
         
@@ -173,24 +242,22 @@ def get_feedback_list():
         }), 500
 
 @feedback_bp.route('/delete/<int:feedback_id>', methods=['DELETE'])
+@admin_required
 def delete_feedback(feedback_id):
     """删除指定反馈（管理员用）"""
     try:
-        db = next(get_db())
+        db = get_session()
         
-        # 查找要删除的反馈
-        feedback = db.query(Feedback).filter(Feedback.id == feedback_id).first()
+        # 删除反馈，按实际删除的行扣减评分汇总（并发删除同一条时只扣减一次）
+        deleted = feedback_stats_service.delete_feedback(db, Feedback.id == feedback_id)
+        db.commit()
         
-        if not feedback:
+        if not deleted:
             return jsonify({
                 'success': False,
                 'message': '反馈不存在'
             }), 404
         
-        # 删除反馈
-        db.delete(feedback)
-        db.commit()
-        
         return jsonify({
             'success': True,
             'message': '反馈删除成功',
@@ -207,11 +274,15 @@ def delete_feedback(feedback_id):
         }), 500
 
 @feedback_bp.route('/batch-delete', methods=['POST'])
+@admin_required
 def batch_delete_feedback():
     """批量删除反馈（管理员用）"""
     try:
-        data = request.get_json()
-        feedback_ids = data.get('feedback_ids', [])
+        data = request.get_json() or {}
+        try:
+            feedback_ids = bulk_service.parse_ids(data.get('feedback_ids', []))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
         if not feedback_ids:
             return jsonify({
@@ -219,17 +290,11 @@ def batch_delete_feedback():
                 'message': '请选择要删除的反馈'
             }), 400
         
-        db = next(get_db())
-        
-        # 查找并删除指定的反馈
-        deleted_count = 0
-        for feedback_id in feedback_ids:
-            feedback = db.query(Feedback).filter(Feedback.id == feedback_id).first()
-            if feedback:
-                db.delete(feedback)
-                deleted_count += 1
+        db = get_session()
         
-        db.commit()
+        # 按块执行集合删除，按实际删除的行在同一事务中扣减评分汇总
+        deleted_count = bulk_service.bulk_delete(db, Feedback, feedback_ids,
+                                                 delete_rows=feedback_stats_service.delete_feedback)
         
         return jsonify({
             'success': True,
@@ -245,4 +310,42 @@ def batch_delete_feedback():
         return jsonify({
             'success': False,
             'message': '服务器内部错误'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@feedback_bp.route('/batch-mark-read', methods=['POST'])
+@admin_required
+def batch_mark_feedback_read():
+    """批量标记反馈为已读（管理员用）；传 is_read: false 可恢复为未读"""
+    try:
+        data = request.get_json() or {}
+        try:
+            feedback_ids = bulk_service.parse_ids(data.get('feedback_ids', []))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        if not feedback_ids:
+            return jsonify({
+                'success': False,
+                'message': '请选择要标记的反馈'
+            }), 400
+        
+        is_read = data.get('is_read', True)
+        if not isinstance(is_read, bool):
+            return jsonify({'success': False, 'message': 'is_read 必须为 true 或 false'}), 400
+        updated_count = bulk_service.bulk_update(get_session(), Feedback, feedback_ids, {'is_read': is_read})
+        
+        return jsonify({
+            'success': True,
+            'message': f'成功更新 {updated_count} 条反馈',
+            'data': {
+                'updated_count': updated_count,
+                'is_read': is_read
+            }
+        })
+        
+    except Exception as e:
+        print(f"批量标记反馈时出错: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': '服务器内部错误'
+        }), 500
\ No newline at end of file
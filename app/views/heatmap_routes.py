@@ -1,8 +1,18 @@
 # 文件路径: app/views/heatmap_routes.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, send_file
+import base64
+import io
 import json
-from app.services.heatmap_service import create_heatmap_image
+import re
+import zipfile
+from app import metrics
+from app.config import settings
+from app.services import geodata_service, heatmap_service
+from app.services.upload_service import read_table, UploadError
+
+# 生成热力图所需的列，其余列在解析时直接丢弃
+HEATMAP_COLUMNS = ['经度', '纬度', '污染物浓度']
 
 # 1. 创建一个专门用于热力图功能的新蓝图(Blueprint)
 # 我们为它指定一个URL前缀'/api/heatmap'，这样所有属于这个蓝图的路由都会在这个路径下
@@ -16,6 +26,9 @@ heatmap_bp = Blueprint('heatmap', __name__, url_prefix='/api/heatmap')
 def generate_heatmap():
     """
     接收前端请求，生成热力图的API端点。
+    options 额外支持: value_column（插值的数值列，默认'污染物浓度'）、return_variance（返回克里金方差图层）、
+    export_grid（返回降采样数值网格，如 {"format": "npy", "max_size": 100}）、
+    progressive（以 NDJSON 流先返回低分辨率预览，再返回完整结果）。
     """
     if 'excelFile' not in request.files:
         return jsonify({"status": "error", "message": "请求中缺少 'excelFile' 文件部分"}), 400
@@ -28,22 +41,185 @@ def generate_heatmap():
         try:
             options_str = request.form.get('options', '{}')
             options = json.loads(options_str)
+            if not geodata_service.has_city(options.get('city', heatmap_service.DEFAULT_CITY)):
+                return jsonify({"status": "error", "message": "不支持的城市，可用城市见 /api/heatmap/cities"}), 400
+            grid_error = heatmap_service.grid_resolution_error(options)
+            if grid_error:
+                return jsonify({"status": "error", "message": grid_error}), 400
+
+            required = HEATMAP_COLUMNS[:2] + [options.get('value_column', heatmap_service.VALUE_COLUMN)]
+            with metrics.timer('heatmap_stage_seconds', stage='read_excel'):
+                df = read_table(file, usecols=required)
+            missing = [col for col in required if col not in df.columns]
+            if missing:
+                return jsonify({"status": "error", "message": f"文件中缺少必要的列: {', '.join(missing)}"}), 400
+
+            if options.get('progressive'):
+                stages = heatmap_service.generate_heatmap_progressive(df, options)
+                del df
+                return Response(
+                    (json.dumps(stage, ensure_ascii=False) + '\n' for stage in stages),
+                    mimetype='application/x-ndjson'
+                )
 
-            base64_image = create_heatmap_image(file, options)
+            result = heatmap_service.generate_heatmap(df, options)
+            del df
 
-            if base64_image:
+            if result:
                 return jsonify({
                     "status": "success",
                     "message": "热力图生成成功",
-                    "image_base64": base64_image
+                    **result
                 })
             else:
                 return jsonify({"status": "error", "message": "后端生成热力图失败，请检查服务器日志"}), 500
 
+        except UploadError as e:
+            return jsonify({"status": "error", "message": e.message}), e.status_code
         except json.JSONDecodeError:
             return jsonify({"status": "error", "message": "选项(options)字段的JSON格式错误"}), 400
         except Exception as e:
             print(f"Unhandled error: {e}")
             return jsonify({"status": "error", "message": "服务器内部错误"}), 500
 
-    return jsonify({"status": "error", "message": "无效的文件或请求"}), 400
\ No newline at end of file
+    return jsonify({"status": "error", "message": "无效的文件或请求"}), 400
+
+@heatmap_bp.route('/animate', methods=['POST'])
+def generate_heatmap_animation():
+    """
+    接收带时间列的多时刻站点数据，生成热力图动画（GIF/WebP）或逐帧图片。
+    options 额外支持: time_column（默认'时间'）、output（gif/webp/frames）、frame_duration（毫秒）。
+    """
+    if 'excelFile' not in request.files:
+        return jsonify({"status": "error", "message": "请求中缺少 'excelFile' 文件部分"}), 400
+
+    file = request.files['excelFile']
+    if file.filename == '':
+        return jsonify({"status": "error", "message": "未选择任何文件"}), 400
+
+    try:
+        options = json.loads(request.form.get('options', '{}'))
+        if options.get('output', 'gif') not in ('gif', 'webp', 'frames'):
+            return jsonify({"status": "error", "message": "output 仅支持 gif、webp 或 frames"}), 400
+        if not geodata_service.has_city(options.get('city', heatmap_service.DEFAULT_CITY)):
+            return jsonify({"status": "error", "message": "不支持的城市，可用城市见 /api/heatmap/cities"}), 400
+        grid_error = heatmap_service.grid_resolution_error(options)
+        if grid_error:
+            return jsonify({"status": "error", "message": grid_error}), 400
+
+        required = HEATMAP_COLUMNS + [options.get('time_column', '时间')]
+        with metrics.timer('heatmap_stage_seconds', stage='read_excel'):
+            df = read_table(file, usecols=required)
+        missing = [col for col in required if col not in df.columns]
+        if missing:
+            return jsonify({"status": "error", "message": f"文件中缺少必要的列: {', '.join(missing)}"}), 400
+
+        result = heatmap_service.create_heatmap_animation(df, options)
+        del df
+
+        if result:
+            return jsonify({"status": "success", "message": "热力图动画生成成功", **result})
+        return jsonify({"status": "error", "message": "后端生成热力图动画失败，请检查服务器日志"}), 500
+
+    except UploadError as e:
+        return jsonify({"status": "error", "message": e.message}), e.status_code
+    except json.JSONDecodeError:
+        return jsonify({"status": "error", "message": "选项(options)字段的JSON格式错误"}), 400
+    except Exception as e:
+        print(f"Unhandled error: {e}")
+        return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+
+
+def _batch_entry(index, spec, image):
+    """批量结果清单中的一项；file 为压缩包内的文件名"""
+    city = spec.get('city', heatmap_service.DEFAULT_CITY)
+    column = spec.get('value_column', heatmap_service.VALUE_COLUMN)
+    name = str(spec.get('name') or f'{city}_{column}')
+    entry = {'name': name, 'city': city, 'value_column': column}
+    if image is None:
+        entry['error'] = '生成失败，请检查服务器日志'
+    else:
+        # 文件名只保留字母、数字、汉字和 ._-，并以序号开头避免重名
+        safe_name = re.sub(r'[^\w.-]+', '_', name)
+        entry['file'] = f'{index:02d}_{safe_name}.png'
+    return entry
+
+
+@heatmap_bp.route('/batch', methods=['POST'])
+def generate_heatmap_batch():
+    """
+    同一份站点数据按多组选项批量生成热力图，表格只上传、解析一次。
+    options 为公共选项（同 /generate），另加:
+    - specs: 每张图的选项列表（覆盖公共选项），如
+      [{"value_column": "PM2.5", "city": "taiyuangeo", "colormap": "viridis", "name": "PM2.5"}, ...]
+    - output: zip（默认，PNG 与 manifest.json 打包下载）或 json（base64 图片列表）
+    """
+    if 'excelFile' not in request.files:
+        return jsonify({"status": "error", "message": "请求中缺少 'excelFile' 文件部分"}), 400
+
+    file = request.files['excelFile']
+    if file.filename == '':
+        return jsonify({"status": "error", "message": "未选择任何文件"}), 400
+
+    try:
+        options = json.loads(request.form.get('options', '{}'))
+        specs = options.pop('specs', None)
+        output = options.pop('output', 'zip')
+        if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+            return jsonify({"status": "error", "message": "options.specs 必须是非空的选项列表"}), 400
+        if len(specs) > settings.HEATMAP_BATCH_MAX_SPECS:
+            return jsonify({"status": "error",
+                            "message": f"单次最多生成 {settings.HEATMAP_BATCH_MAX_SPECS} 张热力图"}), 400
+        if output not in ('zip', 'json'):
+            return jsonify({"status": "error", "message": "output 仅支持 zip 或 json"}), 400
+
+        specs = [{**options, **spec} for spec in specs]
+        if not all(geodata_service.has_city(spec.get('city', heatmap_service.DEFAULT_CITY)) for spec in specs):
+            return jsonify({"status": "error", "message": "不支持的城市，可用城市见 /api/heatmap/cities"}), 400
+        grid_error = next(filter(None, map(heatmap_service.grid_resolution_error, specs)), None)
+        if grid_error:
+            return jsonify({"status": "error", "message": grid_error}), 400
+
+        value_columns = [spec.get('value_column', heatmap_service.VALUE_COLUMN) for spec in specs]
+        required = HEATMAP_COLUMNS[:2] + list(dict.fromkeys(value_columns))
+        with metrics.timer('heatmap_stage_seconds', stage='read_excel'):
+            df = read_table(file, usecols=required)
+        missing = [col for col in required if col not in df.columns]
+        if missing:
+            return jsonify({"status": "error", "message": f"文件中缺少必要的列: {', '.join(missing)}"}), 400
+
+        images = heatmap_service.generate_heatmap_batch(df, specs)
+        del df
+        if all(image is None for image in images):
+            return jsonify({"status": "error", "message": "后端生成热力图失败，请检查服务器日志"}), 500
+
+        entries = [_batch_entry(i, spec, image) for i, (spec, image) in enumerate(zip(specs, images), 1)]
+        if output == 'json':
+            for entry, image in zip(entries, images):
+                if image is not None:
+                    entry['image_base64'] = base64.b64encode(image).decode('utf-8')
+            return jsonify({"status": "success", "message": "热力图批量生成完成", "images": entries})
+
+        buf = io.BytesIO()
+        # PNG 本身已压缩，打包时不再压缩
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf:
+            for entry, image in zip(entries, images):
+                if image is not None:
+                    zf.writestr(entry['file'], image)
+            zf.writestr('manifest.json', json.dumps(entries, ensure_ascii=False, indent=2))
+        buf.seek(0)
+        return send_file(buf, mimetype='application/zip', as_attachment=True, download_name='heatmaps.zip')
+
+    except UploadError as e:
+        return jsonify({"status": "error", "message": e.message}), e.status_code
+    except json.JSONDecodeError:
+        return jsonify({"status": "error", "message": "选项(options)字段的JSON格式错误"}), 400
+    except Exception as e:
+        print(f"Unhandled error: {e}")
+        return jsonify({"status": "error", "message": "服务器内部错误"}), 500
+
+
+@heatmap_bp.route('/cities', methods=['GET'])
+def list_cities():
+    """可生成热力图的城市及各城市可叠加的图层（options 中的 city / map_layers 取这些名称）"""
+    return jsonify({"status": "success", "cities": geodata_service.cities()})
@@ -1,8 +1,9 @@
 # app/views/map_routes.py
 
 from flask import Blueprint, request, jsonify
-import pandas as pd
 import uuid
+from app import http_cache
+from app.services.upload_service import read_table, UploadError
 
 # 创建一个名为 'map_bp' 的蓝图
 map_bp = Blueprint('map_bp', __name__, url_prefix='/map')
@@ -29,7 +30,7 @@ def upload_file():
 
     if file:
         try:
-            df = pd.read_excel(file)
+            df = read_table(file, usecols=['经度', '纬度', '污染物浓度', '标记名称'])
             df_renamed = df.rename(columns={
                 '经度': 'lng', '纬度': 'lat',
                 '污染物浓度': 'concentration', '标记名称': 'name'
@@ -44,6 +45,8 @@ def upload_file():
             PROCESSED_DATA[session_id] = df_renamed.to_dict('records')
 
             return jsonify({'success': True, 'message': f'文件 "{file.filename}" 已为会话 {session_id} 处理成功!'})
+        except UploadError as e:
+            return jsonify({'success': False, 'message': e.message}), e.status_code
         except Exception as e:
             return jsonify({'success': False, 'message': f'文件解析失败: {str(e)}'}), 500
 
@@ -61,8 +64,11 @@ def get_data():
     user_data = PROCESSED_DATA.get(session_id)
 
     if user_data is not None:
-        data_with_id = [dict(p, id=i) for i, p in enumerate(user_data)]
-        return jsonify({'success': True, 'points': data_with_id})
+        # 重新上传后 user_data 是新对象，ETag 随之变化；数据按会话区分，只允许浏览器缓存并每次重新验证
+        entry = http_cache.response_cache.get(
+            f"map_{session_id}", user_data, 0,
+            build=lambda points: {'success': True, 'points': [dict(p, id=i) for i, p in enumerate(points)]})
+        return http_cache.cached_json_response(entry, public=False, max_age=0)
     else:
         # 如果这个session_id没有对应的数据，返回空列表
         return jsonify({'success': True, 'points': []})
@@ -1,9 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from ..database import get_db
-from ..models import Message
+from ..database import get_session
+from ..models import Message, MessageArchive
+from ..pagination import keyset_page, cached_count, clamp_per_page
+from ..services.message_search_service import apply_message_search, fetch_snippets
+from ..services import bulk_service, message_counter_service, write_behind_service
+from ..config import settings
+from ..serialization import json_response
+from .admin_auth import admin_required
 import json
+import time
 
 message_bp = Blueprint('message', __name__, url_prefix='/api')
 
@@ -22,7 +29,29 @@ def submit_message():
         # 获取设备信息
         device_info = data.get('device_info', '')
         
-        db = next(get_db())
+        if settings.WRITE_BEHIND_ENABLED:
+            # 缓冲写入：先落本地 spool，由后台线程批量入库，id 在入库后才会生成
+            try:
+                client_id, created_at = write_behind_service.enqueue_message({
+                    'name': data['name'],
+                    'email': data['email'],
+                    'subject': data['subject'],
+                    'content': data['content'],
+                    'device_info': device_info,
+                })
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({
+                'success': True,
+                'message': '留言已受理',
+                'data': {
+                    'id': None,
+                    'client_id': client_id,
+                    'timestamp': created_at.isoformat()
+                }
+            }), 202
+        
+        db = get_session()
         
         # 创建新留言
         new_message = Message(
@@ -36,6 +65,7 @@ def submit_message():
         db.add(new_message)
         db.commit()
         db.refresh(new_message)
+        message_counter_service.apply_delta(total=1, unread=1)
         
         return jsonify({
             'success': True,
@@ -51,66 +81,75 @@ def submit_message():
         return jsonify({'error': f'提交失败: {str(e)}'}), 500
 
 @message_bp.route('/messages', methods=['GET'])
+@admin_required
 def get_messages():
-    """获取留言列表（管理员用）"""
+    """
+    获取留言列表（管理员用）
+    传入 cursor 参数（首页传空字符串）时使用游标分页，返回 next_cursor；否则沿用 page 页码分页
+    总数带短期缓存，传 with_total=0 可完全跳过计数
+    search 使用全文索引检索，结果附带 snippet 片段；order=relevance 时按相关度排序（页码分页）
+    默认只查询热表，archive=1 时查询已归档的历史留言（归档表使用子串匹配检索）
+    """
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        per_page = clamp_per_page(request.args.get('per_page', 20, type=int))
         search = request.args.get('search', '')
         status = request.args.get('status', '')  # all, unread, read
+        cursor = request.args.get('cursor')
+        order = request.args.get('order', 'time')  # time, relevance
+        with_total = request.args.get('with_total', '1') != '0'
+        archive = request.args.get('archive') == '1'
+        model = MessageArchive if archive else Message
         
-        db = next(get_db())
+        db = get_session()
         
-        # 构建查询
-        query = db.query(Message)
+        # 构建查询（只取列表需要的列）
+        query = db.query(*model.list_columns())
         
         # 搜索过滤
+        rank = None
         if search:
-            query = query.filter(
-                (Message.name.contains(search)) |
-                (Message.email.contains(search)) |
-                (Message.subject.contains(search)) |
-                (Message.content.contains(search))
-            )
+            query, rank = apply_message_search(query, search, model)
         
         # 状态过滤
         if status == 'unread':
-            query = query.filter(Message.is_read == False)
+            query = query.filter(model.is_read == False)
         elif status == 'read':
-            query = query.filter(Message.is_read == True)
-        
-        # 按时间倒序排列
-        query = query.order_by(desc(Message.created_at))
-        
-        # 分页
-        total = query.count()
-        messages = query.offset((page - 1) * per_page).limit(per_page).all()
-        
-        # 转换为字典
-        message_list = []
-        for msg in messages:
-            msg_dict = msg.to_dict()
-            message_list.append({
-                'id': msg.id,
-                'name': msg.name,
-                'email': msg.email,
-                'subject': msg.subject,
-                'content': msg.content,
-                'device_info': msg.device_info,
-                'created_at': msg_dict.get('created_at'),  # 用to_dict的中国时区时间
-                'is_read': msg.is_read,
-                'is_replied': msg.is_replied
-            })
-        
-        return jsonify({
-            'success': True,
-            'data': message_list,
-            'pagination': {
+            query = query.filter(model.is_read == True)
+        
+        total = cached_count((model.__tablename__, search, status), query) if with_total else None
+        
+        if cursor is not None and not (order == 'relevance' and rank is not None):
+            try:
+                messages, next_cursor = keyset_page(query, model.created_at, model.id, cursor, per_page)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            pagination = {'per_page': per_page, 'total': total, 'next_cursor': next_cursor}
+        else:
+            # 按相关度或时间倒序排列后分页
+            if order == 'relevance' and rank is not None:
+                query = query.order_by(rank, desc(model.created_at), desc(model.id))
+            else:
+                query = query.order_by(desc(model.created_at), desc(model.id))
+            messages = query.offset((max(page, 1) - 1) * per_page).limit(per_page).all()
+            pagination = {
                 'page': page,
                 'per_page': per_page,
                 'total': total,
-                'pages': (total + per_page - 1) // per_page
+                'pages': (total + per_page - 1) // per_page if total is not None else None
             }
+        
+        # 转换为字典（created_at 为中国时区时间）
+        message_list = model.rows_to_dicts(messages)
+        if search and not archive:
+            snippets = fetch_snippets(db, search, [item['id'] for item in message_list])
+            for item in message_list:
+                item['snippet'] = snippets.get(item['id'])
+        
+        return json_response({
+            'success': True,
+            'data': message_list,
+            'pagination': pagination
         })
         
     except Exception as e:
@@ -118,18 +157,22 @@ def get_messages():
         return jsonify({'error': f'获取失败: {str(e)}'}), 500
 
 @message_bp.route('/messages/<int:message_id>', methods=['GET'])
+@admin_required
 def get_message_detail(message_id):
     """获取留言详情"""
     try:
-        db = next(get_db())
+        db = get_session()
         message = db.query(Message).filter(Message.id == message_id).first()
         
         if not message:
             return jsonify({'error': '留言不存在'}), 404
         
         # 标记为已读
+        was_unread = not message.is_read
         message.is_read = True
         db.commit()
+        if was_unread:
+            message_counter_service.apply_delta(unread=-1)
         
         message_data = {
             'id': message.id,
@@ -153,10 +196,11 @@ def get_message_detail(message_id):
         return jsonify({'error': f'获取失败: {str(e)}'}), 500
 
 @message_bp.route('/messages/<int:message_id>', methods=['DELETE'])
+@admin_required
 def delete_message(message_id):
     """删除留言"""
     try:
-        db = next(get_db())
+        db = get_session()
         message = db.query(Message).filter(Message.id == message_id).first()
         
         if not message:
@@ -164,6 +208,9 @@ def delete_message(message_id):
         
         db.delete(message)
         db.commit()
+        message_counter_service.apply_delta(
+            total=-1, unread=-int(not message.is_read), replied=-int(bool(message.is_replied))
+        )
         
         return jsonify({
             'success': True,
@@ -175,20 +222,23 @@ def delete_message(message_id):
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
 @message_bp.route('/messages/batch-delete', methods=['POST'])
+@admin_required
 def batch_delete_messages():
     """批量删除留言"""
     try:
-        data = request.get_json()
-        message_ids = data.get('ids', [])
+        data = request.get_json() or {}
+        try:
+            message_ids = bulk_service.parse_ids(data.get('ids', []))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         if not message_ids:
             return jsonify({'error': '请选择要删除的留言'}), 400
         
-        db = next(get_db())
-        
-        # 删除选中的留言
-        deleted_count = db.query(Message).filter(Message.id.in_(message_ids)).delete(synchronize_session=False)
-        db.commit()
+        # 按块删除选中的留言，超大列表不会超出参数上限
+        deleted_count = bulk_service.bulk_delete(get_session(), Message, message_ids)
+        # 删除了哪些状态的留言无从得知，让计数重新聚合
+        message_counter_service.invalidate()
         
         return jsonify({
             'success': True,
@@ -200,17 +250,21 @@ def batch_delete_messages():
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
 @message_bp.route('/messages/<int:message_id>/reply', methods=['POST'])
+@admin_required
 def mark_as_replied(message_id):
     """标记留言为已回复"""
     try:
-        db = next(get_db())
+        db = get_session()
         message = db.query(Message).filter(Message.id == message_id).first()
         
         if not message:
             return jsonify({'error': '留言不存在'}), 404
         
+        was_unreplied = not message.is_replied
         message.is_replied = True
         db.commit()
+        if was_unreplied:
+            message_counter_service.apply_delta(replied=1)
         
         return jsonify({
             'success': True,
@@ -221,26 +275,109 @@ def mark_as_replied(message_id):
         print(f"标记留言为已回复时出错: {str(e)}")
         return jsonify({'error': f'操作失败: {str(e)}'}), 500
 
-@message_bp.route('/messages/stats', methods=['GET'])
-def get_message_stats():
-    """获取留言统计信息"""
+def _batch_mark(field, action):
+    """批量设置留言的 is_read / is_replied；请求体 {ids: [...], value: true}，value 为 false 时恢复"""
     try:
-        db = next(get_db())
+        data = request.get_json() or {}
+        try:
+            message_ids = bulk_service.parse_ids(data.get('ids', []))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        total = db.query(Message).count()
-        unread = db.query(Message).filter(Message.is_read == False).count()
-        replied = db.query(Message).filter(Message.is_replied == True).count()
+        if not message_ids:
+            return jsonify({'error': f'请选择要{action}的留言'}), 400
+        
+        value = data.get('value', True)
+        if not isinstance(value, bool):
+            return jsonify({'error': 'value 必须为 true 或 false'}), 400
+        # 只更新状态确实改变的行，受影响行数即计数的变化量
+        updated_count = bulk_service.bulk_update(get_session(), Message, message_ids, {field: value})
+        sign = 1 if value else -1
+        if field == 'is_read':
+            message_counter_service.apply_delta(unread=-sign * updated_count)
+        else:
+            message_counter_service.apply_delta(replied=sign * updated_count)
         
         return jsonify({
             'success': True,
-            'data': {
-                'total': total,
-                'unread': unread,
-                'replied': replied,
-                'unreplied': total - replied
-            }
+            'message': f'成功更新 {updated_count} 条留言',
+            'data': {'updated_count': updated_count, field: value}
         })
         
+    except Exception as e:
+        print(f"批量{action}留言时出错: {str(e)}")
+        return jsonify({'error': f'操作失败: {str(e)}'}), 500
+
+@message_bp.route('/messages/batch-mark-read', methods=['POST'])
+@admin_required
+def batch_mark_messages_read():
+    """批量标记留言为已读（value: false 恢复为未读）"""
+    return _batch_mark('is_read', '标记已读')
+
+@message_bp.route('/messages/batch-mark-replied', methods=['POST'])
+@admin_required
+def batch_mark_messages_replied():
+    """批量标记留言为已回复（value: false 恢复为未回复）"""
+    return _batch_mark('is_replied', '标记已回复')
+
+@message_bp.route('/messages/stats', methods=['GET'])
+@admin_required
+def get_message_stats():
+    """
+    获取留言统计信息（带短期缓存）
+    长轮询：传入上次返回的 tag 作为 since，计数变化或等待 wait 秒（最多30）后返回；
+    sync worker 下不挂起，立即返回并在 poll_after 中给出建议的下次请求间隔（秒）
+    """
+    try:
+        since = request.args.get('since')
+        if since and settings.MESSAGE_STATS_LONG_POLL:
+            wait = max(0, min(request.args.get('wait', 25, type=int), 30))
+            counters = message_counter_service.wait_for_change(since, wait)
+        else:
+            counters = message_counter_service.get_counters(get_session())
+        
+        body = {
+            'success': True,
+            'data': message_counter_service.to_payload(counters)
+        }
+        if since and not settings.MESSAGE_STATS_LONG_POLL:
+            body['poll_after'] = settings.MESSAGE_STATS_TTL
+        return jsonify(body)
+        
     except Exception as e:
         print(f"获取留言统计时出错: {str(e)}")
-        return jsonify({'error': f'获取统计失败: {str(e)}'}), 500 
\ No newline at end of file
+        return jsonify({'error': f'获取统计失败: {str(e)}'}), 500 
+
+@message_bp.route('/messages/stats/stream', methods=['GET'])
+@admin_required
+def stream_message_stats():
+    """
+    以 SSE 推送留言统计：连接后先推送一次，之后每次计数变化时推送；连接到期后浏览器自动重连。
+    sync worker 下不保持连接：推送当前计数后即断开，浏览器按计数缓存有效期重连（相当于定时轮询）
+    """
+    since = request.args.get('since') or request.headers.get('Last-Event-ID', '')
+    hold = settings.MESSAGE_STATS_LONG_POLL
+    duration = settings.MESSAGE_STATS_STREAM_SECONDS if hold else 0
+    retry_ms = 3000 if hold else int(settings.MESSAGE_STATS_TTL * 1000)
+
+    def events():
+        deadline = time.monotonic() + duration
+        tag = since
+        yield f'retry: {retry_ms}\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            counters = message_counter_service.wait_for_change(tag, min(max(remaining, 0), 15))
+            payload = message_counter_service.to_payload(counters)
+            if payload['tag'] != tag:
+                tag = payload['tag']
+                yield f"id: {tag}\nevent: stats\ndata: {json.dumps(payload)}\n\n"
+            elif remaining > 0:
+                # 心跳，防止代理因空闲断开连接
+                yield ': keep-alive\n\n'
+            if remaining <= 0:
+                return
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
\ No newline at end of file
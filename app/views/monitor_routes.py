@@ -0,0 +1,109 @@
+# 文件路径: app/views/monitor_routes.py
+
+import hmac
+
+from flask import Blueprint, Response, abort, jsonify, request, send_from_directory
+
+from app import metrics, profiling
+from app.config import settings
+from app.database import SessionLocal, get_pool_status
+from app.models import Feedback, FeedbackArchive, Message, MessageArchive
+from app.services import admin_auth_service, retention_service
+from app.views.admin_auth import admin_required
+
+# 运行状态监控相关接口
+monitor_bp = Blueprint('monitor', __name__, url_prefix='/api/monitor')
+# Prometheus 抓取地址固定为 /metrics，不带前缀
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@monitor_bp.route('/db-pool', methods=['GET'])
+@admin_required
+def db_pool_status():
+    """
+    数据库连接池状态：当前借出/空闲/溢出连接数，以及累计的获取次数、等待时间和超时次数。
+    统计为当前 worker 进程内的数据。
+    """
+    return jsonify({'success': True, 'data': get_pool_status()})
+
+
+@monitor_bp.route('/retention', methods=['GET'])
+@admin_required
+def retention_status():
+    """历史数据归档的配置、最近一次执行结果，以及热表/归档表的行数"""
+    db = SessionLocal()
+    try:
+        rows = {model.__tablename__: db.query(model).count()
+                for model in (Feedback, FeedbackArchive, Message, MessageArchive)}
+    finally:
+        db.close()
+    return jsonify({'success': True, 'data': {
+        'enabled': settings.RETENTION_ENABLED,
+        'feedback_retention_days': settings.FEEDBACK_RETENTION_DAYS,
+        'message_retention_days': settings.MESSAGE_RETENTION_DAYS,
+        'status': retention_service.status,
+        'rows': rows,
+    }})
+
+
+
+@monitor_bp.route('/slow-requests', methods=['GET'])
+@admin_required
+def slow_requests():
+    """所有 worker 记录的最慢请求（含热力图各阶段与上游调用耗时），需开启 SLOW_REQUEST_CAPTURE"""
+    entries = sorted(metrics.collect_extra('slow_requests'), key=lambda e: e['duration_ms'], reverse=True)
+    return jsonify({'success': True, 'data': {
+        'enabled': settings.SLOW_REQUEST_CAPTURE > 0,
+        'requests': entries[:settings.SLOW_REQUEST_CAPTURE],
+    }})
+
+
+@monitor_bp.route('/workers', methods=['GET'])
+@admin_required
+def worker_status():
+    """各 worker 进程的常驻内存与启动时间；配置 WORKER_MAX_RSS_MB 后超限的 worker 处理完当前请求即重启"""
+    workers = sorted(metrics.collect_extra('workers'), key=lambda w: w['rss_mb'], reverse=True)
+    return jsonify({'success': True, 'data': {
+        'max_rss_mb': settings.WORKER_MAX_RSS_MB,
+        'workers': workers,
+    }})
+
+
+@monitor_bp.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """已保存的性能分析结果（.folded 为折叠栈，.prof 为 cProfile 输出）"""
+    return jsonify({'success': True, 'data': {
+        'enabled': settings.PROFILING_ENABLED,
+        'profiles': profiling.list_profiles(),
+    }})
+
+
+@monitor_bp.route('/profiles/<string:profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    if not profile_id.endswith(profiling.PROFILE_EXTENSIONS):
+        abort(404)
+    return send_from_directory(settings.PROFILE_DIR, profile_id, as_attachment=True)
+
+
+def _metrics_authorized():
+    provided = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if settings.METRICS_TOKEN and hmac.compare_digest(provided.encode('utf-8'), settings.METRICS_TOKEN.encode('utf-8')):
+        return True
+    # I/O 服务（SERVICE_ROLE=io）同样能校验管理员令牌：只用到签名密钥与账户文件
+    return not settings.ADMIN_AUTH_REQUIRED or admin_auth_service.verify_token(provided) is not None
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus 文本格式的指标，汇总同一台机器上所有 worker：
+    按路由的请求耗时、热力图各阶段耗时、上游接口耗时、天气缓存命中率、数据库连接池状态。
+    默认需要以 Bearer 令牌访问：METRICS_TOKEN（供抓取程序使用）或管理员登录令牌；
+    METRICS_PUBLIC 为 true 时允许匿名访问。
+    """
+    if not settings.METRICS_PUBLIC and not _metrics_authorized():
+        return jsonify({'success': False, 'message': '未授权'}), 401
+    body = metrics.render_prometheus(metrics.collect())
+    return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
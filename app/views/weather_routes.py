@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request, Response
 import requests
+from app import http_cache, metrics
 from app.config import settings
 # ------------------------------------
 
@@ -11,6 +12,9 @@ from app.services import weather_service
 # url_prefix 会给这个蓝图下的所有路由加上统一的前缀
 weather_bp = Blueprint('weather_bp', __name__, url_prefix='/api/weather')
 
+# 地图图层URL模板的浏览器/CDN缓存时长（秒）
+MAP_LAYERS_MAX_AGE = 3600
+
 
 # 2. 在蓝图上定义路由
 @weather_bp.route("/realtime/<string:city_name>", methods=['GET'])
@@ -27,7 +31,10 @@ def get_realtime_weather(city_name):
     if not data_bundle:
         return jsonify({"error": f"找不到城市 '{city_name}' 的天气数据"}), 404
 
-    return jsonify(data_bundle)
+    # 缓存命中时返回的是同一个对象，ETag 与编码结果直接复用；Cache-Control 与服务层缓存的剩余时间对齐
+    entry = http_cache.response_cache.get(f"realtime_{city_name}", data_bundle, weather_service.weather_cache.ttl,
+                                          stored_at=weather_service.stored_at(data_bundle))
+    return http_cache.cached_json_response(entry)
 
 # 后续的天气地图、历史数据等其他接口，我们都将在这里添加
 # --- 新增：历史天气API路由 ---
@@ -51,7 +58,9 @@ def get_history_weather(city_name):
     if data is None:
         return jsonify({"error": f"找不到城市 '{city_name}' 或日期 '{date_str}' 的历史数据"}), 404
 
-    return jsonify(data)
+    entry = http_cache.response_cache.get(f"history_{city_name}_{date_str}", data, weather_service.history_cache.ttl,
+                                          stored_at=weather_service.stored_at(data))
+    return http_cache.cached_json_response(entry)
 
 # --- 新增：30天趋势预测API路由 ---
 @weather_bp.route("/trends/<string:city_name>", methods=['GET'])
@@ -66,7 +75,9 @@ def get_trends_weather(city_name):
         # 复用历史数据的错误信息，或创建一个更通用的
         return jsonify({"error": f"找不到城市 '{city_name}' 的30天趋势数据"}), 404
 
-    return jsonify(data)
+    entry = http_cache.response_cache.get(f"trends_{city_name}", data, weather_service.weather_cache.ttl,
+                                          stored_at=weather_service.stored_at(data))
+    return http_cache.cached_json_response(entry)
 
 # --- 新增：获取地图图层API路由 ---
 @weather_bp.route("/map_layers", methods=['GET'])
@@ -76,7 +87,9 @@ def get_map_layers():
     前端将使用这些URL来在地图上渲染天气图层。
     """
     urls = weather_service.get_map_layer_urls()
-    return jsonify(urls)
+    entry = http_cache.response_cache.get('map_layers', urls, MAP_LAYERS_MAX_AGE)
+    # 模板只随API密钥变化，按固定时长缓存，过期后由 ETag 重新验证
+    return http_cache.cached_json_response(entry, max_age=MAP_LAYERS_MAX_AGE)
 
 
 # --- 新增：地图瓦片安全代理路由 ---
@@ -99,11 +112,18 @@ def get_map_tile_proxy(op, z, x, y):
 
     try:
         # 使用流式请求，高效地将图片数据转发给前端
-        res = requests.get(tile_url, params=params, stream=True)
+        # 复用服务层会话的连接池；瓦片路径带坐标，耗时统一记在 weather_tile 名下
+        res = weather_service.session.get(tile_url, params=params, stream=True,
+                                          timeout=settings.WEATHER_HTTP_TIMEOUT,
+                                          hooks={'response': metrics.upstream_hook('weather_tile')})
+        if not res.ok:
+            res.close()
         res.raise_for_status()  # 如果请求失败则抛出异常
 
-        # 将从OpenWeatherMap收到的图片响应，直接返回给前端
-        return Response(res.iter_content(chunk_size=1024), content_type=res.headers['Content-Type'])
+        # 将从OpenWeatherMap收到的图片响应，直接返回给前端；响应结束（含客户端中途断开）时把连接还给连接池
+        response = Response(res.iter_content(chunk_size=1024), content_type=res.headers['Content-Type'])
+        response.call_on_close(res.close)
+        return response
 
     except requests.exceptions.RequestException as e:
         print(f"代理请求失败: {e}")
@@ -0,0 +1,142 @@
+# 文件路径: benchmarks/admin_queries.py
+
+"""
+管理后台查询基准测试。
+
+在临时 SQLite 数据库中批量写入反馈和留言，然后用 Flask 测试客户端依次请求各个管理接口，
+输出每个接口的耗时中位数（毫秒）。加 --compare 时先删除索引测一遍，再重建索引测一遍，便于对比。
+
+用法:
+    python benchmarks/admin_queries.py --rows 100000 --compare
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = [
+    ('feedback_stats', '/api/feedback/stats'),
+    ('feedback_list_first', '/api/feedback/list?page=1&per_page=20'),
+    ('feedback_list_deep', '/api/feedback/list?page={deep_page}&per_page=20'),
+    ('feedback_list_cursor', '/api/feedback/list?cursor=&per_page=20'),
+    ('message_list_first', '/api/messages?page=1&per_page=20'),
+    ('message_list_deep', '/api/messages?page={deep_page}&per_page=20'),
+    ('message_list_unread', '/api/messages?page=1&per_page=20&status=unread'),
+    ('message_search', '/api/messages?page=1&per_page=20&search=空气质量'),
+    ('message_stats', '/api/messages/stats'),
+]
+
+WORDS = ['空气质量', '天气预报', '热力图', '地图', '建议', '问题', '很好', '加载太慢', 'PM2.5', '数据']
+
+
+def seed(engine, rows, batch=5000):
+    """用批量插入写入 rows 条反馈和 rows 条留言"""
+    from app.models import Feedback, Message
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            n = min(batch, rows - offset)
+            conn.execute(Feedback.__table__.insert(), [{
+                'rating': rng.randint(1, 5),
+                'suggestion': ' '.join(rng.choices(WORDS, k=6)),
+                'timestamp': start + timedelta(minutes=offset + i),
+                'created_at': start + timedelta(minutes=offset + i),
+                'device_info': {'platform': 'ios'},
+                'ip_address': '127.0.0.1',
+                'user_agent': 'bench',
+                'is_read': rng.random() < 0.5,
+            } for i in range(n)])
+            conn.execute(Message.__table__.insert(), [{
+                'name': f'user{offset + i}',
+                'email': f'user{offset + i}@example.com',
+                'subject': rng.choice(WORDS),
+                'content': ' '.join(rng.choices(WORDS, k=12)),
+                'device_info': 'bench',
+                'created_at': start + timedelta(minutes=offset + i),
+                'is_read': rng.random() < 0.5,
+                'is_replied': rng.random() < 0.3,
+            } for i in range(n)])
+
+    # 绕过接口直接写入的数据需要重建评分汇总
+    from sqlalchemy.orm import Session
+    from app.services.feedback_stats_service import rebuild_rating_summary
+    with Session(engine) as db:
+        rebuild_rating_summary(db)
+        db.commit()
+
+
+def drop_indexes(engine):
+    from app.models import Base
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(bind=conn, checkfirst=True)
+
+
+def create_indexes(engine):
+    from app.migrations import _create_hot_path_indexes
+    with engine.begin() as conn:
+        _create_hot_path_indexes(conn)
+
+
+def time_endpoints(client, rows, repeat):
+    from app.pagination import count_cache
+    results = {}
+    deep_page = max(1, rows // 20 // 2)
+    for name, url in ENDPOINTS:
+        url = url.format(deep_page=deep_page)
+        samples = []
+        for _ in range(repeat):
+            count_cache.clear()
+            t0 = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} 返回 {response.status_code}')
+        results[name] = round(statistics.median(samples), 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='管理后台查询基准测试')
+    parser.add_argument('--rows', type=int, default=100000, help='反馈和留言各写入多少行')
+    parser.add_argument('--repeat', type=int, default=5, help='每个接口请求次数（取中位数）')
+    parser.add_argument('--compare', action='store_true', help='分别测量无索引与有索引时的耗时')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='admin-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    # 只测量查询本身，跳过管理员令牌校验
+    os.environ['ADMIN_AUTH_REQUIRED'] = 'false'
+
+    from app import create_app
+    from app.database import engine
+
+    app = create_app()
+    t0 = time.perf_counter()
+    seed(engine, args.rows)
+    report = {'rows': args.rows, 'seed_seconds': round(time.perf_counter() - t0, 2)}
+
+    client = app.test_client()
+    if args.compare:
+        drop_indexes(engine)
+        report['without_indexes_ms'] = time_endpoints(client, args.rows, args.repeat)
+        create_indexes(engine)
+    report['with_indexes_ms'] = time_endpoints(client, args.rows, args.repeat)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# 文件路径: benchmarks/heatmap_render.py
+
+"""
+热力图生成基准测试。
+
+生成不同站点数量的合成站点表格（Excel），按"上传解析 + create_heatmap_image"的完整路径，
+在各插值方法与网格分辨率组合下测量耗时，并给出各阶段（解析、插值、渲染、编码）的耗时拆分。
+每个组合第一次运行包含变差函数拟合等冷启动开销，单独记为 first_ms，其余取中位数。
+
+用法:
+    python benchmarks/heatmap_render.py --points 10 100 1000 10000 --methods kriging rbf --resolutions auto 100 200
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 太原市区附近的站点范围（与默认显示范围相交）
+LON_RANGE = (112.0, 112.9)
+LAT_RANGE = (37.5, 38.1)
+
+
+def make_stations(n, seed=0):
+    """生成 n 个站点：平滑的浓度场叠加噪声，保证插值结果有意义"""
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(*LON_RANGE, n)
+    lat = rng.uniform(*LAT_RANGE, n)
+    field = 60 + 30 * np.sin((lon - LON_RANGE[0]) * 6) * np.cos((lat - LAT_RANGE[0]) * 8)
+    return pd.DataFrame({
+        '经度': lon,
+        '纬度': lat,
+        '污染物浓度': np.round(field + rng.normal(0, 5, n), 2),
+        '标记名称': [f's{i}' for i in range(n)],
+    })
+
+
+def write_spreadsheets(sizes, workdir):
+    paths = {}
+    for n in sizes:
+        path = os.path.join(workdir, f'stations_{n}.xlsx')
+        make_stations(n).to_excel(path, index=False)
+        paths[n] = path
+    return paths
+
+
+def _stage_sums():
+    from app import metrics
+    return {dict(labels)['stage']: series[-1]
+            for name, labels, series in metrics.registry.snapshot()['histograms']
+            if name == 'heatmap_stage_seconds'}
+
+
+def run_once(path, options):
+    """按上传接口的路径解析文件并生成热力图，返回 (总耗时ms, 各阶段耗时ms)"""
+    from werkzeug.datastructures import FileStorage
+    from app.services import heatmap_service
+    from app.services.upload_service import read_table
+    from app.views.heatmap_routes import HEATMAP_COLUMNS
+
+    before = _stage_sums()
+    t0 = time.perf_counter()
+    with open(path, 'rb') as f:
+        parse_start = time.perf_counter()
+        df = read_table(FileStorage(f, filename=os.path.basename(path)), usecols=HEATMAP_COLUMNS)
+        parse_ms = (time.perf_counter() - parse_start) * 1000
+    image = heatmap_service.create_heatmap_image(df, options)
+    total_ms = (time.perf_counter() - t0) * 1000
+    if image is None:
+        raise RuntimeError(f'生成热力图失败: {os.path.basename(path)} {options}')
+    after = _stage_sums()
+    stages = {stage: round((after[stage] - before.get(stage, 0)) * 1000, 1) for stage in after}
+    stages = {stage: ms for stage, ms in stages.items() if ms}
+    stages['parse'] = round(parse_ms, 1)
+    return total_ms, stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热力图生成基准测试')
+    parser.add_argument('--points', type=int, nargs='+', default=[10, 100, 1000, 10000], help='站点数量')
+    parser.add_argument('--methods', nargs='+', default=['kriging', 'rbf'], help='插值方法')
+    parser.add_argument('--resolutions', nargs='+', default=['auto', '100', '200'],
+                        help="网格分辨率，auto 表示按输出尺寸自动确定")
+    parser.add_argument('--repeat', type=int, default=3, help='每个组合运行次数')
+    parser.add_argument('--max-solver-points', type=int, default=3000,
+                        help='站点数超过此值时跳过（克里金/RBF 需求解 n×n 方程组，内存与耗时按 n² / n³ 增长）')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='heatmap-bench-')
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    from app.services import heatmap_service
+    t0 = time.perf_counter()
+    heatmap_service.load_dependencies()
+    report = {'dependency_import_seconds': round(time.perf_counter() - t0, 3), 'runs': []}
+
+    paths = write_spreadsheets(args.points, workdir)
+    for n in args.points:
+        for method in args.methods:
+            for resolution in args.resolutions:
+                case = {'points': n, 'method': method, 'resolution': resolution}
+                if n > args.max_solver_points:
+                    report['runs'].append({**case, 'skipped': f'超过 --max-solver-points={args.max_solver_points}'})
+                    continue
+                options = {'interpolation_method': method}
+                if resolution != 'auto':
+                    options['grid_resolution'] = int(resolution)
+                samples = []
+                # 服务内部的日志输出转到 stderr，stdout 只保留 JSON 结果
+                with contextlib.redirect_stdout(sys.stderr):
+                    for _ in range(args.repeat):
+                        samples.append(run_once(paths[n], options))
+                warm = samples[1:] or samples
+                report['runs'].append({
+                    **case,
+                    'first_ms': round(samples[0][0], 1),
+                    'median_ms': round(statistics.median(ms for ms, _ in warm), 1),
+                    'stages_ms': {stage: round(statistics.median(s.get(stage, 0) for _, s in warm), 1)
+                                  for stage in warm[0][1]},
+                })
+                print(f"{n} 点 / {method} / {resolution}: {report['runs'][-1]['median_ms']} ms", file=sys.stderr)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# 文件路径: benchmarks/import_time.py
+
+"""
+启动耗时报告。
+
+在子进程中用 python -X importtime 执行 create_app()，输出：
+- create_app 总耗时、进程常驻内存；
+- 累计导入耗时最多的模块；
+- 启动后已加载/未加载的重量级依赖，以及首次加载热力图依赖的耗时。
+
+用法:
+    python benchmarks/import_time.py --top 15
+    HEATMAP_PRELOAD=true python benchmarks/import_time.py
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MARKER = '--- heatmap dependencies ---'
+
+HEAVY_MODULES = ['pandas', 'geopandas', 'matplotlib', 'scipy', 'pykrige', 'shapely', 'PIL', 'openpyxl']
+
+# 在子进程中执行的启动脚本，最后一行输出 JSON
+CHILD_SCRIPT = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from app import create_app
+create_app()
+startup = time.perf_counter() - t0
+loaded = [m for m in {heavy!r} if m in sys.modules]
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print({marker!r}, file=sys.stderr, flush=True)
+t0 = time.perf_counter()
+from app.services import heatmap_service
+heatmap_service.load_dependencies()
+first_heatmap_import = time.perf_counter() - t0
+print(json.dumps({{'startup_seconds': startup, 'heavy_loaded': loaded, 'max_rss_kb': rss,
+                  'first_heatmap_import_seconds': first_heatmap_import}}))
+"""
+
+
+def parse_importtime(lines):
+    """解析 -X importtime 输出，返回按累计耗时倒序排列的 [(累计微秒, 模块名)]"""
+    entries = []
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split(':', 1)[1].split('|')
+        entries.append((int(cumulative_us), name.strip()))
+    return sorted(entries, reverse=True)
+
+
+def _slowest(lines, top):
+    return {name: round(us / 1000, 1) for us, name in parse_importtime(lines)[:top]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动耗时报告')
+    parser.add_argument('--top', type=int, default=15, help='列出累计导入耗时最多的前 N 个模块')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='import-time-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}")
+    script = CHILD_SCRIPT.format(root=ROOT, heavy=HEAVY_MODULES, marker=MARKER)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                          capture_output=True, text=True, env=env, cwd=workdir)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        sys.exit(proc.returncode)
+
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    report['startup_seconds'] = round(report['startup_seconds'], 3)
+    report['first_heatmap_import_seconds'] = round(report['first_heatmap_import_seconds'], 3)
+    report['heavy_not_loaded'] = [m for m in HEAVY_MODULES if m not in report['heavy_loaded']]
+    startup_lines, _, heatmap_lines = proc.stderr.partition(MARKER)
+    report['slowest_startup_imports_ms'] = _slowest(startup_lines.splitlines(), args.top)
+    report['slowest_heatmap_imports_ms'] = _slowest(heatmap_lines.splitlines(), args.top)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# 文件路径: benchmarks/run_all.py
+
+"""
+依次运行全部基准测试（各自在独立子进程和临时数据库中执行），把结果与运行环境
+（提交号、Python 版本、CPU 数等）合并写入一个 JSON 文件，便于在不同提交之间对比。
+
+加 --baseline 时与之前保存的结果逐项比较，耗时类指标变慢（或吞吐类指标下降）超过
+--threshold 的项目列为回退，存在回退时以退出码 1 结束，可用于决定是否接受一项性能改动。
+
+用法:
+    python benchmarks/run_all.py --output bench-main.json
+    python benchmarks/run_all.py --quick --output bench-pr.json --baseline bench-main.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 名称 -> (完整参数, --quick 时的参数)
+SUITES = {
+    'import_time': ([], []),
+    'admin_queries': (['--rows', '100000', '--compare'], ['--rows', '10000']),
+    'heatmap_render': ([], ['--points', '10', '100', '1000', '--resolutions', 'auto', '100', '--repeat', '2']),
+    'weather_upstream': (['--latency-ms', '50', '--repeat', '20'], ['--latency-ms', '50', '--repeat', '5']),
+}
+
+# 指标路径中最内层带这些后缀的字段决定方向：数值越小越好 / 越大越好；其余字段（参数、计数）不参与比较
+LOWER_IS_BETTER = ('_ms', '_seconds', '_kb')
+HIGHER_IS_BETTER = ('_per_second',)
+# 单个模块的导入耗时波动大，只作参考
+IGNORED = ('slowest_', 'wall_seconds')
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def run_suite(name, args):
+    script = os.path.join(ROOT, 'benchmarks', f'{name}.py')
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, script, *args], capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1:] or ['退出码非零'], 'args': args}
+    # 部分脚本在 JSON 之前会输出迁移日志，从第一行 "{" 开始解析
+    lines = proc.stdout.splitlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith('{'))
+    result = json.loads('\n'.join(lines[start:]))
+    result['args'] = args
+    result['wall_seconds'] = round(time.perf_counter() - t0, 1)
+    return result
+
+
+def flatten(value, prefix=''):
+    """把嵌套结果展开为 {路径: 数值}；列表中的运行记录按其参数命名"""
+    items = {}
+    if isinstance(value, dict):
+        for key, child in value.items():
+            items.update(flatten(child, f'{prefix}.{key}' if prefix else key))
+    elif isinstance(value, list):
+        for i, child in enumerate(value):
+            if isinstance(child, dict) and 'points' in child:
+                label = f"{child['points']}pts/{child.get('method')}/{child.get('resolution')}"
+            else:
+                label = str(i)
+            items.update(flatten(child, f'{prefix}[{label}]'))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        items[prefix] = value
+    return items
+
+
+def _direction(key):
+    """返回 1（越小越好）、-1（越大越好）或 None（不比较）"""
+    for segment in reversed(key.replace('[', '.').split('.')):
+        if segment.endswith(HIGHER_IS_BETTER):
+            return -1
+        if segment.endswith(LOWER_IS_BETTER):
+            return 1
+    return None
+
+
+def compare(current, baseline, threshold):
+    """返回 (回退列表, 改进列表)，每项为 (指标, 基线值, 当前值, 变化比例)"""
+    regressions, improvements = [], []
+    old_values = flatten(baseline.get('results', {}))
+    for key, new in flatten(current['results']).items():
+        old = old_values.get(key)
+        direction = _direction(key)
+        if not old or direction is None or any(word in key for word in IGNORED):
+            continue
+        change = direction * (new - old) / old
+        if change > threshold:
+            regressions.append((key, old, new, change))
+        elif change < -threshold:
+            improvements.append((key, old, new, change))
+    return regressions, improvements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运行全部基准测试并输出可对比的 JSON')
+    parser.add_argument('--suites', nargs='+', choices=list(SUITES), default=list(SUITES), help='只运行指定的基准')
+    parser.add_argument('--quick', action='store_true', help='使用较小的数据量，几分钟内完成')
+    parser.add_argument('--output', help='结果写入的 JSON 文件（默认只输出到终端）')
+    parser.add_argument('--baseline', help='与之前保存的结果对比')
+    parser.add_argument('--threshold', type=float, default=0.1, help='视为回退/改进的变化比例（默认 0.1）')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'quick': args.quick, 'results': {}}
+    for name in args.suites:
+        print(f'运行 {name} ...', file=sys.stderr)
+        full, quick = SUITES[name]
+        report['results'][name] = run_suite(name, quick if args.quick else full)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions, improvements = compare(report, baseline, args.threshold)
+        base_commit = (baseline.get('environment') or {}).get('commit')
+        print(f"\n与基线 {base_commit or args.baseline} 对比（阈值 {args.threshold:.0%}）:", file=sys.stderr)
+        for title, rows in (('回退', regressions), ('改进', improvements)):
+            print(f'{title}: {len(rows)} 项', file=sys.stderr)
+            for key, old, new, change in sorted(rows, key=lambda r: -abs(r[3])):
+                print(f'  {key}: {old} -> {new} ({change:+.0%})', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
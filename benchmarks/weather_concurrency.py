@@ -0,0 +1,153 @@
+# 文件路径: benchmarks/weather_concurrency.py
+
+"""
+天气服务并发基准测试。
+
+用真实的 gunicorn（SERVICE_ROLE=io）分别以 sync 与 gevent worker 启动天气服务，上游指向本机的
+模拟 OpenWeatherMap（见 weather_upstream.py），再用 asyncio 客户端发起大量并发请求，
+输出吞吐、延迟分位数、错误数以及模拟服务收到的上游请求数。
+
+--cities 控制不同城市的数量：等于请求数时每个请求都未命中缓存；较小时同一城市的并发请求
+只会触发一次上游调用（其余请求等待后读缓存）。
+
+用法:
+    python benchmarks/weather_concurrency.py --requests 5000 --concurrency 1000 --cities 500 --latency-ms 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from weather_upstream import FakeOpenWeatherMap, RedirectAdapter  # noqa: E402
+
+
+def create_bench_app():
+    """gunicorn 入口：把天气服务的上游请求改写到 FAKE_OWM_URL"""
+    from app import create_app
+    from app.services import weather_service
+
+    adapter = RedirectAdapter(os.environ['FAKE_OWM_URL'])
+    weather_service.session.mount('http://', adapter)
+    weather_service.session.mount('https://', adapter)
+    return create_app()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('gunicorn 启动失败')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('等待 gunicorn 启动超时')
+
+
+async def _fetch(port, path, timeout):
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n'.encode('ascii'))
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status = int(data.split(b' ', 2)[1]) if data.startswith(b'HTTP/') else 0
+    return status, time.perf_counter() - t0
+
+
+async def _load(port, total, concurrency, cities, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            try:
+                status, elapsed = await _fetch(port, f'/api/weather/realtime/city{i % cities}', timeout)
+            except (OSError, asyncio.TimeoutError):
+                errors += 1
+                return
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies, errors, time.perf_counter() - t0
+
+
+def run_mode(worker_class, args, fake, workdir):
+    port = _free_port()
+    env = dict(os.environ, SERVICE_ROLE='io', GUNICORN_WORKER_CLASS=worker_class, FAKE_OWM_URL=fake.base_url,
+               OPENWEATHER_API_KEY='bench', METRICS_DIR=os.path.join(workdir, f'metrics-{worker_class}'),
+               WEB_CONCURRENCY=str(args.workers))
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+         'benchmarks.weather_concurrency:create_bench_app()'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(port, proc)
+        before = fake.requests
+        latencies, errors, wall = asyncio.run(_load(port, args.requests, args.concurrency, args.cities, args.timeout))
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies.sort()
+    result = {
+        'requests_per_second': round(len(latencies) / wall, 1),
+        'errors': errors,
+        'upstream_requests': fake.requests - before,
+        'wall_seconds': round(wall, 2),
+    }
+    if latencies:
+        result.update({
+            'p50_ms': round(statistics.median(latencies) * 1000, 1),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='天气服务并发基准测试（sync 与 gevent worker 对比）')
+    parser.add_argument('--requests', type=int, default=3000, help='请求总数')
+    parser.add_argument('--concurrency', type=int, default=1000, help='同时进行的请求数')
+    parser.add_argument('--cities', type=int, default=300, help='请求中不同城市的数量')
+    parser.add_argument('--latency-ms', type=float, default=100, help='模拟上游每次响应的延迟（毫秒）')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker 数')
+    parser.add_argument('--timeout', type=float, default=60, help='单个请求的超时秒数')
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gevent'], help='要对比的 worker 类型')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='weather-concurrency-')
+    fake = FakeOpenWeatherMap(args.latency_ms / 1000)
+    report = {key: getattr(args, key) for key in ('requests', 'concurrency', 'cities', 'latency_ms', 'workers')}
+    for worker_class in args.worker_classes:
+        print(f'运行 {worker_class} worker ...', file=sys.stderr)
+        report[worker_class] = run_mode(worker_class, args, fake, workdir)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
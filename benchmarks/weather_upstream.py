@@ -0,0 +1,182 @@
+# 文件路径: benchmarks/weather_upstream.py
+
+"""
+天气接口基准测试。
+
+在本机启动一个模拟 OpenWeatherMap 的 HTTP 服务（可设置每次响应的延迟），
+把 weather_service 会话中发往 *.openweathermap.org 的请求改写到该服务，
+然后用 Flask 测试客户端测量天气接口在缓存未命中、命中以及并发未命中时的耗时。
+结果同时给出模拟服务实际收到的上游请求数。
+
+用法:
+    python benchmarks/weather_upstream.py --latency-ms 80 --repeat 20 --concurrency 8
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = [
+    ('realtime', '/api/weather/realtime/{city}'),
+    ('history', '/api/weather/history/{city}?date=2024-05-01'),
+    ('trends', '/api/weather/trends/{city}'),
+]
+
+# 模拟服务按路径返回的响应体（只需结构大致相同）
+FAKE_RESPONSES = {
+    '/geo/1.0/direct': [{'name': 'Taiyuan', 'lat': 37.87, 'lon': 112.55}],
+    '/data/2.5/weather': {'main': {'temp': 21.5, 'humidity': 40}, 'weather': [{'description': '晴'}]},
+    '/data/2.5/forecast': {'list': [{'dt': 1714521600 + i * 10800, 'main': {'temp': 20 + i % 5}} for i in range(40)]},
+    '/data/2.5/air_pollution': {'list': [{'main': {'aqi': 2}, 'components': {'pm2_5': 35.1}}]},
+    '/data/2.5/history/city': {'list': [{'dt': 1714521600 + i * 3600, 'main': {'temp': 18 + i % 7}} for i in range(24)]},
+    '/data/2.5/forecast/climate': {'list': [{'dt': 1714521600 + i * 86400, 'temp': {'day': 22}} for i in range(30)]},
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # 并发测试时会同时建立上千个连接
+    request_queue_size = 1024
+
+
+class FakeOpenWeatherMap:
+    """在后台线程中运行的模拟上游服务，统计收到的请求数"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                time.sleep(fake.latency)
+                # 路径形如 /<原主机名>/<原路径>
+                path = '/' + self.path.split('?', 1)[0].split('/', 2)[2]
+                body = FAKE_RESPONSES.get(path)
+                payload = json.dumps(body if body is not None else {'message': 'not found'}).encode('utf-8')
+                self.send_response(200 if body is not None else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+
+class RedirectAdapter(requests.adapters.HTTPAdapter):
+    """把 https://<host>/<path> 改写为 <模拟服务>/<host>/<path>"""
+
+    def __init__(self, base_url):
+        super().__init__(pool_maxsize=64)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f'{self.base_url}/{parts.netloc}{parts.path}' + (f'?{parts.query}' if parts.query else '')
+        return super().send(request, **kwargs)
+
+
+def _timed_get(client, url):
+    t0 = time.perf_counter()
+    response = client.get(url)
+    elapsed = (time.perf_counter() - t0) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} 返回 {response.status_code}')
+    return elapsed
+
+
+def measure(app, fake, repeat, concurrency):
+    from app.services import weather_service
+
+    client = app.test_client()
+    results = {}
+    for name, url in ENDPOINTS:
+        before = fake.requests
+        cold = []
+        for i in range(repeat):
+            weather_service.weather_cache.clear()
+            weather_service.history_cache.clear()
+            cold.append(_timed_get(client, url.format(city=f'city{i}')))
+        upstream_per_request = (fake.requests - before) / repeat
+        warm = [_timed_get(client, url.format(city='city0')) for _ in range(repeat)]
+
+        # 多个线程同时请求不同城市（都未命中缓存）
+        weather_service.weather_cache.clear()
+        weather_service.history_cache.clear()
+        urls = [url.format(city=f'parallel{i}') for i in range(concurrency * 2)]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda u: _timed_get(app.test_client(), u), urls))
+        wall = time.perf_counter() - t0
+
+        results[name] = {
+            'cold_median_ms': round(statistics.median(cold), 2),
+            'warm_median_ms': round(statistics.median(warm), 3),
+            'upstream_calls_per_cold_request': round(upstream_per_request, 2),
+            'concurrent_requests_per_second': round(len(urls) / wall, 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='天气接口基准测试（模拟上游）')
+    parser.add_argument('--latency-ms', type=float, default=50, help='模拟上游每次响应的延迟（毫秒）')
+    parser.add_argument('--repeat', type=int, default=10, help='每种情形的请求次数（取中位数）')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发未命中测试的线程数')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='weather-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ.setdefault('OPENWEATHER_API_KEY', 'bench')
+
+    from app import create_app
+    from app.services import weather_service
+
+    fake = FakeOpenWeatherMap(args.latency_ms / 1000)
+    adapter = RedirectAdapter(fake.base_url)
+    weather_service.session.mount('http://', adapter)
+    weather_service.session.mount('https://', adapter)
+
+    # 服务内部的日志输出转到 stderr，stdout 只保留 JSON 结果
+    with contextlib.redirect_stdout(sys.stderr):
+        app = create_app()
+        results = measure(app, fake, args.repeat, args.concurrency)
+
+    report = {
+        'latency_ms': args.latency_ms,
+        'repeat': args.repeat,
+        'concurrency': args.concurrency,
+        'endpoints': results,
+        'upstream_requests_total': fake.requests,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
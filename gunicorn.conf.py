@@ -0,0 +1,63 @@
+# 文件路径: gunicorn.conf.py
+# gunicorn 启动时自动读取当前目录下的此文件（Procfile: gunicorn run:app）
+
+import os
+
+# GUNICORN_PRELOAD=true 时在主进程中创建应用再 fork worker；
+# 同时设置 HEATMAP_PRELOAD=true 可让热力图依赖与边界数据也在主进程加载，worker 通过写时复制共享
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+# worker 类型：默认 sync（热力图等 CPU 密集接口）；SERVICE_ROLE=io 的天气服务使用 gevent，
+# 每个 worker 可同时挂起上千个等待 OpenWeatherMap 响应的请求
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent" if os.getenv("SERVICE_ROLE", "").lower() == "io" else "sync")
+# gevent worker 的最大并发连接数
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "2000"))
+# gthread worker 的线程数
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# worker 数显式配置（兼容 Render/Heroku 的 WEB_CONCURRENCY）；sync worker 一次只处理一个请求，至少保留两个
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# 兜底的定期重启：每个 worker 处理这么多请求后重启（0 表示不限制），加随机抖动避免所有 worker 同时重启
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+# worker 常驻内存上限（MB）：超过后处理完当前请求即退出，由主进程重新拉起一个新的 worker
+WORKER_MAX_RSS_BYTES = int(os.getenv("WORKER_MAX_RSS_MB", "0")) * 1024 * 1024
+
+# 告诉应用实际使用的 worker 类型：sync worker 下留言统计的 SSE 与长轮询不挂起等待（见 app/config.py）。
+# 配置文件先于应用导入执行，worker 继承这里设置的环境变量
+os.environ["GUNICORN_WORKER_CLASS"] = "gthread" if worker_class == "sync" and threads > 1 else worker_class
+
+if worker_class == "gevent":
+    # 在导入 ssl/requests 之前打补丁，避免 MonkeyPatchWarning 和未打补丁的锁
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def post_fork(server, worker):
+    """preload 模式下 worker 继承了主进程的数据库连接，丢弃后各自重新建立"""
+    if preload_app:
+        from app.database import engine
+        engine.dispose(close=False)
+    if worker_class == "gevent":
+        # 让 psycopg2 等待数据库响应时让出协程，而不是阻塞整个 worker
+        from app.database import make_psycopg2_green
+        make_psycopg2_green()
+
+
+def post_request(worker, req, environ, resp):
+    """每个请求结束后检查常驻内存，超过 WORKER_MAX_RSS_MB 时让 worker 平滑退出"""
+    if not WORKER_MAX_RSS_BYTES or not worker.alive:
+        return
+    from app import metrics
+    rss = metrics.process_rss_bytes()
+    if rss <= WORKER_MAX_RSS_BYTES:
+        return
+    worker.log.warning("worker %s 常驻内存 %.0fMB 超过上限，处理完当前请求后重启", worker.pid, rss / 1024 / 1024)
+    metrics.inc('worker_recycles_total', reason='rss')
+    try:
+        # 退出前写出快照，计数并入已退出进程的累计值
+        metrics.write_snapshot()
+    except OSError as e:
+        print(f"写入指标快照失败: {e}")
+    # sync worker 在本次请求后结束循环；gevent worker 停止接受新连接，等待进行中的请求完成
+    worker.alive = False